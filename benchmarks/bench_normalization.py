@@ -0,0 +1,61 @@
+"""
+Time every normalization method for tables of increasing width and compare
+min-max normalization with the previous per column MinMaxScaler loop.
+
+    python benchmarks/bench_normalization.py [--rows 200] [--widths 100,1000,5000]
+"""
+import argparse
+from timeit import repeat
+
+import numpy as np
+import pandas as pd
+from sklearn import preprocessing
+
+from viime.normalization import NORMALIZATION_METHODS, normalize
+
+# bypass the result cache
+normalize = normalize.__wrapped__
+
+
+def generate_tables(rows: int, columns: int):
+    rng = np.random.default_rng(0)
+    index = [f'sample {i}' for i in range(rows)]
+    table = pd.DataFrame(rng.lognormal(3, 1, size=(rows, columns)), index=index,
+                         columns=[f'metabolite {i}' for i in range(columns)])
+    sample_metadata = pd.DataFrame({'weight': rng.uniform(0.1, 1, size=rows)}, index=index)
+    return table, sample_metadata
+
+
+def column_loop_minmax(table: pd.DataFrame) -> pd.DataFrame:
+    table = table.copy()
+    for column in table:
+        column_data = table[[column]].values.astype(float)
+        min_max_scalar = preprocessing.MinMaxScaler()
+        table[[column]] = min_max_scalar.fit_transform(column_data)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--widths', default='100,1000,5000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    methods = sorted(NORMALIZATION_METHODS)
+    arguments = {'reference-sample': 'sample 0', 'weight-volume': 'weight'}
+    print(f'{"columns":>8} ' + ' '.join(f'{m:>16}' for m in methods) + f' {"minmax loop":>16}')
+    for width in [int(w) for w in args.widths.split(',')]:
+        table, sample_metadata = generate_tables(args.rows, width)
+        times = []
+        for method in methods:
+            times.append(min(repeat(
+                lambda: normalize(method, table, arguments.get(method), None, sample_metadata),
+                number=1, repeat=args.repeat)))
+        times.append(min(repeat(lambda: column_loop_minmax(table),
+                                number=1, repeat=args.repeat)))
+        print(f'{width:>8} ' + ' '.join(f'{t:>15.4f}s' for t in times))
+
+
+if __name__ == '__main__':
+    main()
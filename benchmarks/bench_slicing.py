@@ -0,0 +1,62 @@
+"""
+Compare the csv round trip previously used by CSVFile.filter_table_by_types
+with the typed slicing engine for float and integer tables of increasing width.
+
+    python benchmarks/bench_slicing.py [--rows 200] [--widths 100,1000,5000]
+"""
+import argparse
+from io import BytesIO, StringIO
+from itertools import product
+from timeit import repeat
+
+import numpy as np
+import pandas as pd
+
+from viime.slicing import typed_slice
+
+
+def generate_raw_table(rows: int, columns: int, kind: str = 'float') -> pd.DataFrame:
+    """Generate a raw csv grid similar to an uploaded metabolomics table."""
+    rng = np.random.default_rng(0)
+    if kind == 'integer':
+        # e.g. peak counts, without missing values
+        data = pd.DataFrame(rng.integers(0, 100000, size=(rows, columns)))
+    else:
+        data = pd.DataFrame(rng.lognormal(3, 1, size=(rows, columns)).round(4))
+        data[data < 5] = np.nan
+    data.columns = [f'metabolite {i}' for i in range(columns)]
+    data.insert(0, 'group', rng.choice(['control', 'treated'], size=rows))
+    data.insert(0, 'id', [f'sample {i}' for i in range(rows)])
+    return pd.read_csv(StringIO(data.to_csv(index=False)), header=None, index_col=None,
+                       low_memory=False)
+
+
+def csv_round_trip(table, rows, columns):
+    return pd.read_csv(BytesIO(
+        table.iloc[rows, columns].to_csv(header=False, index=False).encode()
+    ), index_col=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--widths', default='100,1000,5000,10000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"data":>8} {"columns":>8} {"csv (s)":>10} {"typed (s)":>10} {"speedup":>8}')
+    for kind, width in product(['float', 'integer'], [int(w) for w in args.widths.split(',')]):
+        table = generate_raw_table(args.rows, width, kind)
+        rows = list(range(table.shape[0]))
+        columns = [0] + list(range(2, table.shape[1]))
+
+        csv_time = min(repeat(lambda: csv_round_trip(table, rows, columns),
+                              number=1, repeat=args.repeat))
+        typed_time = min(repeat(lambda: typed_slice(table, rows, columns),
+                                number=1, repeat=args.repeat))
+        print(f'{kind:>8} {width:>8} {csv_time:>10.4f} {typed_time:>10.4f} '
+              f'{csv_time / typed_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+add table fingerprints
+
+Revision ID: 2a9f4c6e8d15
+Revises: b5d0e8c4f617
+Create Date: 2026-10-18 17:26:53.871240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = '2a9f4c6e8d15'
+down_revision = 'b5d0e8c4f617'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('csv_file', sa.Column('fingerprint', sa.String(length=32), nullable=True))
+    op.add_column(
+        'validated_metabolite_table',
+        sa.Column('fingerprints', sqlalchemy_utils.types.json.JSONType(), nullable=True)
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('validated_metabolite_table', schema=None) as batch_op:
+        batch_op.drop_column('fingerprints')
+    with op.batch_alter_table('csv_file', schema=None) as batch_op:
+        batch_op.drop_column('fingerprint')
@@ -0,0 +1,27 @@
+"""
+add table_version to csv_file
+
+Revision ID: 3f1c9a7b2d04
+Revises: de010dc14402
+Create Date: 2026-10-18 09:12:41.208334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7b2d04'
+down_revision = 'de010dc14402'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('csv_file', sa.Column('table_version', sa.Integer(), nullable=False,
+                                        server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('csv_file', schema=None) as batch_op:
+        batch_op.drop_column('table_version')
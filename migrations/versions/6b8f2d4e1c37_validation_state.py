@@ -0,0 +1,30 @@
+"""
+persist the validation state of csv files
+
+Revision ID: 6b8f2d4e1c37
+Revises: e41c7a9b3d26
+Create Date: 2026-10-18 23:05:17.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = '6b8f2d4e1c37'
+down_revision = 'e41c7a9b3d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'csv_file',
+        sa.Column('validation_json', sqlalchemy_utils.types.json.JSONType(), nullable=True)
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('csv_file', schema=None) as batch_op:
+        batch_op.drop_column('validation_json')
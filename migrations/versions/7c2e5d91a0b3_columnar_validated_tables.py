@@ -0,0 +1,254 @@
+"""
+convert pickled validated tables to the columnar format
+
+Revision ID: 7c2e5d91a0b3
+Revises: 3f1c9a7b2d04
+Create Date: 2026-10-18 13:02:17.514093
+
+"""
+import json
+import pickle
+import struct
+from typing import Any, Dict, List
+
+from alembic import op
+import numpy
+import pandas
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e5d91a0b3'
+down_revision = '3f1c9a7b2d04'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 50
+BLOB_COLUMNS = [
+    'raw_measurements_bytes', 'measurement_metadata_bytes', 'sample_metadata_bytes', 'groups_bytes'
+]
+
+# the version 2 container format of viime.columnar, frozen for this revision
+MAGIC = b'VIIMECOL'
+VERSION = 2
+ALIGNMENT = 8
+
+_PREAMBLE = struct.Struct('<8sII')
+
+
+def _pad(size: int) -> int:
+    return (ALIGNMENT - size % ALIGNMENT) % ALIGNMENT
+
+
+def _json_label(value: Any) -> Any:
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+class _Writer:
+    def __init__(self):
+        self.buffers: List[bytes] = []
+        self.size = 0
+
+    def add(self, data: bytes) -> List[int]:
+        offset = self.size
+        self.buffers.append(data)
+        self.buffers.append(b'\0' * _pad(len(data)))
+        self.size += len(data) + _pad(len(data))
+        return [offset, len(data)]
+
+    def add_array(self, array: numpy.ndarray) -> Dict[str, Any]:
+        array = numpy.ascontiguousarray(array)
+        return {'dtype': array.dtype.str, 'buffer': self.add(array.tobytes())}
+
+    def add_strings(self, values: numpy.ndarray) -> Dict[str, Any]:
+        mask = pandas.isna(values)
+        strings = numpy.where(mask, '', values).astype(str)
+        try:
+            data = strings.astype(bytes)
+        except UnicodeEncodeError:
+            data = strings
+        spec = {'encoding': 'string', 'values': self.add_array(data), 'mask': None}
+        if mask.any():
+            spec['mask'] = self.add_array(mask)
+        return spec
+
+    def add_block(self, table: pandas.DataFrame) -> Dict[str, Any]:
+        values = numpy.ascontiguousarray(table.to_numpy().T)
+        spec = self.add_array(values)
+        spec['shape'] = list(values.shape)
+        offset, size = spec['buffer']
+        column_size = values.shape[1] * values.dtype.itemsize
+        spec['columns'] = [{
+            'encoding': 'plain',
+            'values': {'dtype': values.dtype.str, 'buffer': [offset + i * column_size, column_size]}
+        } for i in range(values.shape[0])]
+        return spec
+
+    def add_column(self, values) -> Dict[str, Any]:
+        values = numpy.asarray(values)
+        if values.dtype.kind in 'biufmM':
+            return {'encoding': 'plain', 'values': self.add_array(values)}
+        if values.dtype.kind in 'SU':
+            values = values.astype(object)
+        if values.dtype.kind != 'O':
+            raise TypeError(f'Unsupported column type {values.dtype}')
+
+        if not all(isinstance(v, str) for v in values[~pandas.isna(values)]):
+            data = json.dumps([None if v is None or v != v else _json_label(v) for v in values])
+            return {'encoding': 'json', 'values': self.add(data.encode())}
+
+        codes, uniques = pandas.factorize(values)
+        if len(uniques) * 2 > len(values):
+            return self.add_strings(values)
+        return {
+            'encoding': 'dictionary',
+            'codes': self.add_array(codes.astype(numpy.int32)),
+            'dictionary': self.add_strings(numpy.asarray(uniques, dtype=object))
+        }
+
+    def add_index(self, index: pandas.Index) -> Dict[str, Any]:
+        spec: Dict[str, Any] = {'name': _json_label(index.name)}
+        if isinstance(index, pandas.RangeIndex):
+            spec.update(kind='range', start=index.start, stop=index.stop, step=index.step)
+        else:
+            spec.update(kind='values', values=self.add_column(index))
+        return spec
+
+
+def _dumps(table: pandas.DataFrame) -> bytes:
+    writer = _Writer()
+    header: Dict[str, Any] = {
+        'version': VERSION,
+        'shape': list(table.shape),
+        'index': writer.add_index(table.index),
+        'columns': writer.add_index(table.columns),
+        'block': None
+    }
+    dtypes = set(table.dtypes)
+    if len(dtypes) == 1 and next(iter(dtypes)).kind in 'biuf' and table.size > 0:
+        header['block'] = writer.add_block(table)
+        header['data'] = header['block'].pop('columns')
+    else:
+        header['data'] = [writer.add_column(table.iloc[:, i]) for i in range(table.shape[1])]
+    header_data = json.dumps(header).encode()
+    header_data += b' ' * _pad(_PREAMBLE.size + len(header_data))
+    preamble = _PREAMBLE.pack(MAGIC, VERSION, len(header_data))
+    return b''.join([preamble, header_data] + writer.buffers)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        _, version, header_size = _PREAMBLE.unpack_from(self.data)
+        if version > VERSION:
+            raise ValueError(f'Unsupported columnar table version {version}')
+        start = _PREAMBLE.size
+        self.header = json.loads(bytes(self.data[start:start + header_size]))
+        self.offset = start + header_size
+
+    def buffer(self, ref: List[int]) -> memoryview:
+        start = self.offset + ref[0]
+        return self.data[start:start + ref[1]]
+
+    def array(self, spec: Dict[str, Any]) -> numpy.ndarray:
+        return numpy.frombuffer(self.buffer(spec['buffer']), dtype=numpy.dtype(spec['dtype']))
+
+    def strings(self, spec: Dict[str, Any]) -> numpy.ndarray:
+        values = self.array(spec['values'])
+        if values.dtype.kind == 'S':
+            values = values.astype(str)
+        values = values.astype(object)
+        if spec['mask'] is not None:
+            values[self.array(spec['mask'])] = numpy.nan
+        return values
+
+    def column(self, spec: Dict[str, Any]) -> numpy.ndarray:
+        encoding = spec['encoding']
+        if encoding == 'plain':
+            return self.array(spec['values']).copy()
+        if encoding == 'string':
+            return self.strings(spec)
+        if encoding == 'dictionary':
+            codes = self.array(spec['codes'])
+            dictionary = numpy.append(self.strings(spec['dictionary']), numpy.nan)
+            return dictionary[codes]
+        if encoding == 'json':
+            values = json.loads(bytes(self.buffer(spec['values'])))
+            return numpy.array([numpy.nan if v is None else v for v in values], dtype=object)
+        raise ValueError(f'Unknown column encoding {encoding}')
+
+    def index(self, spec: Dict[str, Any]) -> pandas.Index:
+        if spec['kind'] == 'range':
+            return pandas.RangeIndex(spec['start'], spec['stop'], spec['step'], name=spec['name'])
+        return pandas.Index(self.column(spec['values']), name=spec['name'])
+
+    def table(self) -> pandas.DataFrame:
+        index = self.index(self.header['index'])
+        labels = self.index(self.header['columns'])
+        specs = self.header['data']
+        table = pandas.DataFrame({i: self.column(spec) for i, spec in enumerate(specs)},
+                                 index=index)
+        table.columns = labels
+        return table
+
+
+def _is_columnar(blob: bytes) -> bool:
+    return bytes(blob[:len(MAGIC)]) == MAGIC
+
+
+validated_table = sa.table(
+    'validated_metabolite_table',
+    sa.column('id', sa.CHAR(32)),
+    *[sa.column(name, sa.LargeBinary) for name in BLOB_COLUMNS]
+)
+
+
+def _convert_rows(convert):
+    """Convert all table blobs in batches ordered by primary key."""
+    connection = op.get_bind()
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            sa.select(validated_table)
+            .where(validated_table.c.id > last_id)
+            .order_by(validated_table.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            values = {}
+            for name in BLOB_COLUMNS:
+                blob = convert(row._mapping[name])
+                if blob is not None:
+                    values[name] = blob
+            if values:
+                connection.execute(
+                    validated_table.update()
+                    .where(validated_table.c.id == row.id)
+                    .values(**values)
+                )
+        last_id = rows[-1].id
+
+
+def _to_columnar(blob):
+    if blob is None or _is_columnar(blob):
+        return None
+    return _dumps(pickle.loads(blob))
+
+
+def _to_pickle(blob):
+    if blob is None or not _is_columnar(blob):
+        return None
+    return pickle.dumps(_Reader(blob).table())
+
+
+def upgrade():
+    _convert_rows(_to_columnar)
+
+
+def downgrade():
+    _convert_rows(_to_pickle)
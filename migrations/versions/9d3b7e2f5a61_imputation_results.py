@@ -0,0 +1,38 @@
+"""
+persist imputation results
+
+Revision ID: 9d3b7e2f5a61
+Revises: 2a9f4c6e8d15
+Create Date: 2026-10-18 19:02:37.418526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3b7e2f5a61'
+down_revision = '2a9f4c6e8d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'imputation_result',
+        sa.Column('csv_file_id', sqlalchemy_utils.types.uuid.UUIDType(binary=False),
+                  nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('table_bytes', sa.LargeBinary(), nullable=False),
+        sa.Column('info', sqlalchemy_utils.types.json.JSONType(), nullable=False),
+        sa.ForeignKeyConstraint(['csv_file_id'], ['csv_file.id'],
+                                name=op.f('fk_imputation_result_csv_file_id_csv_file'),
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('csv_file_id', name=op.f('pk_imputation_result'))
+    )
+
+
+def downgrade():
+    op.drop_table('imputation_result')
@@ -0,0 +1,34 @@
+"""
+store validated table blobs by digest
+
+Revision ID: b5d0e8c4f617
+Revises: 7c2e5d91a0b3
+Create Date: 2026-10-18 15:41:08.092716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d0e8c4f617'
+down_revision = '7c2e5d91a0b3'
+branch_labels = None
+depends_on = None
+
+TABLE_BLOBS = ['raw_measurements', 'measurement_metadata', 'sample_metadata', 'groups']
+
+
+def upgrade():
+    with op.batch_alter_table('validated_metabolite_table', schema=None) as batch_op:
+        for name in TABLE_BLOBS:
+            batch_op.add_column(sa.Column(f'{name}_digest', sa.String(length=64), nullable=True))
+            batch_op.alter_column(f'{name}_bytes', existing_type=sa.LargeBinary(), nullable=True)
+
+
+def downgrade():
+    # blobs in the file store have to be moved back into the database first
+    with op.batch_alter_table('validated_metabolite_table', schema=None) as batch_op:
+        for name in TABLE_BLOBS:
+            batch_op.alter_column(f'{name}_bytes', existing_type=sa.LargeBinary(), nullable=False)
+            batch_op.drop_column(f'{name}_digest')
@@ -0,0 +1,55 @@
+"""
+queue analysis jobs
+
+Revision ID: e41c7a9b3d26
+Revises: 9d3b7e2f5a61
+Create Date: 2026-10-18 21:14:52.630184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41c7a9b3d26'
+down_revision = '9d3b7e2f5a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'job',
+        sa.Column('id', sqlalchemy_utils.types.uuid.UUIDType(binary=False), nullable=False),
+        sa.Column('csv_file_id', sqlalchemy_utils.types.uuid.UUIDType(binary=False),
+                  nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('endpoint', sa.String(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('query_string', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('started', sa.DateTime(), nullable=True),
+        sa.Column('finished', sa.DateTime(), nullable=True),
+        sa.Column('worker', sa.String(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('result_status', sa.Integer(), nullable=True),
+        sa.Column('result_mimetype', sa.String(), nullable=True),
+        sa.Column('result_bytes', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['csv_file_id'], ['csv_file.id'],
+                                name=op.f('fk_job_csv_file_id_csv_file'), ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_job'))
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_csv_file_id'), ['csv_file_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_job_key'), ['key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_job_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_status'))
+        batch_op.drop_index(batch_op.f('ix_job_key'))
+        batch_op.drop_index(batch_op.f('ix_job_csv_file_id'))
+    op.drop_table('job')
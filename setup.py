@@ -30,14 +30,14 @@ setup(
     include_package_data=True,
     install_requires=[
         'alembic',
-        'dogpile.cache',
+        'dogpile.cache>=1.1',
         'flask',
         'flask-cors',
         'flask-migrate',
         'flask-sqlalchemy',
         'marshmallow>=3.0.0',
         'matplotlib',
-        'pandas>=0.25.0',
+        'pandas>=1.0.0',
         'python-dotenv',
         'requests',
         'scikit-learn',
@@ -47,8 +47,10 @@ setup(
         'openpyxl'
     ],
     extras_require={
+        'feather': ['pyarrow'],
         'memcached': ['pylibmc'],
-        'sentry': ['sentry-sdk[flask]>=0.13']
+        'sentry': ['sentry-sdk[flask]>=0.13'],
+        'xxhash': ['xxhash']
     },
     license='Apache Software License 2.0',
     data_files=data_files,
@@ -57,7 +59,8 @@ setup(
             'viime-cli=viime.cli:cli'
         ],
         'dogpile.cache': [
-            'flask_request_local = viime.cache:FlaskRequestLocalBackend'
+            'flask_request_local = viime.cache:FlaskRequestLocalBackend',
+            'viime.tiered = viime.cache:TieredBackend'
         ]
     }
 )
@@ -0,0 +1,55 @@
+from pandas.testing import assert_frame_equal
+import pytest
+
+from viime import blob_store, columnar
+from viime.models import CSVFileSchema, db, ValidatedMetaboliteTable
+
+
+@pytest.fixture
+def file_storage(app):
+    app.config['TABLE_BLOB_STORAGE'] = 'files'
+    yield app
+
+
+def test_put_and_get(client, file_storage):
+    digest = blob_store.put(b'table data')
+    assert blob_store.put(b'table data') == digest
+    assert blob_store.get(digest)[:] == b'table data'
+    assert list(blob_store.iter_digests()) == [digest]
+
+
+def test_invalid_digest(client, file_storage):
+    with pytest.raises(ValueError):
+        blob_store.blob_path('../../etc/passwd')
+
+
+def test_validated_table_in_file_store(client, file_storage, csv_file):
+    validated = ValidatedMetaboliteTable.create_from_csv_file(csv_file)
+    db.session.add(validated)
+    db.session.commit()
+
+    assert validated.raw_measurements_bytes is None
+    assert blob_store.blob_path(validated.raw_measurements_digest).is_file()
+    assert_frame_equal(validated.raw_measurements, csv_file.measurement_table)
+    assert_frame_equal(validated.groups, csv_file.groups)
+
+    # identical tables are only stored once
+    csv_file_copy = CSVFileSchema().load({
+        'table': csv_file.uri.read_text(),
+        'name': 'copy.csv'
+    })
+    db.session.add(csv_file_copy)
+    db.session.flush()
+    validated_copy = ValidatedMetaboliteTable.create_from_csv_file(csv_file_copy)
+    assert validated_copy.raw_measurements_digest == validated.raw_measurements_digest
+
+
+def test_collect_garbage(client, file_storage, validated_csv_file):
+    unreferenced = blob_store.put(columnar.dumps(validated_csv_file.groups.iloc[:1]))
+    referenced = ValidatedMetaboliteTable.referenced_digests()
+    assert len(referenced) > 0
+    assert unreferenced not in referenced
+
+    assert blob_store.collect_garbage(referenced) == []
+    assert blob_store.collect_garbage(referenced, min_age=0) == [unreferenced]
+    assert set(blob_store.iter_digests()) == referenced
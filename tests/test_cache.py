@@ -0,0 +1,240 @@
+import multiprocessing
+import threading
+import time
+
+from dogpile.cache.api import NO_VALUE
+from flask import url_for
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from viime import cache
+from viime.analyses import pairwise_correlation
+from viime.cache import cached, configure_cache, get_fingerprint, hash_argument, region, \
+    tag_fingerprint, TieredBackend
+from viime.models import CSVFile, db, ValidatedMetaboliteTable
+from viime.scaling import scale
+
+
+def test_hash_argument_includes_labels():
+    table = pd.DataFrame({'a': [1.0, 2.0], 'b': [3.0, 4.0]})
+    assert hash_argument(table) == hash_argument(table.copy())
+    assert hash_argument(table) != hash_argument(table.rename(columns={'a': 'c'}))
+    assert hash_argument(table) != hash_argument(table.astype(int))
+    assert hash_argument(table['a']) != hash_argument(table['a'].rename('c'))
+
+
+def test_lru_budget():
+    backend = TieredBackend({'max_bytes': 10})
+    backend.set_serialized('a', b'12345')
+    backend.set_serialized('b', b'12345')
+    assert backend.get_serialized('a') == b'12345'
+
+    # 'b' is the least recently used entry
+    backend.set_serialized('c', b'12345')
+    assert backend.get_serialized('b') is NO_VALUE
+    assert backend.get_serialized('c') == b'12345'
+
+    backend.set_serialized('d', b'12345678901')
+    assert backend.get_serialized('d') is NO_VALUE
+
+    stats = backend.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['evictions'] == 1
+    assert stats['oversized'] == 1
+    assert stats['bytes'] == 10
+
+
+def test_disk_tier(tmp_path):
+    backend1 = TieredBackend({'directory': tmp_path, 'disk_max_bytes': 10})
+    backend2 = TieredBackend({'directory': tmp_path, 'disk_max_bytes': 10})
+    backend1.set_serialized('a', b'12345')
+    assert backend2.get_serialized('a') == b'12345'
+    assert backend2.stats()['disk_hits'] == 1
+
+    backend1.set_serialized('b', b'12345')
+    backend1.set_serialized('c', b'12345')
+    backend1.prune_disk()
+    assert backend1.stats()['disk_evictions'] == 1
+    assert len(list(tmp_path.iterdir())) == 2
+
+    backend1.delete('c')
+    assert TieredBackend({'directory': tmp_path}).get_serialized('c') is NO_VALUE
+
+
+def test_cached_function(client):
+    table = pd.DataFrame({'a': [1.0, 2.0, 4.0], 'b': [3.0, 1.0, 0.0], 'c': [1.0, 2.0, 3.5]})
+    result = pairwise_correlation(table, 0.1, 'pearson')
+    result['columns'].append('modified')
+
+    stats = region.backend.stats()
+    assert pairwise_correlation(table, 0.1, 'pearson')['columns'] == ['a', 'b', 'c']
+    assert region.backend.stats()['hits'] == stats['hits'] + 1
+
+    pairwise_correlation(table.rename(columns={'a': 'x'}), 0.1, 'pearson')
+    assert region.backend.stats()['misses'] > stats['misses']
+
+    resp = client.get(url_for('get_cache_stats'))
+    assert resp.status_code == 200
+    assert resp.json['hits'] == stats['hits'] + 1
+
+
+def test_fingerprint_short_circuit(monkeypatch):
+    table = tag_fingerprint(pd.DataFrame({'a': [1.0, 2.0]}), 'abc')
+    copy = table.copy()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('tagged tables must not be hashed')
+
+    monkeypatch.setattr(cache, 'hash_pandas_object', fail)
+    assert hash_argument(table) == 'abc'
+    monkeypatch.undo()
+
+    # copies are hashed again
+    assert get_fingerprint(copy) is None
+    assert hash_argument(copy) != 'abc'
+
+
+def test_fingerprint_of_freed_table():
+    for _ in range(200):
+        table = tag_fingerprint(pd.DataFrame({'a': [1.0, 2.0]}), 'abc')
+        copy = table.copy()
+        del table
+        # the copy of a copy may reuse the address of the freed tagged table
+        copy = copy.copy()
+        copy.iloc[0, 0] = 5.0
+        assert get_fingerprint(copy) is None
+        assert get_fingerprint(copy * 2) is None
+
+
+def test_cached_results_are_tagged(client):
+    table = pd.DataFrame({'a': [1.0, 2.0, 4.0], 'b': [3.0, 1.0, 0.0]})
+    scaled = scale('auto', table)
+    assert get_fingerprint(scaled) is not None
+    assert get_fingerprint(scale('auto', table)) == get_fingerprint(scaled)
+    assert get_fingerprint(scale('pareto', table)) != get_fingerprint(scaled)
+
+
+def test_validated_table_fingerprints(client, validated_csv_file):
+    validated = ValidatedMetaboliteTable.query.filter_by(
+        csv_file_id=validated_csv_file.id).first()
+    assert set(validated.fingerprints) == {
+        'raw_measurements', 'measurement_metadata', 'sample_metadata', 'groups'}
+    raw = validated.raw_measurements
+    assert get_fingerprint(raw) == validated.fingerprints['raw_measurements']
+    assert get_fingerprint(validated.measurements) is not None
+
+    csv_file = CSVFile.query.get(validated_csv_file.id)
+    assert csv_file.fingerprint is not None
+    assert get_fingerprint(csv_file.raw_measurement_table) is not None
+    assert get_fingerprint(csv_file.groups) is not None
+
+
+def test_staged_measurements(client, validated_csv_file, monkeypatch):
+    validated = ValidatedMetaboliteTable.query.filter_by(
+        csv_file_id=validated_csv_file.id).first()
+    validated.measurements
+
+    loaded = []
+    load_table = ValidatedMetaboliteTable.load_table
+
+    def counting_load_table(self, name, *args, **kwargs):
+        loaded.append(name)
+        return load_table(self, name, *args, **kwargs)
+
+    monkeypatch.setattr(ValidatedMetaboliteTable, 'load_table', counting_load_table)
+
+    # fully cached, none of the tables are loaded
+    measurements = validated.measurements
+    assert loaded == []
+
+    # only the scaling is recomputed from the cached transformation
+    validated.scaling = 'pareto'
+    assert not validated.measurements.equals(measurements)
+    assert loaded == []
+
+    validated.normalization = 'sum'
+    validated.measurements
+    assert 'raw_measurements' in loaded
+
+
+def test_cached_analysis_reads_no_blobs(client, validated_csv_file):
+    url = url_for('csv.get_correlation', csv_id=validated_csv_file.id)
+    expected = client.get(url).json
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        db.session.expunge_all()
+        assert client.get(url).json == expected
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    # the measurements are cached, so their blobs are never selected
+    assert statements
+    assert not [s for s in statements if '_bytes' in s]
+
+
+def test_key_mutex(tmp_path):
+    mutex1 = TieredBackend({'directory': tmp_path}).get_mutex('a')
+    mutex2 = TieredBackend({'directory': tmp_path}).get_mutex('a')
+    assert mutex1.acquire()
+    # the lock file is held against other processes
+    assert not mutex2.acquire(False)
+    assert TieredBackend({'directory': tmp_path}).get_mutex('b').acquire(False)
+    mutex1.release()
+    assert mutex2.acquire(False)
+    mutex2.release()
+
+
+@pytest.fixture
+def shared_cache(tmp_path):
+    configure_cache({'CACHE_DIR': str(tmp_path / 'cache')})
+    yield tmp_path
+    configure_cache({})
+
+
+@cached
+def slow_sum(table: pd.DataFrame, log: str) -> float:
+    with open(log, 'a') as f:
+        f.write('computed\n')
+    time.sleep(0.3)
+    return float(table.to_numpy().sum())
+
+
+def test_coalesced_threads(shared_cache):
+    table = pd.DataFrame({'a': [1.0, 2.0]})
+    log = str(shared_cache / 'log')
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(slow_sum(table, log))) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [3.0] * 4
+    assert open(log).read() == 'computed\n'
+    assert region.backend.stats()['lock_waits'] >= 1
+
+
+def test_coalesced_processes(shared_cache):
+    table = pd.DataFrame({'a': [1.0, 2.0]})
+    log = str(shared_cache / 'log')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=slow_sum, args=(table, log)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * 3
+    assert open(log).read() == 'computed\n'
+    # the result is read from the disk tier
+    assert slow_sum(table, log) == 3.0
+    assert open(log).read() == 'computed\n'
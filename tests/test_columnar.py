@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pickle
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+
+from viime import columnar
+
+data_dir = Path(__file__).parent
+
+
+@pytest.mark.parametrize('path', [
+    'pathological.csv', 'roc.csv', 'plsda/plsda1.csv', 'metaboanalyst/viime.csv'
+])
+def test_round_trip_raw_table(path):
+    table = pd.read_csv(data_dir / path, index_col=None, header=None)
+    assert_frame_equal(columnar.loads(columnar.dumps(table)), table)
+
+
+def test_round_trip_typed_table():
+    table = pd.DataFrame({
+        'float': [0.5, np.nan, 2.0],
+        'int': [1, 2, 3],
+        'bool': [True, False, True],
+        'repeated': ['a', 'a', np.nan],
+        'unicode': ['ü', 'b', 'c'],
+        'mixed': [1, 'x', np.nan]
+    }, index=pd.Index(['r1', 'r2', 'r3'], name='id'))
+    assert_frame_equal(columnar.loads(columnar.dumps(table)), table)
+
+
+def test_read_file(tmp_path):
+    table = pd.DataFrame(np.random.rand(5, 4), columns=list('abcd'))
+    path = tmp_path / 'table.columnar'
+    columnar.write(path, table)
+    assert_frame_equal(columnar.read(path), table)
+
+    reader = columnar.reader(path)
+    assert_frame_equal(reader.table(['b']), table[['b']])
+    assert_frame_equal(reader.table(['d', 'a']), table[['d', 'a']])
+
+
+def test_invalid_data():
+    with pytest.raises(ValueError):
+        columnar.loads(b'id,a,b\nx,1,2\n')
+
+
+def test_homogeneous_table_is_not_copied():
+    table = pd.DataFrame(np.random.rand(6, 3), columns=['x', 'y', 'z'],
+                         index=pd.Index([f's{i}' for i in range(6)], name='id'))
+    data = columnar.dumps(table)
+    loaded = columnar.loads(data)
+    assert_frame_equal(loaded, table)
+    assert np.shares_memory(loaded.to_numpy(), np.frombuffer(data, dtype=np.uint8))
+
+
+@pytest.mark.parametrize('table', [
+    pd.DataFrame(np.random.rand(4, 3), columns=['x', 'y', 'z']),
+    pd.DataFrame({'x': [1.0, 2.0], 'y': ['a', 'b'], 'z': [1, 2]})
+])
+def test_read_columns(table):
+    data = columnar.dumps(table)
+    assert_frame_equal(columnar.loads(data, ['z', 'x']), table.loc[:, ['z', 'x']])
+    with pytest.raises(KeyError):
+        columnar.loads(data, ['w'])
+
+
+def test_is_columnar():
+    table = pd.DataFrame({'x': [1.0]})
+    assert columnar.is_columnar(columnar.dumps(table))
+    assert not columnar.is_columnar(pickle.dumps(table))
+
+
+def test_concurrent_writes(tmp_path):
+    path = tmp_path / 'table.columnar'
+    tables = [pd.DataFrame({'x': np.arange(100000) * i}) for i in range(4)]
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda table: columnar.write(path, table), tables * 3))
+
+    # the file is one of the complete tables and no temporary files are left
+    result = columnar.read(path)
+    assert any(result.equals(table) for table in tables)
+    assert list(tmp_path.iterdir()) == [path]
@@ -1,9 +1,15 @@
 from io import StringIO
+import pickle
 
+import numpy as np
 import pandas as pd
+from pandas.testing import assert_frame_equal
 import pytest
+from sqlalchemy import inspect
 
-from viime.models import _guess_table_structure, CSVFileSchema, db
+from viime import columnar, models
+from viime.models import _guess_table_structure, CSVFile, CSVFileSchema, db, \
+    ImputationResult, TABLE_COLUMN_TYPES, ValidatedMetaboliteTable
 
 csv_file_schema = CSVFileSchema()
 
@@ -141,6 +147,113 @@ h1,h2,h3,h4
         assert table.applymap(lambda s: isinstance(s, (float, int))).all().all()
 
 
+def test_table_memo(app, monkeypatch):
+    with app.test_request_context():
+        csv = generate_csv_file("""
+id,g,c1,c2
+r1,a,1,2
+r2,b,3,4
+""")
+        csv_id = csv.id
+        db.session.expunge_all()
+        csv = CSVFile.query.get(csv_id)
+
+        reads = []
+        read = columnar.read
+
+        def counting_read(path):
+            reads.append(path)
+            return read(path)
+
+        monkeypatch.setattr(columnar, 'read', counting_read)
+        csv.raw_measurement_table['c1'] = 0
+        assert list(csv.raw_measurement_table['c1']) == [1, 3]
+        csv.measurement_table
+        csv.groups
+        csv.table_validation
+        assert len(reads) == 1
+
+        # changing column types without bumping the version must not return stale slices
+        csv.columns[3]['column_type'] = TABLE_COLUMN_TYPES.MASK
+        assert list(csv.raw_measurement_table) == ['c1']
+
+        version = csv.table_version
+        table = pd.DataFrame([['id', 'g', 'c1', 'c2'], ['r1', 'a', 5, 6], ['r2', 'b', 7, 8]])
+        csv.save_table(table, index=False, header=False)
+        assert csv.table_version == version + 1
+        assert list(csv.raw_measurement_table['c1']) == [5, 7]
+
+
+def test_persisted_imputation(app, monkeypatch):
+    with app.test_request_context():
+        csv = generate_csv_file("""
+id,g,c1,c2,c3
+r1,a,1,,5
+r2,b,3,4,6
+r3,b,5,6,7
+""")
+        csv_id = csv.id
+        imputed = []
+
+        def impute_missing(table, groups, **kwargs):
+            imputed.append(kwargs)
+            return table.fillna(0), dict(mnar=['c2'], mcar=[])
+
+        monkeypatch.setattr(models, 'impute_missing', impute_missing)
+        table, info = csv.measurement_table_and_info
+        assert len(imputed) == 1
+        assert ImputationResult.query.get(csv_id).info == info
+
+        # reopening the file does not impute again
+        db.session.commit()
+        db.session.expunge_all()
+        csv = CSVFile.query.get(csv_id)
+        stored_table, stored_info = csv.measurement_table_and_info
+        assert len(imputed) == 1
+        assert_frame_equal(stored_table, table)
+        assert stored_info == info
+
+        # changing the imputation options or the column types imputes again
+        csv.imputation_mcar = 'mean'
+        csv.measurement_table
+        assert imputed[-1] == {'mnar': 'zero', 'mcar': 'mean'}
+        csv.columns[4]['column_type'] = TABLE_COLUMN_TYPES.MASK
+        assert list(csv.measurement_table) == ['c1', 'c2']
+        assert len(imputed) == 3
+        assert ImputationResult.query.count() == 1
+
+
+def test_validated_table_blobs(app):
+    with app.test_request_context():
+        csv = generate_csv_file("""
+id,g,c1,c2
+r1,a,1,2
+r2,b,3,4
+""")
+        validated = ValidatedMetaboliteTable.create_from_csv_file(csv)
+        assert columnar.is_columnar(validated.raw_measurements_bytes)
+        assert_frame_equal(validated.raw_measurements, csv.measurement_table)
+        assert_frame_equal(validated.groups, csv.groups)
+        assert list(validated.deserialize_table(validated.raw_measurements_bytes, ['c2'])) == ['c2']
+
+        db.session.add(validated)
+        db.session.commit()
+        csv_id, validated_id = csv.id, validated.id
+        db.session.expunge_all()
+        csv = CSVFile.query.get(csv_id)
+        validated = ValidatedMetaboliteTable.query_tables('groups').get(validated_id)
+        state = inspect(validated)
+        assert 'groups_bytes' not in state.unloaded
+        assert 'raw_measurements_bytes' in state.unloaded
+        assert_frame_equal(validated.raw_measurements, csv.measurement_table)
+        with pytest.raises(ValueError):
+            ValidatedMetaboliteTable.query_tables('unknown')
+
+        # tables stored before the columnar format are still readable
+        validated.groups_bytes = pickle.dumps(csv.groups)
+        assert_frame_equal(validated.groups, csv.groups)
+
+
 GUESS_TABLE_DATA = [(
     """
 h1,h2,h3,h4,h5
@@ -204,3 +317,41 @@ def test_guess_table_structure(table_data, rows, columns):
     r, c = _guess_table_structure(table)
     assert rows == r[1:]
     assert columns == c[1:]
+
+
+def test_guess_table_structure_variance():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(30, 20)).round(1).astype(object)
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[rng.random(values.shape) < 0.05] = 'x'
+    values[3] = 0.1  # constant rows and columns with rounding errors in the mean
+    values[:, 4] = 0.7
+    values[5, 1:] = np.nan
+    values[:, 6] = 'label'
+    table = pd.DataFrame(values)
+
+    # the variance of a slice as computed by pandas
+    def variance(cells):
+        return pd.to_numeric(cells, errors='coerce').var()
+
+    rows, columns = _guess_table_structure(table)
+    expected_rows = [variance(table.iloc[i, 1:]) for i in range(1, table.shape[0])]
+    expected_columns = [variance(table.iloc[1:, i]) for i in range(1, table.shape[1])]
+    assert rows[1:] == ['masked' if v != v or v == 0 else 'sample' for v in expected_rows]
+    assert columns[6] == 'group'
+    assert columns[1:] == [
+        'group' if i == 5 else 'masked' if v != v or v == 0 else 'measurement'
+        for i, v in enumerate(expected_columns)
+    ]
+
+
+def test_guess_table_structure_sample():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(200, 300)).astype(object)
+    values[:, 0] = 'group'
+    values[:, 10] = 1.0
+    values[7] = np.nan
+    table = pd.DataFrame(values)
+    expected = _guess_table_structure(table)
+    assert _guess_table_structure(table, sample_size=50) == expected
+    assert _guess_table_structure(table, sample_size=1000) == expected
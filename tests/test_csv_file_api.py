@@ -1,8 +1,11 @@
 from io import BytesIO
 
 from flask import url_for
+from sqlalchemy import event
 
-from viime.models import CSVFile, CSVFileSchema, db, ValidatedMetaboliteTable
+from viime import imputation, models
+from viime.app import create_app
+from viime.models import CSVFile, CSVFileSchema, db, ImputationResult, ValidatedMetaboliteTable
 
 csv_data = """
 id,col1,col2
@@ -25,6 +28,9 @@ def test_upload_csv_file(client):
     assert len(resp.json['columns']) == 3
     assert resp.json['meta'] == {'foo': 'bar'}
 
+    csv_file = CSVFile.query.get(resp.json['id'])
+    assert csv_file.columnar_uri.is_file()
+
 
 def test_post_csv_data(client):
     data = {
@@ -60,6 +66,60 @@ def test_get_csv_file(client, csv_file):
     assert resp.json['table'] == csv_file.table.to_csv(header=False, index=False)
 
 
+def test_get_csv_file_field_selection(client, csv_file, monkeypatch):
+    def fail(self):
+        raise AssertionError('measurement_table must not be computed')
+
+    monkeypatch.setattr(CSVFile, 'apply_transforms', fail)
+    resp = client.get(url_for('csv.get_csv_file', csv_id=csv_file.id, fields='id,name'))
+    assert resp.status_code == 200
+    assert set(resp.json) == {'id', 'name'}
+
+    resp = client.get(url_for('csv.get_csv_file', csv_id=csv_file.id,
+                              exclude='measurement_table,table'))
+    assert resp.status_code == 200
+    assert 'measurement_table' not in resp.json
+    assert 'table' not in resp.json
+    assert resp.json['name'] == csv_file.name
+
+    resp = client.put(url_for('csv.set_csv_file_metadata', csv_id=csv_file.id, fields='meta'),
+                      json={'foo': 'bar'})
+    assert resp.status_code == 200
+    assert resp.json == {'meta': {'foo': 'bar'}}
+
+    resp = client.get(url_for('csv.get_csv_file', csv_id=csv_file.id, fields='invalid'))
+    assert resp.status_code == 400
+
+
+def test_get_validated_csv_file_field_selection(client, validated_csv_file):
+    csv_id = validated_csv_file.id
+    resp = client.get(url_for('csv.get_csv_file', csv_id=csv_id))
+    assert resp.json['scaling'] is None
+    assert 'imputation_info' in resp.json
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        resp = client.get(url_for('csv.get_csv_file', csv_id=csv_id, fields='name'))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert set(resp.json) == {'name'}
+    # the validated table is not queried
+    assert not [s for s in statements if 'validated_metabolite_table' in s]
+
+    resp = client.get(url_for('csv.get_csv_file', csv_id=csv_id, fields='name,scaling'))
+    assert resp.json == {'name': validated_csv_file.name, 'scaling': None}
+
+    resp = client.get(url_for('csv.get_csv_file', csv_id=csv_id,
+                              exclude='imputation_info,measurement_table,table'))
+    assert 'scaling' in resp.json
+    assert 'imputation_info' not in resp.json
+
+
 def test_delete_csv_file(client, csv_file):
     resp = client.delete(
         url_for('csv.delete_csv_file', csv_id=csv_file.id)
@@ -67,6 +127,8 @@ def test_delete_csv_file(client, csv_file):
 
     assert resp.status_code == 204
     assert CSVFile.query.first() is None
+    assert not csv_file.uri.exists()
+    assert not csv_file.columnar_uri.exists()
 
 
 def test_post_csv_file_error(client):
@@ -285,3 +347,43 @@ def test_merge_files(client):
     assert resp.status_code == 200
     assert resp.json['columns'] == expected_column_types
     assert resp.json['rows'] == expected_row_types
+
+
+def test_get_csv_file_stats(client, pathological_table):
+    resp = client.get(url_for('csv.get_csv_file_stats', csv_id=pathological_table.id))
+    assert resp.status_code == 200
+    table = pathological_table.raw_measurement_table
+    assert len(resp.json['columns']['variance']) == table.shape[1]
+    assert len(resp.json['rows']['missing']) == table.shape[0]
+    for name in ['missing', 'variance', 'mean', 'min', 'max']:
+        assert name in resp.json['rows']
+
+
+def test_imputation_result_file_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'impute_missing', imputation.impute_missing)
+    app = create_app({
+        'ENV': 'testing',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "viime.db"}',
+        'UPLOAD_FOLDER': str(tmp_path),
+        'IMPUTATION_ENGINE': 'local'
+    })
+    with app.app_context():
+        db.create_all()
+
+    with app.test_request_context(), app.test_client() as client:
+        resp = client.post(url_for('csv.create_csv_file'), json={
+            'name': 'missing.csv',
+            'table': 'id,g,c1,c2\nr1,a,1,\nr2,a,3,4\nr3,b,5,6\nr4,b,,8\n'
+        })
+        assert resp.status_code == 201
+        csv_id = resp.json['id']
+        assert ImputationResult.query.count() == 1
+
+        assert client.get(url_for('csv.get_csv_file', csv_id=csv_id)).status_code == 200
+        resp = client.post(url_for('csv.save_validated_csv_file', csv_id=csv_id))
+        assert resp.status_code == 201
+        assert ImputationResult.query.count() == 1
+
+        resp = client.delete(url_for('csv.delete_csv_file', csv_id=csv_id))
+        assert resp.status_code == 204
+        assert ImputationResult.query.count() == 0
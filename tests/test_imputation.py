@@ -0,0 +1,199 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+import requests
+
+from viime import imputation
+from viime.imputation import impute_missing
+
+samples_path = Path(__file__).parent.parent / 'samples' / 'data'
+
+
+@pytest.fixture
+def groups():
+    yield pd.DataFrame({'group': ['a'] * 4 + ['b'] * 4}, index=[f's{i}' for i in range(8)])
+
+
+@pytest.fixture
+def table(groups):
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame(rng.uniform(1, 10, (8, 12)), index=groups.index,
+                         columns=[f'm{i}' for i in range(12)])
+    table.iloc[0:3, 0] = np.nan  # mnar: 75% of group a
+    table.iloc[5, 1] = np.nan  # mcar: 25% of group b
+    table.iloc[0:2, 2] = np.nan  # mar: 50% of group a
+    yield table
+
+
+@pytest.fixture
+def no_opencpu(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('OpenCPU should not be called')
+
+    monkeypatch.setattr(imputation, 'opencpu_request', fail)
+
+
+def test_classify_missing(table, groups):
+    mnar, mcar = imputation.classify_missing(table.to_numpy(), groups, 0.7, 0.4)
+    assert list(np.nonzero(mnar)[0]) == [0]
+    assert not mcar[0] and mcar[1] and not mcar[2] and mcar[3]
+
+
+def test_no_missing_values(client, table, groups, no_opencpu):
+    table = table.fillna(1)
+    output, info = impute_missing(table, groups)
+    assert_frame_equal(output, table)
+    assert info == {'mcar': [], 'mnar': []}
+
+
+@pytest.mark.parametrize('mnar', ['zero', 'half-minimum'])
+@pytest.mark.parametrize('mcar', ['mean', 'median', 'knn'])
+def test_impute_local(client, table, groups, no_opencpu, mnar, mcar):
+    output, info = impute_missing(table, groups, mnar=mnar, mcar=mcar)
+    assert info == {'mcar': ['m1', 'm2'], 'mnar': ['m0']}
+    assert not output.isna().any().any()
+    assert_frame_equal(output[table.notna()], table)
+
+    expected = 0 if mnar == 'zero' else table['m0'].min() / 2
+    assert (output.iloc[0:3, 0] == expected).all()
+    if mcar == 'mean':
+        assert output.iloc[5, 1] == table['m1'].mean()
+    elif mcar == 'median':
+        assert output.iloc[5, 1] == table['m1'].median()
+
+
+def test_impute_knn():
+    values = np.array([
+        [1.0, 2.0, 3.0, 4.0],
+        [1.1, 2.1, 3.1, np.nan],
+        [9.0, 8.0, 7.0, 6.0],
+        [np.nan, np.nan, np.nan, 1.0]
+    ]).T
+    output = imputation.impute_knn(values, k=1)
+    # imputed from the nearest metabolite
+    assert output[3, 1] == 4.0
+    # metabolites missing most values are imputed with the sample means
+    assert np.allclose(output[:3, 3], values[:3, :3].mean(axis=1))
+
+
+def test_impute_knn_empty_sample(monkeypatch):
+    class KNNImputer(imputation.KNNImputer):
+        # scikit-learn < 1.2 has no keep_empty_features
+        def __init__(self, n_neighbors=5):
+            super().__init__(n_neighbors=n_neighbors)
+
+    monkeypatch.setattr(imputation, 'KNNImputer', KNNImputer)
+    values = np.array([
+        [np.nan, 2.0, 3.0, 4.0, np.nan],
+        [1.1, 2.1, 3.1, 4.1, np.nan],
+        [1.2, 2.2, 3.2, 4.2, np.nan],
+        [np.nan, np.nan, np.nan, np.nan, 5.0]
+    ])
+    output = imputation.impute_knn(values, k=1)
+    assert output[0, 0] == 2.0
+    # the last sample has no value in any of the metabolites imputed by knn
+    assert (output[3, :4] == 0).all()
+    assert output[3, 4] == 5.0
+    assert not np.isnan(output).any()
+
+
+def test_random_forest_uses_opencpu(client, table, groups, monkeypatch):
+    def opencpu_request(method, files, params):
+        assert method == 'imputation'
+        assert params['mcar'] == 'random-forest'
+        output = table.fillna(0)
+        output.columns = ['N-m0', 'C-m1', 'C-m2'] + [f'A-{c}' for c in table.columns[3:]]
+        return output
+
+    monkeypatch.setattr(imputation, 'opencpu_request', opencpu_request)
+    output, info = impute_missing(table, groups, mcar='random-forest')
+    assert list(output.columns) == list(table.columns)
+    assert info == {'mcar': ['m1', 'm2'], 'mnar': ['m0']}
+
+
+def test_impute_random_forest(table):
+    values = table.to_numpy()
+    output = imputation.impute_random_forest(values, trees=8, max_iterations=3)
+    assert not np.isnan(output).any()
+    assert np.array_equal(output[~np.isnan(values)], values[~np.isnan(values)])
+
+    # the result only depends on the seed
+    assert np.array_equal(
+        imputation.impute_random_forest(values, trees=8, max_iterations=3, workers=2), output)
+    assert not np.array_equal(
+        imputation.impute_random_forest(values, trees=8, max_iterations=3, seed=1), output)
+
+
+def test_impute_random_forest_known_values():
+    x = np.arange(1.0, 21.0)
+    truth = np.column_stack([x, 2 * x, x + 5, 30 - x])
+    missing = np.zeros(truth.shape, dtype=bool)
+    missing[[2, 17, 6], [0, 1, 2]] = True
+    values = np.where(missing, np.nan, truth)
+
+    output = imputation.impute_random_forest(values, seed=0)
+    # the columns are linear in each other, so the forests recover the removed
+    # values much better than the initial mean imputation
+    assert np.allclose(output[missing], truth[missing], atol=2.5)
+    assert not np.allclose(imputation.impute_mean(values)[missing], truth[missing], atol=3)
+    assert np.array_equal(imputation.impute_random_forest(values, seed=0), output)
+
+
+def test_random_forest_pool_per_imputation(table, monkeypatch):
+    pools = []
+
+    class Pool(imputation.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(imputation, 'ProcessPoolExecutor', Pool)
+    values = table.to_numpy()
+    imputation.impute_random_forest(values, trees=8, max_iterations=3)
+    assert pools == []
+
+    imputation.impute_random_forest(values, trees=8, max_iterations=3, workers=2)
+    assert len(pools) == 1
+
+
+def test_random_forest_is_local(client, table, groups, no_opencpu):
+    output, info = impute_missing(table, groups, mcar='random-forest')
+    assert info == {'mcar': ['m1', 'm2'], 'mnar': ['m0']}
+    assert not output.isna().any().any()
+
+
+@pytest.fixture
+def opencpu(app):
+    try:
+        requests.get(app.config['OPENCPU_API_ROOT'], timeout=5)
+    except requests.exceptions.RequestException:
+        pytest.skip('OpenCPU is not available')
+
+
+def test_random_forest_parity(client, opencpu):
+    """
+    Compare the local random forest imputation with missForest in R.
+
+    10% of the values of a sample data set are removed at random.  The
+    forests use different random number generators, so instead of the values
+    the accuracy is compared: the root mean squared errors of the imputed
+    values (in units of the column standard deviation) of both imputations
+    must not differ by more than 0.15.
+    """
+    table = pd.read_csv(samples_path / 'Cancer chemo liver (NMR).csv', index_col=0)
+    groups = table[['Treatment']]
+    table = table.drop(columns='Treatment')
+    missing = np.random.default_rng(0).random(table.shape) < 0.1
+    values = table.mask(missing)
+
+    def error(output):
+        return np.sqrt(np.square(((output - table) / table.std()).to_numpy()[missing]).mean())
+
+    local, local_info = imputation.impute_local(
+        values, groups, imputation.impute_zero, imputation.impute_random_forest, 0.7, 0.4)
+    r, r_info = imputation.impute_opencpu(values, groups, 'zero', 'random-forest', 0.7, 0.4)
+    assert local_info == r_info
+    assert abs(error(local) - error(r)) < 0.15
@@ -0,0 +1,105 @@
+from flask import url_for
+
+from viime import jobs, views
+from viime.models import db, Job, JOB_STATUSES, ValidatedMetaboliteTable
+
+
+def correlation_url(csv_id, **kwargs):
+    return url_for('csv.get_correlation', csv_id=csv_id, **kwargs)
+
+
+def test_async_request(client, app, validated_csv_file):
+    # the worker ends the session of this thread
+    csv_id = validated_csv_file.id
+    expected = client.get(correlation_url(csv_id)).json
+
+    resp = client.get(correlation_url(csv_id, **{'async': 1}))
+    assert resp.status_code == 202
+    job = resp.json
+    assert job['status'] == JOB_STATUSES.QUEUED
+    assert resp.headers['Location'].endswith(url_for('csv.get_job', job_id=job['id']))
+
+    # identical requests are queued once
+    resp = client.get(correlation_url(csv_id, **{'async': 'true'}))
+    assert resp.json['id'] == job['id']
+    assert client.get(job['result_url']).status_code == 202
+
+    assert jobs.work(app, once=True) == 1
+    assert client.get(url_for('csv.get_job', job_id=job['id'])).json['status'] == \
+        JOB_STATUSES.DONE
+    resp = client.get(job['result_url'])
+    assert resp.status_code == 200
+    assert resp.json == expected
+
+    # done jobs are reused
+    resp = client.get(correlation_url(csv_id, **{'async': 1}))
+    assert resp.json['id'] == job['id']
+    assert resp.json['status'] == JOB_STATUSES.DONE
+
+
+def test_job_key(client, validated_csv_file):
+    path = correlation_url(validated_csv_file.id)
+    key = jobs.job_key(validated_csv_file.id, path, 'method=pearson')
+    assert jobs.job_key(validated_csv_file.id, path, 'method=spearman') != key
+
+    validated = ValidatedMetaboliteTable.query.filter_by(
+        csv_file_id=validated_csv_file.id).first()
+    validated.scaling = 'pareto'
+    db.session.commit()
+    assert jobs.job_key(validated_csv_file.id, path, 'method=pearson') != key
+
+
+def test_failed_job(client, app, validated_csv_file, monkeypatch):
+    csv_id = validated_csv_file.id
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('analysis failed')
+
+    monkeypatch.setattr(views, 'pairwise_correlation', fail)
+    job_id = client.get(correlation_url(csv_id, **{'async': 1})).json['id']
+    jobs.work(app, once=True)
+
+    job = client.get(url_for('csv.get_job', job_id=job_id)).json
+    assert job['status'] == JOB_STATUSES.FAILED
+    assert client.get(job['result_url']).status_code == 500
+
+    # failed jobs are queued again
+    resp = client.get(correlation_url(csv_id, **{'async': 1}))
+    assert resp.json['id'] != job_id
+
+
+def test_claim(client, validated_csv_file):
+    jobs.enqueue(validated_csv_file.id, 'csv.get_correlation',
+                 correlation_url(validated_csv_file.id), '')
+    job = jobs.claim('worker1')
+    assert job.status == JOB_STATUSES.RUNNING
+    assert job.worker == 'worker1'
+    assert jobs.claim('worker2') is None
+
+    # jobs of unresponsive workers are claimed again
+    client.application.config['JOB_TIMEOUT'] = -1
+    assert jobs.claim('worker2').id == job.id
+    assert Job.query.get(job.id).worker == 'worker2'
+
+
+def test_prune(client, app, validated_csv_file):
+    csv_id = validated_csv_file.id
+    job_id = client.get(correlation_url(csv_id, **{'async': 1})).json['id']
+    assert jobs.prune(0) == 0
+
+    jobs.work(app, once=True)
+    assert jobs.prune() == 0
+    assert Job.query.get(job_id) is not None
+
+    app.config['JOB_RETENTION'] = -1
+    assert jobs.prune() == 1
+    assert Job.query.get(job_id) is None
+
+
+def test_jobs_of_deleted_csv_file(client, validated_csv_file):
+    csv_id = validated_csv_file.id
+    client.get(correlation_url(csv_id, **{'async': 1}))
+    assert Job.query.filter_by(csv_file_id=csv_id).count() == 1
+
+    assert client.delete(url_for('csv.delete_csv_file', csv_id=csv_id)).status_code == 204
+    assert Job.query.filter_by(csv_file_id=csv_id).count() == 0
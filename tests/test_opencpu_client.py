@@ -0,0 +1,236 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import threading
+import time
+
+from flask import url_for
+import numpy
+import pandas
+from pandas.testing import assert_frame_equal
+import pytest
+
+from viime.opencpu import opencpu_request, OpenCPUException
+
+csv_data = b"""id,col1,col2
+row1,0.5,2.0
+row2,1.5,0.0
+"""
+
+
+class StandInServer(ThreadingHTTPServer):
+    """A stand-in for OpenCPU failing a number of requests before responding."""
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.requests = []
+        self.paths = []
+        self.bodies = []
+        self.failures = 0
+        self.delay = 0.0
+        # session keys returned by uploads and those no longer known
+        self.sessions = []
+        self.expired = set()
+        # the response to feather requests, None if they are not supported
+        self.feather = None
+        # the error of the called R function
+        self.error = None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # noqa: N802
+        server = self.server
+        request = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        server.requests.append(self.client_address)
+        server.paths.append(self.path)
+        server.bodies.append(request)
+        headers = {}
+        missing = [key for key in server.expired if key in request]
+        if server.failures:
+            server.failures -= 1
+            status, body = 503, b'unavailable'
+        elif self.path.endswith('/read_table'):
+            headers['X-ocpu-session'] = f'x0{len(server.sessions)}'
+            server.sessions.append(headers['X-ocpu-session'])
+            status, body = 201, b'/ocpu/tmp/session/R/.val'
+        elif missing:
+            status, body = 400, f"object '{missing[0]}' not found".encode()
+        elif server.error is not None:
+            status, body = 400, server.error
+        elif self.path.endswith('/feather'):
+            if server.feather is None:
+                status, body = 400, b'invalid output format'
+            else:
+                status, body = 200, server.feather
+        else:
+            time.sleep(server.delay)
+            status, body = 200, csv_data
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def opencpu_server(app):
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config['OPENCPU_API_ROOT'] = f'http://127.0.0.1:{server.server_port}/ocpu/library'
+    app.config['OPENCPU_RETRY_BACKOFF'] = 0.01
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_keep_alive(client, opencpu_server):
+    assert list(opencpu_request('echo')['col1']) == [0.5, 1.5]
+    opencpu_request('echo')
+    # both requests use the same pooled connection
+    assert len(opencpu_server.requests) == 2
+    assert opencpu_server.requests[0] == opencpu_server.requests[1]
+
+
+def test_retry_unavailable(client, opencpu_server):
+    opencpu_server.failures = 2
+    assert list(opencpu_request('echo')['col2']) == [2.0, 0.0]
+    assert len(opencpu_server.requests) == 3
+
+    opencpu_server.failures = 10
+    with pytest.raises(OpenCPUException) as e:
+        opencpu_request('echo')
+    assert e.value.error_response.status_code == 503
+    assert len(opencpu_server.requests) == 3 + 1 + 3
+
+
+def test_read_timeout(client, app, opencpu_server):
+    app.config['OPENCPU_READ_TIMEOUT'] = 0.1
+    opencpu_server.delay = 0.5
+    with pytest.raises(OpenCPUException) as e:
+        opencpu_request('slow')
+    assert e.value.error_response.status_code == 502
+    # timed out computations are not retried
+    assert len(opencpu_server.requests) == 1
+
+
+def test_opencpu_stats(client, opencpu_server):
+    opencpu_request('stats_method')
+    resp = client.get(url_for('get_opencpu_stats'))
+    assert resp.status_code == 200
+    stats = resp.json['stats_method']
+    assert stats['requests'] == 1
+    assert stats['errors'] == 0
+    assert stats['mean_seconds'] > 0
+
+
+def called(server):
+    return [path.split('/viime/R/')[1].split('/')[0] for path in server.paths]
+
+
+def test_table_uploaded_once(client, app, opencpu_server):
+    app.config['OPENCPU_SESSION_MIN_CELLS'] = 0
+    table = pandas.DataFrame({'a': [1.0, 2.0]}, index=['r1', 'r2'])
+    # the first use sends the table along, the second one uploads it
+    opencpu_request('echo', {'table': table})
+    opencpu_request('echo', {'table': table.copy(), 'other': table})
+    opencpu_request('echo', {'table': table})
+    assert called(opencpu_server) == ['echo', 'read_table', 'echo', 'echo']
+    assert opencpu_server.sessions == ['x00']
+
+
+def test_small_table_not_uploaded(client, app, opencpu_server):
+    app.config['OPENCPU_SESSION_MIN_CELLS'] = 3
+    table = pandas.DataFrame({'a': [1.0, 2.0]}, index=['r1', 'r2'])
+    for _ in range(3):
+        opencpu_request('echo', {'table': table})
+    assert called(opencpu_server) == ['echo'] * 3
+
+    table = pandas.DataFrame({'a': [1.0, 2.0, 3.0]})
+    for _ in range(3):
+        opencpu_request('echo', {'table': table})
+    assert opencpu_server.sessions == ['x00']
+
+
+def test_expired_session(client, app, opencpu_server):
+    app.config['OPENCPU_SESSION_MIN_CELLS'] = 0
+    table = pandas.DataFrame({'a': [1.0, 2.0]}, index=['r1', 'r2'])
+    opencpu_request('echo', {'table': table})
+    opencpu_request('echo', {'table': table})
+    opencpu_server.expired.add('x00')
+    assert list(opencpu_request('echo', {'table': table})['col1']) == [0.5, 1.5]
+    # the call is repeated with the table, which is uploaded again on its next use
+    opencpu_request('echo', {'table': table})
+    assert called(opencpu_server) == [
+        'echo', 'read_table', 'echo', 'echo', 'echo', 'read_table', 'echo']
+    assert opencpu_server.sessions == ['x00', 'x01']
+
+
+def test_session_ttl(client, app, opencpu_server):
+    app.config['OPENCPU_SESSION_MIN_CELLS'] = 0
+    table = pandas.DataFrame({'a': [1.0, 2.0]}, index=['r1', 'r2'])
+    app.config['OPENCPU_SESSION_TTL'] = 0
+    for _ in range(2):
+        opencpu_request('echo', {'table': table})
+    assert opencpu_server.sessions == []
+
+    app.config['OPENCPU_SESSION_TTL'] = 0.1
+    for _ in range(2):
+        opencpu_request('echo', {'table': table})
+    time.sleep(0.2)
+    for _ in range(2):
+        opencpu_request('echo', {'table': table})
+    assert opencpu_server.sessions == ['x00', 'x01']
+
+
+def test_feather_result(client, app, opencpu_server):
+    feather = pytest.importorskip('pyarrow.feather')
+    app.config['OPENCPU_TRANSPORT'] = 'feather'
+    expected = pandas.DataFrame({
+        'x': [1 / 3, numpy.pi * 1e-300, 0.1 + 0.2],
+        'n': numpy.array([1, 2, 3], dtype='int32'),
+        'g': pandas.Categorical(['a', 'b', 'a'])
+    }, index=['r1', 'r2', 'r3'])
+    frame = expected.reset_index().rename(columns={'index': '_row'})
+    data = BytesIO()
+    feather.write_feather(frame, data)
+    opencpu_server.feather = data.getvalue()
+
+    result = opencpu_request('echo', params={'method': 'pearson'})
+    assert called(opencpu_server) == ['table_result']
+    assert '.method=%22echo%22' in opencpu_server.bodies[0]
+    assert list(result['x']) == list(expected['x'])
+    assert_frame_equal(result, expected.astype({'n': 'int64', 'g': object}), check_exact=True)
+
+
+def test_feather_result_fallback(client, app, opencpu_server):
+    pytest.importorskip('pyarrow.feather')
+    app.config['OPENCPU_TRANSPORT'] = 'feather'
+    assert list(opencpu_request('echo')['col1']) == [0.5, 1.5]
+    assert called(opencpu_server) == ['table_result', 'echo']
+
+    # the server is not asked for feather results again
+    opencpu_request('echo')
+    assert called(opencpu_server) == ['table_result', 'echo', 'echo']
+
+
+def test_feather_result_error(client, app, opencpu_server):
+    feather = pytest.importorskip('pyarrow.feather')
+    app.config['OPENCPU_TRANSPORT'] = 'feather'
+    opencpu_server.error = b'Error in echo(table) : the model failed\n'
+    with pytest.raises(OpenCPUException) as e:
+        opencpu_request('echo')
+    assert e.value.error_response.status_code == 400
+    # errors of the analysis are not repeated with csv results
+    assert called(opencpu_server) == ['table_result']
+
+    opencpu_server.error = None
+    data = BytesIO()
+    feather.write_feather(pandas.DataFrame({'_row': ['r1'], 'a': [0.1]}), data)
+    opencpu_server.feather = data.getvalue()
+    assert list(opencpu_request('echo')['a']) == [0.1]
+    assert called(opencpu_server) == ['table_result', 'table_result']
@@ -4,7 +4,8 @@ from httmock import all_requests, HTTMock
 import pandas
 import pytest
 
-from viime.opencpu import OpenCPUException, process_table
+from viime import opencpu
+from viime.opencpu import OpenCPUException, process_table, table_file
 
 csv_data = """id,col1,col2
 row1,0.5,2.0
@@ -35,3 +36,32 @@ def test_process_table_failure(app):
     table = pandas.read_csv(BytesIO(csv_data.encode()))
     with app.app_context(), HTTMock(failure), pytest.raises(OpenCPUException):
         process_table('/some/method', table)
+
+
+def test_table_file_csv(app):
+    table = pandas.read_csv(BytesIO(csv_data.encode()), index_col=0)
+    with app.app_context():
+        name, data = table_file('table', table)
+    assert name == 'table.csv'
+    assert data.decode() == csv_data
+
+
+def test_table_file_without_pyarrow(app, monkeypatch):
+    monkeypatch.setattr(opencpu, 'feather', None)
+    app.config['OPENCPU_TRANSPORT'] = 'feather'
+    table = pandas.read_csv(BytesIO(csv_data.encode()), index_col=0)
+    with app.app_context():
+        assert table_file('groups', table['col1'])[0] == 'groups.csv'
+
+
+def test_table_file_feather(app):
+    feather = pytest.importorskip('pyarrow.feather')
+    app.config['OPENCPU_TRANSPORT'] = 'feather'
+    table = pandas.read_csv(BytesIO(csv_data.encode()), index_col=0)
+    with app.app_context():
+        name, data = table_file('table', table)
+    assert name == 'table.feather'
+    frame = feather.read_feather(BytesIO(data))
+    assert list(frame.columns) == ['_row', 'col1', 'col2']
+    assert list(frame['_row']) == ['row1', 'row2']
+    assert list(frame['col2']) == [2.0, 0.0]
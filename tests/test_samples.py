@@ -5,7 +5,7 @@ from pandas.testing import assert_frame_equal
 import pytest
 
 from viime import samples
-from viime.models import CSVFile
+from viime.models import CSVFile, db, ValidatedMetaboliteTable
 
 
 samples_dir = Path(__file__).parent.parent / 'samples'
@@ -42,9 +42,17 @@ def test_sample(app, fid):
         assert csv.name == dump['name']
 
         sample_id = csv.id
+        # the validated table is loaded with deferred blobs
+        db.session.commit()
+        db.session.expunge_all()
+        csv = CSVFile.query.get(sample_id)
+        samples.dump(csv)
         icsv = samples.import_files([csv])
         assert len(icsv) == 1
         # since updated in place
         csv = CSVFile.query.get(sample_id)
         assert icsv[0].id != str(csv.id)
         assert_frame_equal(icsv[0].table, csv.table)
+        validated = ValidatedMetaboliteTable.query.filter_by(csv_file_id=icsv[0].id).first()
+        original = ValidatedMetaboliteTable.query.filter_by(csv_file_id=sample_id).first()
+        assert_frame_equal(validated.raw_measurements, original.raw_measurements)
@@ -0,0 +1,68 @@
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+
+from viime.slicing import typed_slice
+
+data_dir = Path(__file__).parent
+
+
+def csv_round_trip(table, rows, columns):
+    """The reference implementation: write the block to csv and parse it again."""
+    return pd.read_csv(BytesIO(
+        table.iloc[rows, columns].to_csv(header=False, index=False).encode()
+    ), index_col=0)
+
+
+def random_slices(table, count=20):
+    rng = np.random.default_rng(0)
+    num_rows, num_columns = table.shape
+    for _ in range(count):
+        header, key = rng.integers(0, min(num_rows, 4)), rng.integers(0, min(num_columns, 4))
+        rows = [r for r in range(num_rows) if r != header and rng.random() < 0.7]
+        columns = [c for c in range(num_columns) if c != key and rng.random() < 0.7]
+        yield [header] + rows, [key] + columns
+
+
+@pytest.mark.parametrize('path', [
+    'pathological.csv', 'roc.csv', 'plsda/plsda1.csv', 'metaboanalyst/viime.csv'
+])
+def test_typed_slice_matches_csv_round_trip(path):
+    table = pd.read_csv(data_dir / path, index_col=None, header=None)
+    for rows, columns in random_slices(table):
+        assert_frame_equal(typed_slice(table, rows, columns),
+                           csv_round_trip(table, rows, columns), check_exact=True)
+
+
+@pytest.mark.parametrize('data', [
+    # whitespace, integers and non-numeric values
+    'h1,h2,h3,h4\n a,g1, 2, 3\n b,g2, a, 6\n c,g3, 8, 9\n',
+    # unnamed and duplicated headers, booleans and special floats
+    ',a,a,b,,x\nx,1,2.0,,True,1e5\ny, 2,3,True,False,inf\n',
+    'i,a,a.1,a\nx,1,2,3\n',
+    # only a header row
+    'i,a,b\n'
+])
+def test_typed_slice_inference(data):
+    table = pd.read_csv(StringIO(data), index_col=None, header=None)
+    rows, columns = list(range(table.shape[0])), list(range(table.shape[1]))
+    assert_frame_equal(typed_slice(table, rows, columns),
+                       csv_round_trip(table, rows, columns), check_exact=True)
+
+
+def test_typed_slice_integer_columns():
+    # integral values are read as integers unless a cell is written as a float
+    table = pd.DataFrame([
+        ['id', 'int', 'str', 'float', 'point', 'exp', 'big', 'mixed'],
+        ['a', 1, '1', 1.0, '1.0', '1e3', 2 ** 60, 1],
+        ['b', 2, '-2', 2, '2', '3', 3, '2'],
+    ], dtype=object)
+    rows, columns = list(range(table.shape[0])), list(range(table.shape[1]))
+    result = typed_slice(table, rows, columns)
+    assert_frame_equal(result, csv_round_trip(table, rows, columns), check_exact=True)
+    assert list(result.dtypes) == ['int64', 'int64', 'float64', 'float64', 'float64',
+                                   'int64', 'int64']
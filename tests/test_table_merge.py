@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from flask import current_app
+import pandas as pd
+import pytest
+
+from viime.table_merge import _transform_tables
+
+tables = [pd.DataFrame({'a': [float(i)]}) for i in range(4)]
+
+
+def test_transform_concurrently(app):
+    barrier = threading.Barrier(len(tables), timeout=5)
+
+    def transformer(df, index):
+        # fails unless all tables are transformed at the same time
+        barrier.wait()
+        return df * current_app.config['MERGE_WORKERS'] + index
+
+    app.config['MERGE_WORKERS'] = 4
+    with app.app_context():
+        result = _transform_tables(transformer, tables)
+    assert [df['a'][0] for df in result] == [0.0, 5.0, 10.0, 15.0]
+
+
+def test_transform_serially(app):
+    threads = set()
+
+    def transformer(df, index):
+        threads.add(threading.get_ident())
+        return df
+
+    app.config['MERGE_WORKERS'] = 1
+    with app.app_context():
+        assert _transform_tables(transformer, tables) == tables
+    assert threads == {threading.get_ident()}
+
+
+def test_transform_error(app):
+    def transformer(df, index):
+        if index == 1:
+            raise ValueError('dataset 2 failed')
+        time.sleep(0.5)
+        return df
+
+    app.config['MERGE_WORKERS'] = 4
+    start = time.perf_counter()
+    with app.app_context(), pytest.raises(ValueError, match='dataset 2'):
+        _transform_tables(transformer, tables)
+    # the error is raised without waiting for the other tables
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.fixture
+def python38_executor(monkeypatch):
+    # the pools of python 3.8 and older have no cancel_futures argument
+    shutdown = ThreadPoolExecutor.shutdown
+
+    def shutdown38(self, wait=True):
+        shutdown(self, wait)
+
+    monkeypatch.setattr(ThreadPoolExecutor, 'shutdown', shutdown38)
+
+
+def test_transform_threads_python38(app, python38_executor):
+    app.config['MERGE_WORKERS'] = 2
+    with app.app_context():
+        result = _transform_tables(lambda df, index: df + index, tables)
+    assert [df['a'][0] for df in result] == [0.0, 2.0, 4.0, 6.0]
+
+
+def test_transform_error_cancels_pending(app, python38_executor):
+    started = []
+
+    def transformer(df, index):
+        started.append(index)
+        if index == 0:
+            raise ValueError('dataset 1 failed')
+        time.sleep(0.2)
+        return df
+
+    app.config['MERGE_WORKERS'] = 2
+    with app.app_context(), pytest.raises(ValueError, match='dataset 1'):
+        _transform_tables(transformer, tables)
+    time.sleep(0.5)
+    # the tables that were still queued are never transformed
+    assert sorted(started) in ([0, 1], [0, 1, 2])
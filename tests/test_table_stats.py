@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from viime.table_stats import table_stats
+
+
+def reference_stats(series):
+    numeric = pd.to_numeric(series, errors='coerce')
+    return {
+        'missing': numeric.isna().sum() / numeric.shape[0],
+        'variance': numeric.var(),
+        'mean': numeric.mean(),
+        'min': numeric.min(),
+        'max': numeric.max()
+    }
+
+
+def assert_stats_equal(stats, expected):
+    for name, values in stats.items():
+        expected_values = [None if v != v else v for v in (e[name] for e in expected)]
+        assert values == pytest.approx(expected_values, rel=1e-12, abs=0, nan_ok=True), name
+
+
+def test_table_stats():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(12, 8)).astype(object)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[2, 3] = 'x'
+    values[:, 5] = 0.1
+    values[4] = np.nan
+    values[6, :] = '2.5'
+    table = pd.DataFrame(values, columns=[f'c{i}' for i in range(8)])
+
+    stats = table_stats(table)
+    assert_stats_equal(
+        stats['columns'], [reference_stats(table.iloc[:, i]) for i in range(table.shape[1])])
+    assert_stats_equal(
+        stats['rows'], [reference_stats(table.iloc[i, :]) for i in range(table.shape[0])])
+    assert stats['rows']['variance'][4] is None
+    assert stats['rows']['min'][4] is None
+    assert stats['rows']['variance'][6] == 0
+
+
+def test_numeric_table_stats():
+    table = pd.DataFrame({'a': [1, 2, 3], 'b': [1.0, np.nan, 5.0]})
+    stats = table_stats(table)
+    assert stats['columns']['mean'] == [2.0, 3.0]
+    assert stats['columns']['missing'] == [0.0, 1 / 3]
+    assert stats['rows']['max'] == [1.0, 2.0, 5.0]
@@ -1,9 +1,11 @@
+from flask import url_for
 from pytest import fixture
 
-from viime.models import CSVFileSchema, db, TABLE_COLUMN_TYPES, TABLE_ROW_TYPES
+from viime import table_validation
+from viime.models import CSVFile, CSVFileSchema, db, TABLE_COLUMN_TYPES, TABLE_ROW_TYPES
 from viime.table_validation import get_low_variance_warnings, \
-    get_missing_percent_warnings, get_non_numeric_warnings, \
-    get_validation_list, ValidationSchema
+    get_missing_percent_warnings, get_non_numeric_errors, get_non_numeric_warnings, \
+    get_validation_list, parse_measurements, ValidationSchema
 csv_file_schema = CSVFileSchema()
 validation_schema = ValidationSchema()
 
@@ -193,6 +195,51 @@ z,b,5,2,5
     assert warning.severity == 'warning'
 
 
+def test_non_numeric_errors(client):
+    table = """
+id,group,col1,col2,col3
+w,a,x,2,3
+x,a,y,0,1
+y,a,,1,4
+z,b,,2,5
+"""
+
+    csv_file = csv_file_schema.load({'table': table, 'name': 'table.csv'})
+    csv_file.columns[2]['column_type'] = TABLE_COLUMN_TYPES.DATA
+    db.session.add(csv_file)
+    db.session.commit()
+
+    errors = get_non_numeric_errors(csv_file)
+    assert [(e.type_, e.column_index, e.data) for e in errors] == [
+        ('non-numeric-column', 2, 'Contains 4 non-numeric values')
+    ]
+
+    csv_file.columns[2]['column_type'] = TABLE_COLUMN_TYPES.MASK
+    db.session.commit()
+    assert get_non_numeric_errors(csv_file) == []
+
+
+def test_parse_measurements(client):
+    table = """
+id,group,col1,col2,col3
+w,a,-1,2,x
+x,a,,0,1
+"""
+
+    csv_file = csv_file_schema.load({'table': table, 'name': 'table.csv'})
+    for column in csv_file.columns[2:]:
+        column['column_type'] = TABLE_COLUMN_TYPES.DATA
+    db.session.add(csv_file)
+    db.session.commit()
+
+    block = parse_measurements(csv_file)
+    assert block.row_indices == [1, 2]
+    assert block.column_indices == [2, 3, 4]
+    assert block.missing.tolist() == [[False, False, False], [True, False, False]]
+    assert block.non_numeric.tolist() == [[False, False, True], [False, False, False]]
+    assert block.values[0, :2].tolist() == [-1, 2]
+
+
 def test_missing_percent_warning(client):
     table = """
 id,group,col1,col2,col3
@@ -254,3 +301,67 @@ z,b,,10
 
     warnings = get_low_variance_warnings(csv_file)
     assert warnings == []
+
+
+@fixture
+def parsed_columns(monkeypatch):
+    parsed = []
+
+    def parse(csv_file, column_indices=None):
+        parsed.append(column_indices)
+        return parse_measurements(csv_file, column_indices)
+
+    monkeypatch.setattr(table_validation, 'parse_measurements', parse)
+    yield parsed
+
+
+def test_incremental_validation(client, parsed_columns):
+    table = """
+id,group,col1,col2,col3,col4
+w,a,0,2,,1
+x,a,0,0,,2
+y,b,0,1,,3
+z,b,0,10,x,4
+"""
+
+    csv_file = csv_file_schema.load({'table': table, 'name': 'table.csv'})
+    for column in csv_file.columns[2:]:
+        column['column_type'] = TABLE_COLUMN_TYPES.DATA
+    table_validation.update_validation_state(csv_file)
+    db.session.add(csv_file)
+    db.session.commit()
+    csv_id = csv_file.id
+
+    def relabel(context, index, label):
+        parsed_columns.clear()
+        resp = client.put(url_for('csv.batch_modify_label', csv_id=csv_id), json={
+            'changes': [{'context': context, 'index': index, 'label': label}]
+        })
+        assert resp.status_code == 200
+        return list(parsed_columns)
+
+    def validate():
+        parsed_columns.clear()
+        validation = get_validation_list(CSVFile.query.get(csv_id))
+        # the persisted state is up to date
+        assert parsed_columns == []
+
+        fresh = CSVFile.query.get(csv_id)
+        fresh.validation_json = None
+        assert get_validation_list(fresh) == validation
+        db.session.rollback()
+        return [(v.type_, v.column_index) for v in validation]
+
+    assert validate() == [('non-numeric-column', 4)]
+
+    # only the relabeled columns are parsed again
+    assert relabel('column', 4, TABLE_COLUMN_TYPES.MASK) == [[4]]
+    assert validate() == [('low-variance', 2)]
+    assert relabel('column', 2, TABLE_COLUMN_TYPES.METADATA) == [[2]]
+    assert validate() == []
+    assert relabel('column', 2, TABLE_COLUMN_TYPES.DATA) == [[2]]
+    assert relabel('column', 3, TABLE_COLUMN_TYPES.DATA) == []
+
+    # changing the data rows requires parsing all columns
+    assert relabel('row', 4, TABLE_ROW_TYPES.MASK) == [None]
+    assert validate() == [('low-variance', 2)]
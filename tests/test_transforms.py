@@ -2,9 +2,11 @@ from io import BytesIO
 import math
 
 from flask import url_for
+import numpy
 import pandas
 from pandas.testing import assert_frame_equal
 import pytest
+from sklearn import preprocessing
 
 from viime import normalization
 from viime import scaling
@@ -151,3 +153,34 @@ def test_transform_api(client, csv_file, validated_table):
     assert resp.json['transformation'] is None
     assert ValidatedMetaboliteTable.query.get(validated_table.id) \
         .measurements.iloc[0, 0] == 0.5
+
+
+@pytest.mark.parametrize('method,expected', [
+    ('auto', lambda t: (t - t.mean()) / t.std()),
+    ('range', lambda t: (t - t.mean()) / (t.max() - t.min())),
+    ('pareto', lambda t: (t - t.mean()) / numpy.sqrt(t.std())),
+    ('vast', lambda t: (t.mean() / t.std()) * (t - t.mean()) / t.std()),
+    ('level', lambda t: (t - t.mean()) / t.mean())
+])
+def test_scale_matches_reference(app, method, expected):
+    random = numpy.random.default_rng(0)
+    table = pandas.DataFrame(random.uniform(1, 10, (20, 5)), columns=list('abcde'))
+    table.iloc[3, 1] = numpy.nan
+    original = table.copy()
+
+    assert_frame_equal(scaling.scale(method, table), expected(table), check_exact=False)
+    assert_frame_equal(table, original)
+
+
+def test_normalize_minmax_matches_sklearn(app):
+    random = numpy.random.default_rng(0)
+    table = pandas.DataFrame(random.uniform(1, 10, (20, 4)), columns=list('abcd'))
+    table.iloc[3, 1] = numpy.nan
+    table['c'] = 5.0
+    table['d'] = numpy.nan
+    original = table.copy()
+
+    expected = pandas.DataFrame(
+        preprocessing.MinMaxScaler().fit_transform(table), columns=table.columns)
+    assert_frame_equal(normalization.minmax(table), expected)
+    assert_frame_equal(table, original)
@@ -4,15 +4,17 @@ from typing import Any, Dict, List, Optional
 
 import pandas as pd
 
+from .cache import cached
 from .models import clean
-from .opencpu import opencpu_request, r_json_to_pandas
+from .opencpu import opencpu_request, r_json_to_pandas, table_file
 
 
+@cached
 def wilcoxon_test(measurements: pd.DataFrame, groups: pd.Series,
                   log_transformed=False) -> Dict[str, Any]:
     files = {
-        'measurements': measurements.to_csv().encode(),
-        'groups': groups.to_csv(header=True).encode()
+        'measurements': measurements,
+        'groups': groups
     }
 
     data = opencpu_request('wilcoxon_test_z_scores', files, {
@@ -31,11 +33,12 @@ def wilcoxon_test(measurements: pd.DataFrame, groups: pd.Series,
     }
 
 
+@cached
 def anova_test(measurements: pd.DataFrame, groups: pd.Series,
                log_transformed=False) -> Dict[str, Any]:
     files = {
-        'measurements': measurements.to_csv().encode(),
-        'groups': groups.to_csv(header=True).encode()
+        'measurements': measurements,
+        'groups': groups
     }
 
     data = opencpu_request('anova_tukey_adjustment', files, {
@@ -56,9 +59,10 @@ def anova_test(measurements: pd.DataFrame, groups: pd.Series,
     }
 
 
+@cached
 def hierarchical_clustering(measurements: pd.DataFrame) -> Dict[str, Any]:
     data = opencpu_request('clustered_heatmap', {
-        'measurements': measurements.to_csv().encode()
+        'measurements': measurements
     }, {}, return_type='json')
 
     values = pd.read_csv(StringIO('\n'.join(data['data'])), index_col=0).to_numpy()
@@ -77,6 +81,7 @@ def hierarchical_clustering(measurements: pd.DataFrame) -> Dict[str, Any]:
                           'values': measurements.values.tolist()})
 
 
+@cached
 def pairwise_correlation(measurements: pd.DataFrame, min_correlation: float = 0,
                          method: Optional[str] = None) -> Dict[str, Any]:
 
@@ -93,12 +98,13 @@ def pairwise_correlation(measurements: pd.DataFrame, min_correlation: float = 0,
     return dict(columns=columns, correlations=r)
 
 
+@cached
 def roc_analysis(measurements: pd.DataFrame, groups: pd.DataFrame,
                  group1: str, group2: str, columns: list, method: str) -> Dict[str, List[float]]:
     files = {
-        'measurements': measurements.to_csv().encode(),
-        'groups': groups.to_csv(header=True).encode(),
-        'column_names': pd.DataFrame(columns).to_csv().encode()
+        'measurements': measurements,
+        'groups': groups,
+        'column_names': table_file('column_names', pd.DataFrame(columns))
     }
     data = opencpu_request('roc_analysis', files, {
         'group1_name': group1,
@@ -112,9 +118,10 @@ def roc_analysis(measurements: pd.DataFrame, groups: pd.DataFrame,
     return merged_data
 
 
+@cached
 def factor_analysis(measurements: pd.DataFrame, threshold=0.4) -> Dict[str, List[float]]:
     files = {
-        'measurements': measurements.to_csv().encode()
+        'measurements': measurements
     }
     data = opencpu_request('factor_analysis', files, {
         'threshold': threshold
@@ -122,10 +129,11 @@ def factor_analysis(measurements: pd.DataFrame, threshold=0.4) -> Dict[str, List
     return clean(data).to_dict(orient='list')
 
 
+@cached
 def plsda(measurements: pd.DataFrame, groups: pd.DataFrame, num_of_components: int):
     files = {
-        'measurements': measurements.to_csv().encode(),
-        'groups': groups.to_csv(header=True).encode()
+        'measurements': measurements,
+        'groups': groups
     }
     data = opencpu_request('plsda', files, {
         'num_of_components': num_of_components,
@@ -133,10 +141,11 @@ def plsda(measurements: pd.DataFrame, groups: pd.DataFrame, num_of_components: i
     return [clean(r_json_to_pandas(d)).to_dict(orient='list') for d in data]
 
 
+@cached
 def oplsda(measurements: pd.DataFrame, groups: pd.DataFrame, num_of_components: int):
     files = {
-        'measurements': measurements.to_csv().encode(),
-        'groups': groups.to_csv(header=True).encode()
+        'measurements': measurements,
+        'groups': groups
     }
     data = opencpu_request('oplsda', files, {
         'num_of_components': num_of_components,
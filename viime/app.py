@@ -8,9 +8,9 @@ from marshmallow import ValidationError
 from webargs.flaskparser import parser
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-from viime.cache import clear_cache
+from viime.cache import cache_stats, clear_cache, configure_cache
 from viime.models import db
-from viime.opencpu import OpenCPUException
+from viime.opencpu import opencpu_stats, OpenCPUException
 from viime.views import csv_bp
 
 
@@ -61,11 +61,44 @@ def create_app(config=None):
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER')
     app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_FILE_UPLOAD_SIZE', 5 * 1024 * 1024))
+    # rows and columns sampled to guess the structure of an upload, unset to use all
+    app.config['TABLE_GUESS_SAMPLE_SIZE'] = os.getenv('TABLE_GUESS_SAMPLE_SIZE')
     app.config['OPENCPU_API_ROOT'] = os.getenv('OPENCPU_API_ROOT')
+    # keep-alive connection pool, timeouts in seconds and retries of failed connections
+    app.config['OPENCPU_POOL_SIZE'] = os.getenv('OPENCPU_POOL_SIZE')
+    app.config['OPENCPU_CONNECT_TIMEOUT'] = os.getenv('OPENCPU_CONNECT_TIMEOUT')
+    app.config['OPENCPU_READ_TIMEOUT'] = os.getenv('OPENCPU_READ_TIMEOUT')
+    app.config['OPENCPU_RETRIES'] = os.getenv('OPENCPU_RETRIES')
+    app.config['OPENCPU_RETRY_BACKOFF'] = os.getenv('OPENCPU_RETRY_BACKOFF')
+    # 'csv' or 'feather' (binary uploads, requires pyarrow)
+    app.config['OPENCPU_TRANSPORT'] = os.getenv('OPENCPU_TRANSPORT', 'csv')
+    # seconds uploaded tables are reused by their session key, 0 disables reuse
+    app.config['OPENCPU_SESSION_TTL'] = os.getenv('OPENCPU_SESSION_TTL')
+    # tables with fewer cells are sent with each call instead of uploaded into a session
+    app.config['OPENCPU_SESSION_MIN_CELLS'] = os.getenv('OPENCPU_SESSION_MIN_CELLS')
+    # 'local' or 'opencpu' (random forest imputation in R)
+    app.config['IMPUTATION_ENGINE'] = os.getenv('IMPUTATION_ENGINE', 'local')
+    # processes used for the random forests of a local imputation
+    app.config['IMPUTATION_WORKERS'] = int(os.getenv('IMPUTATION_WORKERS', 1))
+    # threads transforming the datasets of a merge concurrently
+    app.config['MERGE_WORKERS'] = int(os.getenv('MERGE_WORKERS', 4))
+    # seconds after which a job of an unresponsive `viime-cli worker` is run again
+    app.config['JOB_TIMEOUT'] = os.getenv('JOB_TIMEOUT')
+    # seconds after which done and failed jobs and their results are deleted
+    app.config['JOB_RETENTION'] = os.getenv('JOB_RETENTION')
+    # 'database' or 'files' (content addressed blobs in UPLOAD_FOLDER)
+    app.config['TABLE_BLOB_STORAGE'] = os.getenv('TABLE_BLOB_STORAGE', 'database')
+    # result cache, CACHE_DIR enables a disk tier and creation locks shared between processes
+    app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'viime.tiered')
+    app.config['CACHE_MAX_BYTES'] = os.getenv('CACHE_MAX_BYTES')
+    app.config['CACHE_DIR'] = os.getenv('CACHE_DIR')
+    app.config['CACHE_DISK_MAX_BYTES'] = os.getenv('CACHE_DISK_MAX_BYTES')
+    app.config['CACHE_EXPIRATION_TIME'] = os.getenv('CACHE_EXPIRATION_TIME')
 
     app.config.update(config)
     db.init_app(app)
     Migrate(app, db)
+    configure_cache(app.config)
 
     @app.route('/api/v1/status')
     def status():
@@ -75,6 +108,14 @@ def create_app(config=None):
         resp.headers['Expires'] = '0'
         return resp
 
+    @app.route('/api/v1/cache/stats')
+    def get_cache_stats():
+        return jsonify(cache_stats())
+
+    @app.route('/api/v1/opencpu/stats')
+    def get_opencpu_stats():
+        return jsonify(opencpu_stats())
+
     app.register_blueprint(csv_bp, url_prefix='/api/v1')
 
     app.register_error_handler(ValidationError, handle_validation_error)
@@ -0,0 +1,82 @@
+"""
+This module contains a content-addressed file store for large table blobs.
+
+Blobs are stored under ``UPLOAD_FOLDER/blobs`` and named after the sha256
+digest of their content, so identical tables are only stored once.  Files are
+never modified after they are written; blobs that are no longer referenced
+by any row are removed by ``collect_garbage``.
+"""
+from hashlib import sha256
+import mmap
+import os
+from pathlib import Path
+import time
+from typing import Iterable, Iterator, List
+
+from flask import current_app
+
+BLOB_DIRECTORY = 'blobs'
+
+# newly written blobs may not be referenced by a committed row yet
+GARBAGE_COLLECTION_MIN_AGE = 60 * 60
+
+
+def enabled() -> bool:
+    return current_app.config.get('TABLE_BLOB_STORAGE') == 'files'
+
+
+def root() -> Path:
+    return Path(current_app.config['UPLOAD_FOLDER']) / BLOB_DIRECTORY
+
+
+def blob_path(digest: str) -> Path:
+    if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+        raise ValueError(f'Invalid blob digest {digest}')
+    return root() / digest[:2] / digest
+
+
+def put(data: bytes) -> str:
+    """Store a blob and return its digest."""
+    digest = sha256(data).hexdigest()
+    path = blob_path(digest)
+    if path.is_file():
+        # protect the existing blob from a concurrent garbage collection
+        os.utime(path)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{digest}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return digest
+
+
+def get(digest: str) -> mmap.mmap:
+    """Return a read only memory map of a stored blob."""
+    with open(blob_path(digest), 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_digests() -> Iterator[str]:
+    directory = root()
+    if not directory.is_dir():
+        return
+    for path in directory.glob('??/*'):
+        if path.is_file() and not path.name.endswith('.tmp'):
+            yield path.name
+
+
+def collect_garbage(referenced: Iterable[str], min_age: float = GARBAGE_COLLECTION_MIN_AGE,
+                    dry_run: bool = False) -> List[str]:
+    """Delete all blobs older than ``min_age`` seconds that are not referenced."""
+    referenced = set(referenced)
+    now = time.time()
+    deleted: List[str] = []
+    for digest in list(iter_digests()):
+        path = blob_path(digest)
+        if digest in referenced or now - path.stat().st_mtime < min_age:
+            continue
+        if not dry_run:
+            path.unlink()
+        deleted.append(digest)
+    return deleted
@@ -1,27 +1,147 @@
-from functools import partial
-from hashlib import sha256
+from collections import Counter, OrderedDict
+from functools import partial, wraps
+from hashlib import blake2b, sha256
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence, Tuple, TypeVar
+import weakref
 
-from dogpile.cache import make_region
+from dogpile.cache import make_region, register_backend
+from dogpile.cache.api import BytesBackend, CacheMutex, NO_VALUE
 from dogpile.cache.backends.memory import MemoryBackend
 from dogpile.cache.util import kwarg_function_key_generator
 from flask import g
+from pandas import DataFrame, Series
 from pandas.core.base import PandasObject
 from pandas.util import hash_pandas_object
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# bump this whenever the result of a cached function changes
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_EXPIRATION_TIME = 24 * 60 * 60
+
+# how many writes to the disk tier between checking its size
+DISK_PRUNE_INTERVAL = 32
+# lock files not used for this many seconds are deleted when pruning
+LOCK_FILE_MAX_AGE = 24 * 60 * 60
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+def _hasher():
+    """Return a fast (non cryptographic if available) 128 bit hash object."""
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return blake2b(digest_size=16)
+
+
+def fingerprint_bytes(data) -> str:
+    """Compute the content fingerprint of a bytes like object."""
+    r = _hasher()
+    r.update(data)
+    return r.hexdigest()
+
+
+def derive_fingerprint(fingerprint: str, *parts: Any) -> str:
+    """Compute the fingerprint of a table derived from a fingerprinted one."""
+    return fingerprint_bytes(repr((fingerprint,) + parts).encode())
+
+
+# fingerprints of tagged objects by id, the weak reference tells whether the
+# tagged object is still alive (ids of freed objects are reused)
+_fingerprints: Dict[int, Tuple['weakref.ReferenceType[Any]', str, Tuple[int, ...]]] = {}
+
+
+def _forget_fingerprint(key: int, ref: 'weakref.ReferenceType[Any]'):
+    entry = _fingerprints.get(key)
+    if entry is not None and entry[0] is ref:
+        _fingerprints.pop(key, None)
+
+
+def tag_fingerprint(obj: Any, fingerprint: Optional[str]):
+    """Attach a content fingerprint to a data frame or series.
+
+    The tag is bound to the object itself, copies and derived objects are
+    hashed again.  A tagged object must not be modified in place.
+    """
+    if fingerprint is not None and isinstance(obj, (DataFrame, Series)):
+        key = id(obj)
+        ref = weakref.ref(obj, lambda ref: _forget_fingerprint(key, ref))
+        _fingerprints[key] = (ref, fingerprint, obj.shape)
+    return obj
+
+
+def get_fingerprint(obj: Any) -> Optional[str]:
+    entry = _fingerprints.get(id(obj))
+    if entry is not None and entry[2] == obj.shape and entry[0]() is obj:
+        return entry[1]
+    return None
+
+
+class Deferred:
+    """
+    A fingerprinted table that is only loaded (or computed) when needed.
+
+    Cache keys only depend on the fingerprint, so passing a deferred table to
+    a cached function does not load it when the result is already cached.
+    """
+    def __init__(self, fingerprint: str, load: Callable[[], Any]):
+        self.fingerprint = fingerprint
+        self._load = load
+
+    def resolve(self) -> Any:
+        if not hasattr(self, '_value'):
+            self._value = tag_fingerprint(self._load(), self.fingerprint)
+        return self._value
+
+    def __repr__(self):
+        return f'<Deferred {self.fingerprint}>'
+
+
+def resolve(arg: Any) -> Any:
+    return arg.resolve() if isinstance(arg, Deferred) else arg
+
 
 def hash_argument(arg):
     from viime.models import CSVFile
-    if isinstance(arg, PandasObject):
-        r = hash_pandas_object(arg, index=True)
-        return sha256(r.values.tostring()).hexdigest()
+    if isinstance(arg, Deferred):
+        return arg.fingerprint
+    elif isinstance(arg, PandasObject):
+        fingerprint = get_fingerprint(arg)
+        if fingerprint is not None:
+            return fingerprint
+        r = _hasher()
+        r.update(hash_pandas_object(arg, index=True).values.tobytes())
+        if isinstance(arg, DataFrame):
+            # values are hashed by row, so the labels and types have to be added
+            r.update(hash_pandas_object(arg.columns).values.tobytes())
+            r.update(str(list(arg.dtypes)).encode())
+        elif isinstance(arg, Series):
+            r.update(f'{arg.name!r} {arg.dtype}'.encode())
+        r.update(str(list(arg.index.names)).encode())
+        return r.hexdigest()
     elif isinstance(arg, CSVFile):
-        return str(arg.id)
+        return f'{arg.id}:{arg.table_version}'
 
     return str(arg)
 
 
 def mangle_key(key):
-    return sha256(key.encode()).hexdigest()
+    return sha256(f'{CACHE_VERSION}:{key}'.encode()).hexdigest()
 
 
 def clear_cache(csv_file=None):
@@ -40,8 +160,301 @@ class FlaskRequestLocalBackend(MemoryBackend):
         return g.cache
 
 
+class KeyMutex(CacheMutex):
+    """
+    The creation lock of a cache key.
+
+    dogpile shares one mutex per key between the threads of a process, so
+    concurrent calls with the same arguments wait for a single computation.
+    With a lock file, the computation is also shared with other processes
+    using the same disk tier.
+    """
+    def __init__(self, backend: 'TieredBackend', path: Optional[Path] = None):
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def acquire(self, wait: bool = True) -> bool:
+        if not self._lock.acquire(False):
+            if not wait:
+                return False
+            self.backend._count('lock_waits')
+            self._lock.acquire()
+        if self.path is None:
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        except OSError:
+            self._lock.release()
+            raise
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not wait:
+                os.close(fd)
+                self._lock.release()
+                return False
+            self.backend._count('lock_waits')
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        # the modification time protects the file from pruning
+        os.utime(fd)
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+
+class TieredBackend(BytesBackend):
+    """
+    This is a dogpile backend storing serialized values in a process wide LRU
+    with a byte budget.  When a directory is given, values are also written
+    to disk so that they are shared between worker processes.
+
+    Concurrent computations of the same key are coalesced (see ``KeyMutex``).
+
+    Arguments:
+        max_bytes: budget of the in memory tier
+        directory: optional directory of the disk tier
+        disk_max_bytes: budget of the disk tier
+    """
+    def __init__(self, arguments: Mapping[str, Any]):
+        self.max_bytes = int(arguments.get('max_bytes', DEFAULT_MAX_BYTES))
+        directory = arguments.get('directory')
+        self.directory: Optional[Path] = Path(directory) if directory else None
+        self.disk_max_bytes = int(arguments.get('disk_max_bytes', DEFAULT_DISK_MAX_BYTES))
+
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._size = 0
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        assert self.directory is not None
+        return self.directory / sha256(key.encode()).hexdigest()
+
+    def get_mutex(self, key: str) -> KeyMutex:
+        if self.directory and fcntl is not None:
+            locks = self.directory / 'locks'
+            locks.mkdir(exist_ok=True)
+            return KeyMutex(self, locks / self._path(key).name)
+        return KeyMutex(self)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, key: str, value: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            if len(value) > self.max_bytes:
+                self.counters['oversized'] += 1
+                return
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.counters['evictions'] += 1
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            # the modification time orders entries for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def _write_disk(self, key: str, value: bytes):
+        if not self.directory or len(value) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % DISK_PRUNE_INTERVAL == 0
+        if prune:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete the least recently used files exceeding the disk budget."""
+        if not self.directory:
+            return
+        self._prune_locks()
+        files = []
+        for path in self.directory.iterdir():
+            if path.name.endswith('.tmp') or path.is_dir():
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count('disk_evictions')
+
+    def _prune_locks(self):
+        assert self.directory is not None
+        locks = self.directory / 'locks'
+        if not locks.is_dir():
+            return
+        expired = time.time() - LOCK_FILE_MAX_AGE
+        for path in locks.iterdir():
+            try:
+                if path.stat().st_mtime < expired:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def get_serialized(self, key: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return value
+
+        value = self._read_disk(key)
+        if value is not None:
+            self._count('disk_hits')
+            self._remember(key, value)
+            return value
+
+        self._count('misses')
+        return NO_VALUE
+
+    def get_serialized_multi(self, keys: Sequence[str]):
+        return [self.get_serialized(key) for key in keys]
+
+    def set_serialized(self, key: str, value: bytes):
+        self._remember(key, value)
+        self._write_disk(key, value)
+
+    def set_serialized_multi(self, mapping: Mapping[str, bytes]):
+        for key, value in mapping.items():
+            self.set_serialized(key, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+        if self.directory:
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def delete_multi(self, keys: Sequence[str]):
+        for key in keys:
+            self.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0,
+                'disk_evictions': 0, 'oversized': 0, 'lock_waits': 0
+            }
+            stats.update(self.counters)
+            stats.update(entries=len(self._entries), bytes=self._size, max_bytes=self.max_bytes)
+        return stats
+
+
+register_backend('viime.tiered', 'viime.cache', 'TieredBackend')
+
 region = make_region(
-    'viime.app.local',
-    function_key_generator=partial(kwarg_function_key_generator, to_str=hash_argument)
+    'viime.app.results',
+    function_key_generator=partial(kwarg_function_key_generator, to_str=hash_argument),
+    key_mangler=mangle_key
 )
-region.configure('flask_request_local')
+region.configure('viime.tiered', expiration_time=DEFAULT_EXPIRATION_TIME)
+
+
+def configure_cache(config: Mapping[str, Any]):
+    """(Re)configure the result cache from the application config."""
+    region.configure(
+        config.get('CACHE_BACKEND') or 'viime.tiered',
+        expiration_time=int(config.get('CACHE_EXPIRATION_TIME') or DEFAULT_EXPIRATION_TIME),
+        arguments={
+            'max_bytes': int(config.get('CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES),
+            'directory': config.get('CACHE_DIR') or None,
+            'disk_max_bytes': int(config.get('CACHE_DISK_MAX_BYTES') or DEFAULT_DISK_MAX_BYTES)
+        },
+        replace_existing_backend=True
+    )
+
+
+def cached(fn: F) -> F:
+    """Cache the results of a pure function in the result region.
+
+    Returned data frames are tagged with a fingerprint derived from the cache
+    key, so passing them on to other cached functions does not rehash them.
+    ``Deferred`` arguments are only resolved when the result is not cached.
+    """
+    key_generator = region.function_key_generator(None, fn)
+
+    def create(*args, **kwargs):
+        args = [resolve(arg) for arg in args]
+        kwargs = {name: resolve(arg) for name, arg in kwargs.items()}
+        return fn(*args, **kwargs)
+
+    @wraps(fn)
+    def wrapped(*args, **kwargs):
+        key = key_generator(*args, **kwargs)
+        result = region.get_or_create(key, partial(create, *args, **kwargs))
+        fingerprint = fingerprint_bytes(key.encode())
+        if isinstance(result, tuple):
+            for i, value in enumerate(result):
+                tag_fingerprint(value, derive_fingerprint(fingerprint, i))
+        else:
+            tag_fingerprint(result, fingerprint)
+        return result
+
+    wrapped.cache_key = key_generator  # type: ignore
+    return wrapped  # type: ignore
+
+
+def defer(fn: Callable[..., Any], *args, **kwargs) -> Deferred:
+    """Return the result of a cached function as a deferred table.
+
+    This is used to chain pipeline stages: when the result of the last stage
+    is cached, none of the intermediate results are loaded or computed.
+    """
+    key = fn.cache_key(*args, **kwargs)  # type: ignore
+    return Deferred(fingerprint_bytes(key.encode()), partial(fn, *args, **kwargs))
+
+
+def cache_stats() -> Dict[str, Any]:
+    stats = getattr(region.backend, 'stats', None)
+    return stats() if stats else {}
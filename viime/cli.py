@@ -1,4 +1,5 @@
 import json
+import multiprocessing
 import os
 from pathlib import Path, PurePath
 from typing import Any, Callable, List, Optional
@@ -7,9 +8,9 @@ import click
 import flask_migrate
 import requests
 
-from viime import samples
+from viime import blob_store, jobs, samples
 from viime.app import create_app
-from viime.models import CSVFile, db
+from viime.models import CSVFile, db, ValidatedMetaboliteTable
 
 
 samples_dir = str(PurePath(__file__).parent.parent / 'samples')
@@ -31,6 +32,48 @@ def create_tables():
         flask_migrate.stamp()
 
 
+@cli.command(help='delete table blobs that are no longer referenced')
+@click.option('--min-age', default=blob_store.GARBAGE_COLLECTION_MIN_AGE, show_default=True,
+              help='only delete blobs older than this many seconds')
+@click.option('--dry-run', is_flag=True, help='only list the unreferenced blobs')
+def collect_blobs(min_age: int, dry_run: bool = False):
+    with create_app().app_context():
+        referenced = ValidatedMetaboliteTable.referenced_digests()
+        deleted = blob_store.collect_garbage(referenced, min_age, dry_run)
+        for digest in deleted:
+            click.echo(digest)
+        click.echo(f'{"found" if dry_run else "deleted"} {len(deleted)} unreferenced blobs')
+
+
+def _work(once: bool):
+    count = jobs.work(create_app(), once)
+    click.echo(f'ran {count} jobs')
+
+
+@cli.command(help='run the analyses requested with ?async=1')
+@click.option('--processes', default=1, show_default=True, help='number of worker processes')
+@click.option('--once', is_flag=True, help='exit when the queue is empty')
+def worker(processes: int, once: bool = False):
+    if processes <= 1:
+        _work(once)
+        return
+
+    pool = [multiprocessing.Process(target=_work, args=(once,)) for _ in range(processes)]
+    for process in pool:
+        process.start()
+    for process in pool:
+        process.join()
+
+
+@cli.command(help='delete finished jobs and their results')
+@click.option('--retention', default=None, type=float,
+              help='only delete jobs finished this many seconds ago (default: JOB_RETENTION)')
+def prune_jobs(retention: Optional[float] = None):
+    with create_app().app_context():
+        count = jobs.prune(retention)
+    click.echo(f'deleted {count} jobs')
+
+
 @cli.command(help='load samples into the db')
 @click.option('--url', default='http://localhost:8080', show_default=True,
               help='VIIME instance to load into')
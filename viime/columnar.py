@@ -0,0 +1,255 @@
+"""
+This module contains a small self-describing columnar container used to
+persist parsed tables next to the uploaded csv files.
+
+A container is laid out as::
+
+    MAGIC | uint32 version | uint32 header size | json header | buffers
+
+Every buffer is aligned to 8 bytes so that numeric columns can be read
+without copying from a (memory-mapped) buffer.  String columns are either
+stored as fixed width byte strings or, when there are many repeated values,
+as integer codes into a string dictionary.
+
+Tables with a single numeric dtype are additionally described as one column
+major block (version 2).  Such a table is loaded as a data frame backed by
+the container buffer itself, while every column can still be read on its own.
+"""
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy
+import pandas
+
+MAGIC = b'VIIMECOL'
+VERSION = 2
+ALIGNMENT = 8
+
+_PREAMBLE = struct.Struct('<8sII')
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def _pad(size: int) -> int:
+    return (ALIGNMENT - size % ALIGNMENT) % ALIGNMENT
+
+
+def _json_label(value: Any) -> Any:
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+class _Writer:
+    def __init__(self):
+        self.buffers: List[bytes] = []
+        self.size = 0
+
+    def add(self, data: bytes) -> List[int]:
+        offset = self.size
+        self.buffers.append(data)
+        self.buffers.append(b'\0' * _pad(len(data)))
+        self.size += len(data) + _pad(len(data))
+        return [offset, len(data)]
+
+    def add_array(self, array: numpy.ndarray) -> Dict[str, Any]:
+        array = numpy.ascontiguousarray(array)
+        return {'dtype': array.dtype.str, 'buffer': self.add(array.tobytes())}
+
+    def add_strings(self, values: numpy.ndarray) -> Dict[str, Any]:
+        """Store an object array of strings (or missing values) at a fixed width."""
+        mask = pandas.isna(values)
+        strings = numpy.where(mask, '', values).astype(str)
+        try:
+            # ascii data is stored at 1 byte per character
+            data = strings.astype(bytes)
+        except UnicodeEncodeError:
+            data = strings
+        spec = {'encoding': 'string', 'values': self.add_array(data), 'mask': None}
+        if mask.any():
+            spec['mask'] = self.add_array(mask)
+        return spec
+
+    def add_block(self, table: pandas.DataFrame) -> Dict[str, Any]:
+        """Store a homogeneous numeric table as one column major block."""
+        values = numpy.ascontiguousarray(table.to_numpy().T)
+        spec = self.add_array(values)
+        spec['shape'] = list(values.shape)
+        offset, size = spec['buffer']
+        column_size = values.shape[1] * values.dtype.itemsize
+        spec['columns'] = [{
+            'encoding': 'plain',
+            'values': {'dtype': values.dtype.str, 'buffer': [offset + i * column_size, column_size]}
+        } for i in range(values.shape[0])]
+        return spec
+
+    def add_column(self, values: Union[numpy.ndarray, pandas.Index, pandas.Series]):
+        values = numpy.asarray(values)
+        if values.dtype.kind in 'biufmM':
+            return {'encoding': 'plain', 'values': self.add_array(values)}
+        if values.dtype.kind in 'SU':
+            values = values.astype(object)
+        if values.dtype.kind != 'O':
+            raise TypeError(f'Unsupported column type {values.dtype}')
+
+        if not all(isinstance(v, str) for v in values[~pandas.isna(values)]):
+            # mixed python objects, fall back to a json representation
+            data = json.dumps([None if v is None or v != v else _json_label(v) for v in values])
+            return {'encoding': 'json', 'values': self.add(data.encode())}
+
+        codes, uniques = pandas.factorize(values)
+        if len(uniques) * 2 > len(values):
+            return self.add_strings(values)
+        return {
+            'encoding': 'dictionary',
+            'codes': self.add_array(codes.astype(numpy.int32)),
+            'dictionary': self.add_strings(numpy.asarray(uniques, dtype=object))
+        }
+
+    def add_index(self, index: pandas.Index) -> Dict[str, Any]:
+        spec: Dict[str, Any] = {'name': _json_label(index.name)}
+        if isinstance(index, pandas.RangeIndex):
+            spec.update(kind='range', start=index.start, stop=index.stop, step=index.step)
+        else:
+            spec.update(kind='values', values=self.add_column(index))
+        return spec
+
+
+def _is_homogeneous(table: pandas.DataFrame) -> bool:
+    dtypes = set(table.dtypes)
+    return len(dtypes) == 1 and next(iter(dtypes)).kind in 'biuf' and table.size > 0
+
+
+def dumps(table: pandas.DataFrame) -> bytes:
+    """Serialize a data frame into a columnar container."""
+    writer = _Writer()
+    header: Dict[str, Any] = {
+        'version': VERSION,
+        'shape': list(table.shape),
+        'index': writer.add_index(table.index),
+        'columns': writer.add_index(table.columns),
+        'block': None
+    }
+    if _is_homogeneous(table):
+        header['block'] = writer.add_block(table)
+        header['data'] = header['block'].pop('columns')
+    else:
+        header['data'] = [writer.add_column(table.iloc[:, i]) for i in range(table.shape[1])]
+    header_data = json.dumps(header).encode()
+    header_data += b' ' * _pad(_PREAMBLE.size + len(header_data))
+    preamble = _PREAMBLE.pack(MAGIC, VERSION, len(header_data))
+    return b''.join([preamble, header_data] + writer.buffers)
+
+
+class _Reader:
+    def __init__(self, data: Buffer):
+        self.data = memoryview(data)
+        if len(self.data) < _PREAMBLE.size or bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a columnar table')
+        _, version, header_size = _PREAMBLE.unpack_from(self.data)
+        if version > VERSION:
+            raise ValueError(f'Unsupported columnar table version {version}')
+        start = _PREAMBLE.size
+        self.header = json.loads(bytes(self.data[start:start + header_size]))
+        self.offset = start + header_size
+
+    def buffer(self, ref: List[int]) -> memoryview:
+        start = self.offset + ref[0]
+        return self.data[start:start + ref[1]]
+
+    def array(self, spec: Dict[str, Any]) -> numpy.ndarray:
+        return numpy.frombuffer(self.buffer(spec['buffer']), dtype=numpy.dtype(spec['dtype']))
+
+    def strings(self, spec: Dict[str, Any]) -> numpy.ndarray:
+        values = self.array(spec['values'])
+        if values.dtype.kind == 'S':
+            values = values.astype(str)
+        values = values.astype(object)
+        if spec['mask'] is not None:
+            values[self.array(spec['mask'])] = numpy.nan
+        return values
+
+    def column(self, spec: Dict[str, Any]) -> numpy.ndarray:
+        encoding = spec['encoding']
+        if encoding == 'plain':
+            return self.array(spec['values'])
+        if encoding == 'string':
+            return self.strings(spec)
+        if encoding == 'dictionary':
+            codes = self.array(spec['codes'])
+            # a trailing nan is addressed by the -1 code of missing values
+            dictionary = numpy.append(self.strings(spec['dictionary']), numpy.nan)
+            return dictionary[codes]
+        if encoding == 'json':
+            values = json.loads(bytes(self.buffer(spec['values'])))
+            return numpy.array([numpy.nan if v is None else v for v in values], dtype=object)
+        raise ValueError(f'Unknown column encoding {encoding}')
+
+    def index(self, spec: Dict[str, Any]) -> pandas.Index:
+        if spec['kind'] == 'range':
+            return pandas.RangeIndex(spec['start'], spec['stop'], spec['step'], name=spec['name'])
+        return pandas.Index(self.column(spec['values']), name=spec['name'])
+
+    def table(self, columns: Optional[Sequence[Any]] = None) -> pandas.DataFrame:
+        index = self.index(self.header['index'])
+        labels = self.index(self.header['columns'])
+        block = self.header.get('block')
+        if columns is None and block:
+            values = self.array(block).reshape(block['shape'])
+            return pandas.DataFrame(values.T, index=index, columns=labels, copy=False)
+
+        positions = numpy.arange(len(labels))
+        if columns is not None:
+            positions = labels.get_indexer(columns)
+            if (positions < 0).any():
+                missing = [c for c, p in zip(columns, positions) if p < 0]
+                raise KeyError(f'Columns not found: {missing}')
+        specs = self.header['data']
+        data = {i: self.column(specs[p]) for i, p in enumerate(positions)}
+        table = pandas.DataFrame(data, index=index)
+        table.columns = labels[positions]
+        return table
+
+
+def is_columnar(data: Buffer) -> bool:
+    """Return whether a buffer starts with a columnar container."""
+    return bytes(memoryview(data)[:len(MAGIC)]) == MAGIC
+
+
+def loads(data: Buffer, columns: Optional[Sequence[Any]] = None) -> pandas.DataFrame:
+    """Deserialize a data frame (or a subset of its columns) from a columnar container.
+
+    Numeric data is not copied, so the returned frame keeps a reference to the
+    buffer and is read only when the buffer is.
+    """
+    return _Reader(data).table(columns)
+
+
+def write(path: Path, table: pandas.DataFrame):
+    """Atomically write a data frame to a columnar file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # concurrent writers (e.g. server processes converting on first access)
+    # must not share a partially written file
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(dumps(table))
+    os.replace(tmp, path)
+
+
+def reader(path: Path) -> _Reader:
+    """Memory-map a columnar file, e.g. to read several subsets of its columns."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('Not a columnar table')
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _Reader(buffer)
+
+
+def read(path: Path, columns: Optional[Sequence[Any]] = None) -> pandas.DataFrame:
+    """Read a data frame from a memory-mapped columnar file."""
+    return reader(path).table(columns)
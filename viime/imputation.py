@@ -1,19 +1,82 @@
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
 
+from flask import current_app
+import numpy as np
 import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import KNNImputer
 
+from viime.cache import cached, mangle_key
 from viime.opencpu import opencpu_request
 
 IMPUTE_MNAR_METHODS = ['zero', 'half-minimum']
 IMPUTE_MCAR_METHODS = ['random-forest', 'knn', 'mean', 'median']
 
+# missForest defaults
+RANDOM_FOREST_TREES = 100
+RANDOM_FOREST_MAX_ITERATIONS = 10
+# randomForest does not split regression nodes of 5 or fewer samples
+RANDOM_FOREST_MIN_SAMPLES_SPLIT = 6
+# trees of a forest are fit in this many independently seeded tasks, so the
+# result does not depend on the number of workers
+RANDOM_FOREST_TREE_CHUNKS = 4
+
+Imputer = Callable[[np.ndarray], np.ndarray]
+# column, predictor columns, number of trees, features per split and seed
+ForestTask = Tuple[int, np.ndarray, int, int, int]
+
 
 def impute_missing(table: pd.DataFrame, groups: pd.DataFrame,
                    mnar='zero', mcar='random-forest', p_mnar=0.7,
-                   p_mcar=0.4) -> Tuple[pd.DataFrame, Dict[str, List[str]]]:
+                   p_mcar=0.4, seed=0) -> Tuple[pd.DataFrame, Dict[str, List[str]]]:
+    """
+    Impute missing values the same way as ``imputation`` in impute.R.
+
+    Setting ``IMPUTATION_ENGINE`` to 'opencpu' computes random forest
+    imputations in R instead of in process.
+    """
+    return _impute_missing(table, groups, mnar, mcar, p_mnar, p_mcar, seed, _engine())
+
+
+def imputation_key(table: pd.DataFrame, groups: pd.DataFrame,
+                   mnar='zero', mcar='random-forest', p_mnar=0.7, p_mcar=0.4, seed=0) -> str:
+    """Return a key identifying the result of ``impute_missing`` for these arguments."""
+    key = _impute_missing.cache_key(  # type: ignore
+        table, groups, mnar, mcar, p_mnar, p_mcar, seed, _engine())
+    return mangle_key(key)
+
+
+def _engine() -> str:
+    return current_app.config.get('IMPUTATION_ENGINE') or 'local'
+
+
+@cached
+def _impute_missing(table: pd.DataFrame, groups: pd.DataFrame, mnar: str, mcar: str,
+                    p_mnar: float, p_mcar: float, seed: int,
+                    engine: str) -> Tuple[pd.DataFrame, Dict[str, List[str]]]:
+    if mnar not in MNAR_IMPUTERS:
+        raise ValueError(f'Invalid mnar method {mnar}')
+
+    if not table.isna().to_numpy().any():
+        return table.copy(), dict(mcar=[], mnar=[])
+
+    if mcar not in MCAR_IMPUTERS or (mcar == 'random-forest' and engine == 'opencpu'):
+        return impute_opencpu(table, groups, mnar, mcar, p_mnar, p_mcar)
+
+    f_mcar = MCAR_IMPUTERS[mcar]
+    if mcar == 'random-forest':
+        workers = int(current_app.config.get('IMPUTATION_WORKERS') or 1)
+        f_mcar = partial(impute_random_forest, seed=seed, workers=workers)
+    return impute_local(table, groups, MNAR_IMPUTERS[mnar], f_mcar, p_mnar, p_mcar)
+
+
+def impute_opencpu(table: pd.DataFrame, groups: pd.DataFrame, mnar: str, mcar: str,
+                   p_mnar: float, p_mcar: float) -> Tuple[pd.DataFrame, Dict[str, List[str]]]:
     files = {
-        'table': ('table.csv', table.to_csv().encode()),
-        'groups': ('groups.csv', groups.to_csv().encode())
+        'table': table,
+        'groups': groups
     }
     params = {
         'mnar': mnar,
@@ -38,3 +101,204 @@ def impute_missing(table: pd.DataFrame, groups: pd.DataFrame,
 
     output = output.rename(columns=renames)
     return output, info
+
+
+def classify_missing(values: np.ndarray, groups: pd.DataFrame, p_mnar: float,
+                     p_mcar: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Classify the columns by their fraction of missing values per group.
+
+    A column is MNAR if any group misses at least ``p_mnar`` of its values
+    and MCAR if all groups miss at most ``p_mcar`` of their values.
+    """
+    codes, uniques = pd.factorize(groups.iloc[:, 0])
+    missing = np.isnan(values)
+    fractions = np.vstack([missing[codes == code].mean(axis=0) for code in range(len(uniques))])
+    return (fractions >= p_mnar).any(axis=0), (fractions <= p_mcar).all(axis=0)
+
+
+def impute_local(table: pd.DataFrame, groups: pd.DataFrame, f_mnar: Imputer, f_mcar: Imputer,
+                 p_mnar: float, p_mcar: float) -> Tuple[pd.DataFrame, Dict[str, List[str]]]:
+    """Impute missing values in process the same way as ``imputation`` in impute.R."""
+    values = table.to_numpy(dtype=np.float64)
+    mnar, mcar = classify_missing(values, groups, p_mnar, p_mcar)
+
+    output = values.copy()
+    with np.errstate(invalid='ignore'):
+        if mnar.any():
+            output[:, mnar] = f_mnar(values[:, mnar])
+        if mcar.any():
+            # MNAR takes precedence for columns matching both criteria
+            output[:, mcar & ~mnar] = f_mcar(values[:, mcar])[:, ~mnar[mcar]]
+
+        # impute the remaining (missing at random) values using all columns
+        output = f_mcar(output)
+
+    columns = list(table.columns)
+    any_missing = np.isnan(values).any(axis=0)
+    info: Dict[str, List[str]] = dict(
+        mcar=[c for c, m in zip(columns, any_missing & ~mnar) if m],
+        mnar=[c for c, m in zip(columns, mnar) if m]
+    )
+    return pd.DataFrame(output, index=table.index, columns=table.columns), info
+
+
+def _fill_columns(values: np.ndarray, fill: np.ndarray) -> np.ndarray:
+    output = values.copy()
+    rows, columns = np.nonzero(np.isnan(output))
+    output[rows, columns] = fill[columns]
+    return output
+
+
+def impute_zero(values: np.ndarray) -> np.ndarray:
+    return np.where(np.isnan(values), 0.0, values)
+
+
+def impute_half_minimum(values: np.ndarray) -> np.ndarray:
+    # like R, the minimum of a column without values is infinite
+    return _fill_columns(values, np.fmin.reduce(values, axis=0, initial=np.inf) / 2)
+
+
+def impute_mean(values: np.ndarray) -> np.ndarray:
+    return _fill_columns(values, np.nanmean(values, axis=0))
+
+
+def impute_median(values: np.ndarray) -> np.ndarray:
+    return _fill_columns(values, np.nanmedian(values, axis=0))
+
+
+def impute_knn(values: np.ndarray, k: int = 10, rowmax: float = 0.5,
+               colmax: float = 0.8) -> np.ndarray:
+    """
+    Impute every column from its k nearest columns, following impute::impute.knn.
+
+    Columns (metabolites) missing more than ``rowmax`` of their values are
+    imputed with the per sample mean of all other columns instead.
+    """
+    data = values.T.copy()
+    missing = np.isnan(data)
+    if (missing.mean(axis=0) > colmax).any():
+        raise ValueError(f'a sample has more than {round(colmax * 100)}% missing values')
+
+    sparse = missing.mean(axis=1) > rowmax
+    if sparse.any():
+        data[sparse] = _fill_columns(data[sparse], np.nanmean(data[~sparse], axis=0))
+    dense = ~sparse & missing.any(axis=1)
+    if dense.any():
+        # KNNImputer drops samples without any value before scikit-learn 1.2's
+        # keep_empty_features, which imputes them with 0
+        empty = missing[~sparse].all(axis=0)
+        rows = data[~sparse]
+        rows[:, ~empty] = KNNImputer(n_neighbors=k).fit_transform(rows[:, ~empty])
+        rows[:, empty] = 0.0
+        data[~sparse] = rows
+    return data.T
+
+
+# the missing values shared with the worker processes of a forest imputation
+_shared_missing: Optional[np.ndarray] = None
+
+
+def _share(missing: np.ndarray):
+    global _shared_missing
+    _shared_missing = missing
+
+
+def _fit_trees(imputed: np.ndarray, missing: np.ndarray, task: ForestTask) -> np.ndarray:
+    """Fit trees on the observed rows of a column and predict its missing rows."""
+    column, predictors, trees, max_features, seed = task
+    observed = ~missing[:, column]
+    x = imputed[:, predictors]
+    forest = RandomForestRegressor(
+        n_estimators=trees, max_features=max_features,
+        min_samples_split=RANDOM_FOREST_MIN_SAMPLES_SPLIT, random_state=seed
+    )
+    forest.fit(x[observed], imputed[observed, column])
+    return forest.predict(x[~observed])
+
+
+def _fit_shared_trees(imputed: np.ndarray, task: ForestTask) -> np.ndarray:
+    assert _shared_missing is not None
+    return _fit_trees(imputed, _shared_missing, task)
+
+
+def impute_random_forest(values: np.ndarray, seed: int = 0, workers: int = 1,
+                         trees: int = RANDOM_FOREST_TREES,
+                         max_iterations: int = RANDOM_FOREST_MAX_ITERATIONS) -> np.ndarray:
+    """
+    Impute missing values like missForest.
+
+    Starting from a mean imputation, every column with missing values is
+    regressed on all other columns with a random forest until the change
+    between two iterations increases.  As in missForest's variable wise
+    parallelization, all columns of an iteration are fit on the previous
+    imputation, so the forests can be fit in a pool of ``workers`` processes,
+    which is started once per imputation.  The result only depends on
+    ``seed``.
+    """
+    missing = np.isnan(values)
+    # columns without any value can neither be predicted nor used as predictors
+    usable = ~missing.all(axis=0)
+    counts = missing.sum(axis=0)
+    columns = [c for c in np.argsort(counts, kind='stable') if counts[c] and usable[c]]
+    max_features = max(1, int(np.sqrt(values.shape[1])))
+    chunks = min(RANDOM_FOREST_TREE_CHUNKS, trees)
+
+    imputed = impute_mean(values)
+    if not columns or usable.sum() < 2:
+        return imputed
+
+    tasks: List[Tuple[int, np.ndarray, int, int]] = []
+    for column in columns:
+        predictors = np.nonzero(usable & (np.arange(values.shape[1]) != column))[0]
+        features = min(max_features, len(predictors))
+        for chunk in range(chunks):
+            tasks.append((column, predictors, len(range(chunk, trees, chunks)), features))
+
+    # the processes are started once and only receive the current imputation
+    # with every chunk of tasks
+    pool = ProcessPoolExecutor(workers, initializer=_share, initargs=(missing,)) \
+        if workers > 1 else None
+    chunksize = -(-len(tasks) // workers)
+    try:
+        previous_change = np.inf
+        for iteration in range(max_iterations):
+            seeds = np.random.default_rng([seed, iteration]).integers(2 ** 31, size=len(tasks))
+            iteration_tasks: List[ForestTask] = [
+                (column, predictors, chunk_trees, features, int(chunk_seed))
+                for (column, predictors, chunk_trees, features), chunk_seed in zip(tasks, seeds)
+            ]
+            if pool is not None:
+                predictions = list(pool.map(partial(_fit_shared_trees, imputed),
+                                            iteration_tasks, chunksize=chunksize))
+            else:
+                predictions = [_fit_trees(imputed, missing, task) for task in iteration_tasks]
+
+            previous, imputed = imputed, imputed.copy()
+            for i, column in enumerate(columns):
+                weights = [task[2] for task in tasks[i * chunks:(i + 1) * chunks]]
+                imputed[missing[:, column], column] = np.average(
+                    predictions[i * chunks:(i + 1) * chunks], axis=0, weights=weights)
+
+            change = np.square(imputed[:, usable] - previous[:, usable]).sum() / \
+                np.square(imputed[:, usable]).sum()
+            if change >= previous_change:
+                return previous
+            previous_change = change
+        return imputed
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+MNAR_IMPUTERS: Dict[str, Imputer] = {
+    'zero': impute_zero,
+    'half-minimum': impute_half_minimum
+}
+
+MCAR_IMPUTERS: Dict[str, Imputer] = {
+    'random-forest': impute_random_forest,
+    'knn': impute_knn,
+    'mean': impute_mean,
+    'median': impute_median
+}
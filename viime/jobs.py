@@ -0,0 +1,158 @@
+"""
+This module contains a database backed queue of long running requests.
+
+Routes decorated with ``views.queueable`` enqueue a job when called with
+``?async=1``.  Jobs are computed by ``viime-cli worker`` processes, which
+replay the request in their own app and store its response in the job.
+"""
+from datetime import datetime, timedelta
+from hashlib import sha256
+import json
+import os
+import socket
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app, Flask
+from sqlalchemy import and_, LargeBinary, or_
+
+from viime.models import BaseModel, CSVFile, db, Job, JOB_STATUSES, ValidatedMetaboliteTable
+
+# seconds after which the job of a worker that died is run again
+DEFAULT_JOB_TIMEOUT = 60 * 60
+# seconds for which the results of finished jobs are kept
+DEFAULT_JOB_RETENTION = 7 * 24 * 60 * 60
+DEFAULT_POLL_INTERVAL = 1.0
+# seconds between two prunes of an idle worker
+PRUNE_INTERVAL = 10 * 60
+
+
+def _row_state(row: Optional[BaseModel]) -> Optional[Dict[str, Any]]:
+    # table blobs are represented by their fingerprints
+    if row is None:
+        return None
+    return {
+        column.key: getattr(row, column.key) for column in row.__table__.columns
+        if not isinstance(column.type, LargeBinary)
+    }
+
+
+def job_key(csv_id: str, path: str, query_string: str) -> str:
+    """Return a key identifying the response to a request given the current csv file."""
+    state = [
+        path,
+        sorted(query_string.split('&')),
+        _row_state(CSVFile.query.get(csv_id)),
+        _row_state(ValidatedMetaboliteTable.query.filter_by(csv_file_id=csv_id).first())
+    ]
+    return sha256(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def enqueue(csv_id: str, endpoint: str, path: str, query_string: str) -> Job:
+    """Queue a request, unless a job with the same inputs is pending or done."""
+    key = job_key(csv_id, path, query_string)
+    job = Job.query.filter(Job.key == key, Job.status != JOB_STATUSES.FAILED) \
+        .order_by(Job.created.desc()).first()
+    if job is None:
+        job = Job(csv_file_id=csv_id, key=key, endpoint=endpoint, path=path,
+                  query_string=query_string, status=JOB_STATUSES.QUEUED)
+        db.session.add(job)
+        db.session.commit()
+    return job
+
+
+def claim(worker: str) -> Optional[Job]:
+    """
+    Mark the oldest queued job as running by the given worker and return it.
+
+    A job is claimed with a conditional update, so concurrent workers never
+    run the same job.  Jobs running for longer than JOB_TIMEOUT are claimed
+    again.
+    """
+    timeout = float(current_app.config.get('JOB_TIMEOUT') or DEFAULT_JOB_TIMEOUT)
+    now = datetime.utcnow()
+    lost = and_(Job.status == JOB_STATUSES.RUNNING, Job.started < now - timedelta(seconds=timeout))
+    candidates = db.session.query(Job.id, Job.status, Job.started) \
+        .filter(or_(Job.status == JOB_STATUSES.QUEUED, lost)) \
+        .order_by(Job.created).limit(10).all()
+
+    for job_id, status, started in candidates:
+        claimed = Job.query.filter_by(id=job_id, status=status, started=started).update({
+            'status': JOB_STATUSES.RUNNING,
+            'started': now,
+            'worker': worker
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return Job.query.get(job_id)
+    return None
+
+
+def run_job(app: Flask, job: Job):
+    """Replay the request of a job and store its response."""
+    job_id = job.id
+    values: Dict[str, Any]
+    try:
+        with app.test_request_context(job.path, query_string=job.query_string):
+            response = app.full_dispatch_request()
+            response.direct_passthrough = False
+            values = {
+                'status': JOB_STATUSES.FAILED if response.status_code >= 500
+                else JOB_STATUSES.DONE,
+                'result_status': response.status_code,
+                'result_mimetype': response.mimetype,
+                'result_bytes': response.get_data()
+            }
+    except Exception as e:
+        app.logger.exception(f'job {job_id} failed')
+        db.session.rollback()
+        values = {
+            'status': JOB_STATUSES.FAILED,
+            'error': str(e) or type(e).__name__
+        }
+    values['finished'] = datetime.utcnow()
+    Job.query.filter_by(id=job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def prune(retention: Optional[float] = None) -> int:
+    """
+    Delete the done and failed jobs that finished more than JOB_RETENTION seconds ago.
+
+    Returns the number of deleted jobs.
+    """
+    if retention is None:
+        retention = float(current_app.config.get('JOB_RETENTION') or DEFAULT_JOB_RETENTION)
+    expired = datetime.utcnow() - timedelta(seconds=retention)
+    deleted = Job.query.filter(
+        Job.status.in_([JOB_STATUSES.DONE, JOB_STATUSES.FAILED]),
+        Job.finished < expired
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def work(app: Flask, once: bool = False,
+         poll_interval: float = DEFAULT_POLL_INTERVAL) -> int:
+    """
+    Run queued jobs until interrupted, or until the queue is empty with ``once``.
+
+    Returns the number of jobs that were run.
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    count = 0
+    pruned = time.monotonic() - PRUNE_INTERVAL
+    with app.app_context():
+        while True:
+            job = claim(worker)
+            if job is None:
+                if once:
+                    return count
+                if time.monotonic() - pruned >= PRUNE_INTERVAL:
+                    prune()
+                    pruned = time.monotonic()
+                time.sleep(poll_interval)
+                continue
+            run_job(app, job)
+            db.session.remove()
+            count += 1
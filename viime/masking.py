@@ -6,8 +6,8 @@ from viime.opencpu import opencpu_request
 def mask_columns_by_group(table: pd.DataFrame, groups: pd.DataFrame,
                           threshold: float) -> pd.DataFrame:
     files = {
-        'table': ('table.csv', table.to_csv().encode()),
-        'groups': ('groups.csv', groups.to_csv().encode())
+        'table': table,
+        'groups': groups
     }
     params = {
         'threshold': threshold
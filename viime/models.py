@@ -1,9 +1,11 @@
 from collections import namedtuple
 from datetime import datetime
+from functools import partial
 from io import BytesIO
 from pathlib import Path
 import pickle
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, \
+    Union
 from uuid import uuid4
 
 from flask import current_app
@@ -15,17 +17,25 @@ from marshmallow.exceptions import ValidationError
 import numpy
 import pandas
 from sqlalchemy import MetaData
-from sqlalchemy.orm import relationship
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import relationship, undefer
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy_utils.types.json import JSONType
 from sqlalchemy_utils.types.uuid import UUIDType
 from werkzeug.utils import secure_filename
 
+from viime import blob_store, columnar
+from viime.cache import defer, Deferred, derive_fingerprint, fingerprint_bytes, \
+    get_fingerprint, tag_fingerprint
 from viime.colors import category10
-from viime.imputation import IMPUTE_MCAR_METHODS, impute_missing, IMPUTE_MNAR_METHODS
+from viime.imputation import imputation_key, IMPUTE_MCAR_METHODS, impute_missing, \
+    IMPUTE_MNAR_METHODS
 from viime.normalization import NORMALIZATION_METHODS, normalize
 from viime.scaling import scale, SCALING_METHODS
-from viime.table_validation import get_fatal_index_errors, get_validation_list
+from viime.slicing import typed_slice
+from viime.table_stats import nanvar, table_stats, to_numeric
+from viime.table_validation import get_fatal_index_errors, get_validation_list, \
+    update_validation_state
 from viime.transformation import transform, TRANSFORMATION_METHODS
 
 
@@ -45,10 +55,12 @@ AxisNameTypes = namedtuple('AxisNameTypes', ['ROW', 'COLUMN'])
 TableColumnTypes = namedtuple('TableTypes', ['INDEX', 'METADATA', 'DATA', 'MASK', 'GROUP'])
 TableRowTypes = namedtuple('TableTypes', ['INDEX', 'METADATA', 'DATA', 'MASK'])
 MetaDataTypes = namedtuple('MetaDataTypes', ['CATEGORICAL', 'NUMERICAL', 'ORDINAL'])
+JobStatuses = namedtuple('JobStatuses', ['QUEUED', 'RUNNING', 'DONE', 'FAILED'])
 TABLE_COLUMN_TYPES = TableColumnTypes('key', 'metadata', 'measurement', 'masked', 'group')
 TABLE_ROW_TYPES = TableRowTypes('header', 'metadata', 'sample', 'masked')
 AXIS_NAME_TYPES = AxisNameTypes('row', 'column')
 METADATA_TYPES = MetaDataTypes('categorical', 'numerical', 'ordinal')
+JOB_STATUSES = JobStatuses('queued', 'running', 'done', 'failed')
 
 T = TypeVar('T')
 
@@ -58,18 +70,39 @@ def clean(df: pandas.DataFrame) -> pandas.DataFrame:
         .replace([numpy.Inf, -numpy.Inf], ['Inf', '-Inf'])
 
 
-def _guess_table_structure(table: pandas.DataFrame) -> Tuple[List[str], List[str]]:
+def _sample_indices(size: int, sample_size: Optional[int],
+                    rng: numpy.random.Generator) -> Union[slice, numpy.ndarray]:
+    if not sample_size or size <= sample_size:
+        return slice(None)
+    return numpy.sort(rng.choice(size, sample_size, replace=False))
+
+
+def _guess_table_structure(table: pandas.DataFrame,
+                           sample_size: Optional[int] = None) -> Tuple[List[str], List[str]]:
     """Infer table structure by inspecting data.
 
     For simplicity, this method assumes the key row/column is always first.  This
     appears to be true for the vast majority of cases.
+
+    With a ``sample_size``, the variance of a row (column) is computed from at
+    most that many randomly chosen columns (rows).  This bounds the work for
+    huge tables, but sparse rows or columns may be masked.
     """
     rows: List[str] = [TABLE_ROW_TYPES.INDEX]
     columns: List[str] = [TABLE_COLUMN_TYPES.INDEX]
 
+    block = table.iloc[1:, 1:]
+    rng = numpy.random.default_rng(0)
+    column_sample = _sample_indices(block.shape[1], sample_size, rng)
+    row_sample = _sample_indices(block.shape[0], sample_size, rng)
+    row_values = to_numeric(block.iloc[:, column_sample])
+    if isinstance(column_sample, slice) and isinstance(row_sample, slice):
+        column_values = row_values
+    else:
+        column_values = to_numeric(block.iloc[row_sample, :])
+
     # mask any row that is either all strings (or nan's) or has 0 variance
-    for i in range(1, table.shape[0]):
-        row_variance = pandas.to_numeric(table.iloc[i, 1:], errors='coerce').var()
+    for row_variance in nanvar(row_values):
         if row_variance != row_variance or row_variance == 0:
             rows.append(TABLE_ROW_TYPES.MASK)
         else:
@@ -78,8 +111,7 @@ def _guess_table_structure(table: pandas.DataFrame) -> Tuple[List[str], List[str
     # mask any column that is either all strings (or nan's) or has 0 variance
     # the first such column is marked as the group
     has_group = False
-    for i in range(1, table.shape[1]):
-        column_variance = pandas.to_numeric(table.iloc[1:, i], errors='coerce').var()
+    for column_variance in nanvar(numpy.ascontiguousarray(column_values.T)):
         if column_variance != column_variance and not has_group:
             has_group = True
             columns.append(TABLE_COLUMN_TYPES.GROUP)
@@ -96,6 +128,10 @@ def _guess_table_structure(table: pandas.DataFrame) -> Tuple[List[str], List[str
     return rows, columns
 
 
+def _columnar_uri(uri: Path) -> Path:
+    return uri.with_suffix('.columnar')
+
+
 class BaseSchema(Schema):
     __model__ = None
 
@@ -135,6 +171,8 @@ class CSVFile(BaseModel):
     meta = db.Column(JSONType, nullable=False)
     selected_columns = db.Column(db.PickleType, nullable=True)
     group_levels = relationship('GroupLevel', cascade='all, delete, delete-orphan, expunge')
+    imputation_results = relationship('ImputationResult', cascade='all, delete-orphan')
+    jobs = relationship('Job', cascade='all, delete-orphan')
 
     sample_group = db.Column(db.String, nullable=True)
     sample_group_obj = relationship('SampleGroup', backref='files',
@@ -145,6 +183,25 @@ class CSVFile(BaseModel):
     column_json = db.Column(JSONType, nullable=False, default=list)
     row_json = db.Column(JSONType, nullable=False, default=list)
 
+    # incremented whenever the table data or the row/column types change
+    table_version = db.Column(db.Integer, nullable=False, default=0)
+    # content fingerprint of the csv data, used to key cached results
+    fingerprint = db.Column(db.String(32), nullable=True)
+    # per row and per column statistics of the validation checks
+    validation_json = db.deferred(db.Column(JSONType, nullable=True))
+
+    def bump_table_version(self):
+        self.table_version = (self.table_version or 0) + 1
+
+    def _memo(self) -> Dict[str, Any]:
+        """Return the parsed table cache of this instance for the current table version."""
+        key = (str(self.id), self.table_version or 0)
+        memo = getattr(self, '_table_memo', None)
+        if memo is None or memo['key'] != key:
+            memo = {'key': key, 'table': None, 'reader': None, 'slices': {}}
+            self._table_memo = memo
+        return memo
+
     @property
     def columns(self):
         if self.column_json is not None:
@@ -172,7 +229,34 @@ class CSVFile(BaseModel):
 
     @property
     def table(self):
-        return pandas.read_csv(self.uri, index_col=None, header=None)
+        return self._memoized_table().copy()
+
+    def _memoized_table(self) -> pandas.DataFrame:
+        """Return the shared parsed table, callers must not modify it."""
+        memo = self._memo()
+        if memo['table'] is None:
+            try:
+                memo['table'] = columnar.read(self.columnar_uri)
+            except (FileNotFoundError, ValueError):
+                # files uploaded before the columnar copy existed are converted on first access
+                memo['table'] = self._save_columnar_data(self.uri)
+        return memo['table']
+
+    def _typed_slice(self, rows: List[int], columns: List[int]) -> pandas.DataFrame:
+        """Slice the parsed table, reading only the given columns unless most are needed."""
+        memo = self._memo()
+        labels = sorted(set(columns))
+        if memo['table'] is None and len(labels) * 2 < len(self.columns):
+            try:
+                if memo['reader'] is None:
+                    memo['reader'] = columnar.reader(self.columnar_uri)
+                grid = memo['reader'].table(labels)
+            except (FileNotFoundError, KeyError, ValueError):
+                pass
+            else:
+                positions = {label: i for i, label in enumerate(labels)}
+                return typed_slice(grid, rows, [positions[c] for c in columns])
+        return typed_slice(self._memoized_table(), rows, columns)
 
     @property
     def indexed_table(self):
@@ -238,6 +322,18 @@ class CSVFile(BaseModel):
         """Return the metabolite data table before transformation."""
         return self.filter_table_by_types(TABLE_ROW_TYPES.DATA, TABLE_COLUMN_TYPES.DATA)
 
+    def raw_measurement_columns(self, column_indices: List[int]) -> pandas.DataFrame:
+        """Return the given columns of the data rows, parsed like ``raw_measurement_table``."""
+        rows = [self.header_row_index] + [
+            row['row_index'] for row in self.rows if row['row_type'] == TABLE_ROW_TYPES.DATA
+        ]
+        return self._typed_slice(rows, [self.key_column_index] + column_indices)
+
+    def raw_header_cells(self, column_indices: List[int]) -> pandas.Series:
+        """Return the header row of the given columns parsed as data."""
+        rows = [self.header_row_index] * 2
+        return self._typed_slice(rows, [self.key_column_index] + column_indices).iloc[0, :]
+
     @property
     def groups(self):
         """Return a table containing the primary grouping column."""
@@ -246,14 +342,22 @@ class CSVFile(BaseModel):
         groups = self.filter_table_by_types(TABLE_ROW_TYPES.DATA, TABLE_COLUMN_TYPES.GROUP)
         if groups is None:
             return None
+        fingerprint = get_fingerprint(groups)
         # ensure groups are strings
-        return groups.fillna('').astype(str)
+        groups = groups.fillna('').astype(str)
+        if fingerprint is not None:
+            tag_fingerprint(groups, derive_fingerprint(fingerprint, 'str'))
+        return groups
 
     @property
     def uri(self) -> Path:
         id = str(self.id)
         return Path(current_app.config['UPLOAD_FOLDER']) / id[:3] / id
 
+    @property
+    def columnar_uri(self) -> Path:
+        return _columnar_uri(self.uri)
+
     @property
     def size(self) -> int:
         return Path(self.uri).stat().st_size
@@ -266,6 +370,7 @@ class CSVFile(BaseModel):
 
     @header_row_index.setter  # type: ignore
     def header_row_index(self, value: Optional[int]):
+        self.bump_table_version()
         if self.header_row_index is not None:
             old_row = self.rows[self.header_row_index]
             old_row['row_type'] = TABLE_ROW_TYPES.METADATA
@@ -286,10 +391,10 @@ class CSVFile(BaseModel):
         idx = self.header_row_index or header_row_index
         if idx is None:
             return [
-                f'col{i + 1}' for i in range(self.table.shape[1])
+                f'col{i + 1}' for i in range(self._memoized_table().shape[1])
             ]
 
-        return list(self.table.iloc[idx, :])
+        return list(self._memoized_table().iloc[idx, :])
 
     @property
     def key_column_index(self):
@@ -299,6 +404,7 @@ class CSVFile(BaseModel):
 
     @key_column_index.setter  # type: ignore
     def key_column_index(self, value: Optional[int]):
+        self.bump_table_version()
         columns = self.columns
         if self.key_column_index is not None:
             old_column = columns[self.key_column_index]
@@ -320,6 +426,7 @@ class CSVFile(BaseModel):
 
     @group_column_index.setter  # type: ignore
     def group_column_index(self, value: Optional[int]):
+        self.bump_table_version()
         columns = self.columns
         if self.group_column_index is not None:
             old_column = columns[self.group_column_index]
@@ -354,9 +461,9 @@ class CSVFile(BaseModel):
         idx = self.key_column_index or key_column_index
         if idx is None:
             return [
-                f'row{i + 1}' for i in range(self.table.shape[0])
+                f'row{i + 1}' for i in range(self._memoized_table().shape[0])
             ]
-        return list(self.table.iloc[:, idx])
+        return list(self._memoized_table().iloc[:, idx])
 
     def filter_table_by_types(self, row_type, column_type):
         if self.header_row_index is None or \
@@ -366,26 +473,23 @@ class CSVFile(BaseModel):
             row['row_index'] for row in self.rows
             if row['row_type'] == row_type
         ]
-        if self.header_row_index is not None:
-            rows = [self.header_row_index] + rows
-        else:
-            current_app.logger.warning('No header row is set.')
+        # the header row and key column become the header and index of the slice
+        rows = [self.header_row_index] + rows
 
         columns = [
             column['column_index'] for column in self.columns
             if column['column_type'] == column_type
         ]
-        if self.key_column_index is not None:
-            index_col = 0
-            columns = [self.key_column_index] + columns
-        else:
-            index_col = None
-
-        return pandas.read_csv(
-            BytesIO(
-                self.table.iloc[rows, columns].to_csv(header=False, index=False).encode()
-            ), index_col=index_col
-        )
+        columns = [self.key_column_index] + columns
+
+        slices = self._memo()['slices']
+        key = (row_type, column_type, tuple(rows), tuple(columns))
+        if key not in slices:
+            slices[key] = self._typed_slice(rows, columns)
+        table = slices[key].copy()
+        if self.fingerprint is not None:
+            tag_fingerprint(table, derive_fingerprint(self.fingerprint, *key))
+        return table
 
     @property
     def missing_cells(self) -> List[Tuple[int, int]]:
@@ -393,28 +497,40 @@ class CSVFile(BaseModel):
         col, row = numpy.nonzero(table.isna().to_numpy())
         return numpy.column_stack((row, col)).astype(int).tolist()
 
-    def apply_transforms(self) -> pandas.DataFrame:
-        table = self.raw_measurement_table
+    def apply_transforms(self) -> Tuple[pandas.DataFrame, Dict[str, List[str]]]:
         table = self._coerce_numeric()
-        return impute_missing(table, self.groups,
-                              mnar=self.imputation_mnar, mcar=self.imputation_mcar)
+        groups = self.groups
+
+        # the key changes with the table content, its labels and the imputation options
+        key = imputation_key(table, groups, mnar=self.imputation_mnar, mcar=self.imputation_mcar)
+        stored = ImputationResult.load(self.id, key)
+        if stored is not None:
+            return stored
+
+        table, info = impute_missing(table, groups,
+                                     mnar=self.imputation_mnar, mcar=self.imputation_mcar)
+        ImputationResult.store(self.id, key, table, info)
+        return table, info
 
     def save_table(self, table: pandas.DataFrame, **kwargs):
-        # TODO: Delete cache entries if a file at self.uri exists already
-        # For now, there is no API for changing the data contained in an uploaded
-        # file, so this is not important.
-        return self._save_csv_file_data(self.uri, table.to_csv(**kwargs))
+        self.bump_table_version()
+        table_data = table.to_csv(**kwargs)
+        self.fingerprint = fingerprint_bytes(table_data.encode())
+        return self._save_csv_file_data(self.uri, table_data)
 
     @property
-    def _stats(self):
+    def stats(self):
+        """Return the statistics of every measurement row and column (see ``table_stats``)."""
         if self.raw_measurement_table is not None:
             return self._get_table_stats()
 
     @classmethod
     def create_csv_file(cls, id: str, name: str, table: str, **kwargs):
-        csv_file = cls(id=id, name=name, **kwargs)
+        csv_file = cls(id=id, name=name, fingerprint=fingerprint_bytes(table.encode()), **kwargs)
         cls._save_csv_file_data(csv_file.uri, table)
-        row_types, column_types = _guess_table_structure(csv_file.table)
+        sample_size = current_app.config.get('TABLE_GUESS_SAMPLE_SIZE')
+        row_types, column_types = _guess_table_structure(
+            csv_file.table, int(sample_size) if sample_size else None)
 
         header_row_index = row_types.index(TABLE_ROW_TYPES.INDEX)
         headers = csv_file._headers(header_row_index)
@@ -460,6 +576,7 @@ class CSVFile(BaseModel):
         csv_file.row_json = table_row_schema.dump(rows, many=True)
 
         csv_file.derive_group_levels()
+        update_validation_state(csv_file)
         return csv_file, rows, columns
 
     @classmethod
@@ -467,8 +584,21 @@ class CSVFile(BaseModel):
         uri.parent.mkdir(parents=True, exist_ok=True)
         with open(uri, 'w') as f:
             f.write(table_data)
+        cls._save_columnar_data(uri)
         return table_data
 
+    @classmethod
+    def _save_columnar_data(cls, uri: Path) -> pandas.DataFrame:
+        """Parse the csv file once and store it in a columnar format next to it."""
+        table = pandas.read_csv(uri, index_col=None, header=None)
+        columnar.write(_columnar_uri(uri), table)
+        return table
+
+    def delete_files(self):
+        for uri in (self.uri, self.columnar_uri):
+            if uri.is_file():
+                uri.unlink()
+
     def get_column_by_name(self, column_name: str):
         return self.find_first_entity(lambda c: c['column_header'] == column_name, self.columns)
 
@@ -484,46 +614,18 @@ class CSVFile(BaseModel):
         return None
 
     def _get_table_stats(self):
-        table = self.raw_measurement_table
-        # Get global stats all once because it is more efficient than
-        # doing it per row/column.
-
-        # Once validation is done on indices we can get variance with:
-        #   table.var(axis=?).to_list()
-        # for now we need to do it per row/column
-        def get_variance(series):
-            return pandas.to_numeric(series, errors='coerce').var()
-
-        def get_nan(series):
-            s = pandas.to_numeric(series, errors='coerce')
-            return (s != s).sum() / s.shape[0]
-
-        column_missing = [get_nan(table.iloc[:, i]) for i in range(table.shape[1])]
-        column_variance = [get_variance(table.iloc[:, i]) for i in range(table.shape[1])]
-        row_missing = [get_nan(table.iloc[i, :]) for i in range(table.shape[0])]
-        row_variance = [get_variance(table.iloc[i, :]) for i in range(table.shape[0])]
-        return {
-            'columns': {
-                'missing': column_missing,
-                'variance': column_variance
-            },
-            'rows': {
-                'missing': row_missing,
-                'variance': row_variance
-            }
-        }
+        return table_stats(self.raw_measurement_table)
 
     def _coerce_numeric(self) -> pandas.DataFrame:
         """Coerce a table into numeric values."""
         table = self.raw_measurement_table
+        fingerprint = get_fingerprint(table)
         for i in range(table.shape[1]):
             table.iloc[:, i] = pandas.to_numeric(table.iloc[:, i], errors='coerce')
+        if fingerprint is not None:
+            tag_fingerprint(table, derive_fingerprint(fingerprint, 'numeric'))
         return table
 
-    def _get_csv_file_stats(self):
-        if self.raw_measurement_table is not None:
-            return self._get_table_stats()
-
 
 def _validate_table_data(table: str):
     try:
@@ -564,9 +666,8 @@ class CSVFileSchema(BaseSchema):
 
     @post_dump
     def read_csv_file(self, data, **kwargs):
-        if 'table' not in data:
-            return data
-        data['table'] = data['table'].to_csv(header=False, index=False)
+        if 'table' in data:
+            data['table'] = data['table'].to_csv(header=False, index=False)
         if data.get('measurement_table') is not None:
             data['measurement_table'] = clean(data['measurement_table']).to_dict(
                 orient='split')
@@ -579,6 +680,42 @@ class CSVFileSchema(BaseSchema):
         return csv_file
 
 
+class ImputationResult(BaseModel):
+    """The imputed measurements of a csv file, valid as long as the key matches."""
+    csv_file_id = db.Column(UUIDType(binary=False),
+                            db.ForeignKey('csv_file.id', ondelete='CASCADE'), primary_key=True)
+    key = db.Column(db.String(64), nullable=False)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    table_bytes = db.Column(db.LargeBinary, nullable=False)
+    info = db.Column(JSONType, nullable=False)
+
+    @classmethod
+    def load(cls, csv_file_id, key: str
+             ) -> Optional[Tuple[pandas.DataFrame, Dict[str, List[str]]]]:
+        row = db.session.query(cls.table_bytes, cls.info) \
+            .filter_by(csv_file_id=csv_file_id, key=key).first()
+        if row is None:
+            return None
+        table = tag_fingerprint(columnar.loads(row.table_bytes), derive_fingerprint(key, 0))
+        return table, row.info
+
+    @classmethod
+    def store(cls, csv_file_id, key: str, table: pandas.DataFrame, info: Dict[str, List[str]]):
+        """Replace the stored result of a csv file.
+
+        The result is written in a savepoint of the current transaction, so
+        that a failure to store it does not abort the request.  It is kept
+        once the request commits.
+        """
+        result = cls(csv_file_id=csv_file_id, key=key, created=datetime.utcnow(),
+                     table_bytes=columnar.dumps(table), info=info)
+        try:
+            with db.session.begin_nested():
+                db.session.merge(result)
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f'Could not store the imputed measurements: {e}')
+
+
 class SampleGroup(BaseModel):
     __allow_unmapped__ = True
     name = db.Column(db.String, primary_key=True)
@@ -636,6 +773,16 @@ class ModifyLabelListSchema(Schema):
     changes = fields.List(fields.Nested(ModifyLabelChangesSchema), required=True)
 
 
+# tables of a ValidatedMetaboliteTable stored as serialized blobs
+TABLE_BLOBS = ['raw_measurements', 'measurement_metadata', 'sample_metadata', 'groups']
+# derived tables and the stored tables they read directly, the measurements
+# pipeline loads its inputs only when a stage is not cached (see deferred_table)
+TABLE_DEPENDENCIES = {
+    'measurements': [],
+    'table': ['measurement_metadata', 'sample_metadata', 'groups']
+}
+
+
 class ValidatedMetaboliteTable(BaseModel):
     id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid4)
     created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -649,18 +796,82 @@ class ValidatedMetaboliteTable(BaseModel):
     imputation_info = db.Column(JSONType, nullable=True)
     meta = db.Column(JSONType, nullable=False)
 
-    raw_measurements_bytes = db.Column(db.LargeBinary, nullable=False)
-    measurement_metadata_bytes = db.Column(db.LargeBinary, nullable=False)
-    sample_metadata_bytes = db.Column(db.LargeBinary, nullable=False)
-    groups_bytes = db.Column(db.LargeBinary, nullable=False)
+    # tables are either stored inline or as a digest into the blob store,
+    # inline blobs are only loaded when accessed (see query_tables)
+    raw_measurements_bytes = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    measurement_metadata_bytes = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    sample_metadata_bytes = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    groups_bytes = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    raw_measurements_digest = db.Column(db.String(64), nullable=True)
+    measurement_metadata_digest = db.Column(db.String(64), nullable=True)
+    sample_metadata_digest = db.Column(db.String(64), nullable=True)
+    groups_digest = db.Column(db.String(64), nullable=True)
+    # content fingerprints of the stored tables by name, used to key cached results
+    fingerprints = db.Column(JSONType, nullable=True)
 
     @classmethod
     def serialize_table(cls, table: pandas.DataFrame) -> bytes:
-        return pickle.dumps(table)
+        return columnar.dumps(table)
 
     @classmethod
-    def deserialize_table(cls, blob: bytes) -> pandas.DataFrame:
-        return pickle.loads(blob)
+    def deserialize_table(cls, blob: columnar.Buffer, columns: Optional[List[Any]] = None
+                          ) -> pandas.DataFrame:
+        if not columnar.is_columnar(blob):
+            # tables stored before the columnar format was introduced
+            table = pickle.loads(blob)
+            return table if columns is None else table.loc[:, columns]
+        return columnar.loads(blob, columns)
+
+    def store_table(self, name: str, table: pandas.DataFrame):
+        blob = self.serialize_table(table)
+        self.fingerprints = dict(self.fingerprints or {}, **{name: fingerprint_bytes(blob)})
+        if blob_store.enabled():
+            setattr(self, f'{name}_digest', blob_store.put(blob))
+            setattr(self, f'{name}_bytes', None)
+        else:
+            setattr(self, f'{name}_digest', None)
+            setattr(self, f'{name}_bytes', blob)
+
+    def load_table(self, name: str, columns: Optional[List[Any]] = None) -> pandas.DataFrame:
+        digest = getattr(self, f'{name}_digest')
+        blob = blob_store.get(digest) if digest is not None else getattr(self, f'{name}_bytes')
+        table = self.deserialize_table(blob, columns)
+
+        # rows stored before fingerprints were introduced are fingerprinted on load
+        fingerprint = (self.fingerprints or {}).get(name) or fingerprint_bytes(blob)
+        if columns is not None:
+            fingerprint = derive_fingerprint(fingerprint, tuple(columns))
+        return tag_fingerprint(table, fingerprint)
+
+    def deferred_table(self, name: str) -> Union[Deferred, pandas.DataFrame]:
+        """Return a stored table that is only loaded when it is needed."""
+        fingerprint = (self.fingerprints or {}).get(name)
+        if fingerprint is None:
+            return getattr(self, name)
+        return Deferred(fingerprint, partial(getattr, self, name))
+
+    @classmethod
+    def query_tables(cls, *tables: str):
+        """Return a query loading the blobs of the given tables along with the row.
+
+        All other blobs are deferred until they are accessed.
+        """
+        blobs: Set[str] = set()
+        for table in tables:
+            if table in TABLE_DEPENDENCIES:
+                blobs.update(TABLE_DEPENDENCIES[table])
+            elif table in TABLE_BLOBS:
+                blobs.add(table)
+            else:
+                raise ValueError(f'Unknown table {table}')
+        return cls.query.options(*[undefer(getattr(cls, f'{name}_bytes')) for name in blobs])
+
+    @classmethod
+    def referenced_digests(cls) -> Set[str]:
+        """Return the digests of all tables stored in the blob store."""
+        columns = [getattr(cls, f'{name}_digest') for name in TABLE_BLOBS]
+        rows = db.session.query(*columns).filter(db.or_(*[c.isnot(None) for c in columns]))
+        return {digest for row in rows for digest in row if digest is not None}
 
     @classmethod
     def create_from_csv_file(cls, csv_file: CSVFile, **kwargs):
@@ -672,43 +883,43 @@ class ValidatedMetaboliteTable(BaseModel):
             'csv_file_id': csv_file.id,
             'name': csv_file.name,
             'meta': csv_file.meta.copy(),
-            'raw_measurements_bytes': cls.serialize_table(table),
-            'imputation_info': info,
-            'measurement_metadata_bytes': cls.serialize_table(csv_file.measurement_metadata),
-            'sample_metadata_bytes': cls.serialize_table(csv_file.sample_metadata),
-            'groups_bytes': cls.serialize_table(csv_file.groups)
+            'imputation_info': info
         }
         attributes.update(kwargs)
-        return cls(**attributes)
+        validated_table = cls(**attributes)
+        validated_table.store_table('raw_measurements', table)
+        validated_table.store_table('measurement_metadata', csv_file.measurement_metadata)
+        validated_table.store_table('sample_metadata', csv_file.sample_metadata)
+        validated_table.store_table('groups', csv_file.groups)
+        return validated_table
 
     @property
     def raw_measurements(self):
-        return self.deserialize_table(self.raw_measurements_bytes)
+        return self.load_table('raw_measurements')
 
     @property
     def measurement_metadata(self):
-        return self.deserialize_table(self.measurement_metadata_bytes)
+        return self.load_table('measurement_metadata')
 
     @property
     def sample_metadata(self):
-        return self.deserialize_table(self.sample_metadata_bytes)
+        return self.load_table('sample_metadata')
 
     @property
     def groups(self):
-        return self.deserialize_table(self.groups_bytes)
+        return self.load_table('groups')
 
     @property
     def measurements(self):
-        measurement_metadata = self.measurement_metadata
-        sample_metadata = self.sample_metadata
-        table = self.raw_measurements
-        table = normalize(self.normalization, table,
-                          self.normalization_argument,
-                          measurement_metadata,
-                          sample_metadata)
-        table = transform(self.transformation, table)
-        table = scale(self.scaling, table)
-        return table
+        # every stage is cached by the fingerprint of its input, so changing a
+        # method only recomputes the pipeline from that stage onward
+        table = defer(normalize, self.normalization,
+                      self.deferred_table('raw_measurements'),
+                      self.normalization_argument,
+                      self.deferred_table('measurement_metadata'),
+                      self.deferred_table('sample_metadata'))
+        table = defer(transform, self.transformation, table)
+        return scale(self.scaling, table)
 
     @property
     def table(self):
@@ -719,14 +930,17 @@ class ValidatedMetaboliteTable(BaseModel):
 
 
 def _generate_validated_table(validated_table: ValidatedMetaboliteTable) -> pandas.DataFrame:
+    measurements = validated_table.measurements
+    measurement_metadata = validated_table.measurement_metadata
+
     # concat rows
-    if not validated_table.measurement_metadata.empty:
-        table = validated_table.measurement_metadata.copy()
+    if not measurement_metadata.empty:
+        table = measurement_metadata.copy()
         # normalize column names since R might have changed them
-        table.columns = list(validated_table.measurements)
-        table = table.append(validated_table.measurements, sort=False)
+        table.columns = list(measurements)
+        table = table.append(measurements, sort=False)
     else:
-        table = validated_table.measurements.copy()
+        table = measurements.copy()
 
     # concat columns
     table = validated_table.groups.join(table, how='right')
@@ -748,10 +962,14 @@ class ValidatedMetaboliteTableSchema(BaseSchema):
     imputation_info = fields.Dict(missing=dict)
 
     # not included in the serialized output
-    raw_measurements_bytes = fields.Raw(required=True, load_only=True)
-    measurement_metadata_bytes = fields.Raw(required=True, load_only=True)
-    sample_metadata_bytes = fields.Raw(required=True, load_only=True)
-    groups_bytes = fields.Raw(required=True, load_only=True)
+    raw_measurements_bytes = fields.Raw(load_only=True)
+    measurement_metadata_bytes = fields.Raw(load_only=True)
+    sample_metadata_bytes = fields.Raw(load_only=True)
+    groups_bytes = fields.Raw(load_only=True)
+    raw_measurements_digest = fields.Str(load_only=True)
+    measurement_metadata_digest = fields.Str(load_only=True)
+    sample_metadata_digest = fields.Str(load_only=True)
+    groups_digest = fields.Str(load_only=True)
 
     # tables stored in the database
     measurements = fields.Raw(required=True, dump_only=True)
@@ -778,3 +996,42 @@ class ValidatedMetaboliteTableSchema(BaseSchema):
         convert('measurement_metadata', 'columns')
 
         return data
+
+
+class Job(BaseModel):
+    """
+    An analysis request that is computed by a ``viime-cli worker`` process.
+
+    The response of the request is stored in the job and reused by all
+    requests with the same ``key`` (see ``viime.jobs.job_key``).
+    """
+    id = db.Column(UUIDType(binary=False), primary_key=True, default=uuid4)
+    csv_file_id = db.Column(UUIDType(binary=False),
+                            db.ForeignKey('csv_file.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    key = db.Column(db.String(64), nullable=False, index=True)
+    endpoint = db.Column(db.String, nullable=False)
+    # the request to compute, without the async argument
+    path = db.Column(db.String, nullable=False)
+    query_string = db.Column(db.String, nullable=False, default='')
+    status = db.Column(db.String, nullable=False, default=JOB_STATUSES.QUEUED, index=True)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started = db.Column(db.DateTime, nullable=True)
+    finished = db.Column(db.DateTime, nullable=True)
+    worker = db.Column(db.String, nullable=True)
+    error = db.Column(db.String, nullable=True)
+    result_status = db.Column(db.Integer, nullable=True)
+    result_mimetype = db.Column(db.String, nullable=True)
+    result_bytes = db.deferred(db.Column(db.LargeBinary, nullable=True))
+
+
+class JobSchema(BaseSchema):
+    id = fields.UUID(dump_only=True)
+    csv_file_id = fields.UUID(dump_only=True)
+    endpoint = fields.Str(dump_only=True)
+    status = fields.Str(dump_only=True)
+    created = fields.DateTime(dump_only=True)
+    started = fields.DateTime(dump_only=True)
+    finished = fields.DateTime(dump_only=True)
+    error = fields.Str(dump_only=True)
+    result_status = fields.Int(dump_only=True)
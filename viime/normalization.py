@@ -1,8 +1,10 @@
 from typing import Any, Dict, Optional
 
 from marshmallow import ValidationError
+import numpy as np
 import pandas as pd
-from sklearn import preprocessing
+
+from viime.cache import cached
 
 
 NORMALIZATION_METHODS = {'minmax', 'sum', 'reference-sample', 'weight-volume'}
@@ -17,16 +19,14 @@ def validate_normalization_method(args: Dict[str, Any]):
         raise ValidationError('Method requires argument', data=argument)
 
 
+@cached
 def normalize(method: str, table: pd.DataFrame, argument: Optional[Dict[str, Any]] = None,
               measurement_metadata: Optional[pd.DataFrame] = None,
               sample_metadata: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     if method is None:
         pass
     elif method == 'minmax':
-        for column in table:
-            column_data = table[[column]].values.astype(float)
-            min_max_scalar = preprocessing.MinMaxScaler()
-            table[[column]] = min_max_scalar.fit_transform(column_data)
+        table = minmax(table)
     elif method == 'sum':
         table = sum(table)
     elif method == 'reference-sample':
@@ -39,15 +39,49 @@ def normalize(method: str, table: pd.DataFrame, argument: Optional[Dict[str, Any
     return table
 
 
+def _row_sums(values: np.ndarray) -> np.ndarray:
+    sums = values.sum(axis=1)
+    if np.isnan(sums).any():
+        sums = np.nansum(values, axis=1)
+    return sums
+
+
+def _scale_rows(table: pd.DataFrame, factors) -> pd.DataFrame:
+    """Return a float64 copy of the table with every row divided by a factor."""
+    values = table.to_numpy(dtype=np.float64, copy=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values /= np.asarray(factors, dtype=np.float64)[:, np.newaxis]
+    return pd.DataFrame(values, index=table.index, columns=table.columns)
+
+
+def minmax(table: pd.DataFrame) -> pd.DataFrame:
+    """Scale every column to [0, 1] the same way as sklearn's MinMaxScaler.
+
+    Missing values are ignored and (nearly) constant columns are shifted to 0.
+    """
+    values = table.to_numpy(dtype=np.float64, copy=True)
+    with np.errstate(invalid='ignore'):
+        minimum = np.fmin.reduce(values, axis=0)
+        data_range = np.fmax.reduce(values, axis=0) - minimum
+        data_range[data_range < 10 * np.finfo(np.float64).eps] = 1.0
+        scale = 1.0 / data_range
+        values *= scale
+        values -= minimum * scale
+    return pd.DataFrame(values, index=table.index, columns=table.columns)
+
+
 def sum(table: pd.DataFrame) -> pd.DataFrame:
-    return 1000 * table.div(table.sum(axis=1), axis=0)
+    values = table.to_numpy(dtype=np.float64)
+    return _scale_rows(table, _row_sums(values) / 1000)
 
 
 def reference_sample(table: pd.DataFrame, argument) -> pd.DataFrame:
-    return table.loc[argument].sum() * table.div(table.sum(axis=1), axis=0)
+    values = table.to_numpy(dtype=np.float64)
+    reference = np.nansum(table.loc[argument].to_numpy(dtype=np.float64))
+    return _scale_rows(table, _row_sums(values) / reference)
 
 
 def weight_volume(table: pd.DataFrame, argument, sample_metadata: pd.DataFrame):
     if sample_metadata.dtypes[argument].name != 'float64':
         raise ValidationError('Column contains non-numeric data')
-    return 100 * table.div(sample_metadata.loc[:, argument], axis=0)
+    return _scale_rows(table, sample_metadata[argument].reindex(table.index) / 100)
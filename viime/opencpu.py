@@ -1,10 +1,51 @@
+from collections import defaultdict
 from io import BytesIO
 import json
-from typing import Any, Dict, List, Optional
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
 
 from flask import current_app, Response
 import pandas
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from viime.cache import cached, hash_argument
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 1000.0
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+# status codes of a restarting or overloaded OpenCPU server
+RETRY_STATUS_CODES = (502, 503, 504)
+# seconds an uploaded table is referenced by its session key, OpenCPU keeps
+# sessions for a day by default
+DEFAULT_SESSION_TTL = 300.0
+# tables with fewer cells are sent with every call instead of uploaded into a session
+DEFAULT_SESSION_MIN_CELLS = 10000
+
+_session_lock = threading.Lock()
+_sessions: Dict[Tuple[Any, ...], requests.Session] = {}
+
+_table_lock = threading.Lock()
+# session keys of uploaded tables, None for tables that were passed once
+_table_keys: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+
+# OpenCPU servers that failed to return feather results, their results are csv
+_transport_lock = threading.Lock()
+_csv_result_roots: Set[str] = set()
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, float]] = defaultdict(
+    lambda: {'requests': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
 
 
 class OpenCPUException(Exception):
@@ -15,10 +56,58 @@ class OpenCPUException(Exception):
 
     @property
     def error_response(self):
+        if self.response is None:
+            return Response(str(self.args[-1]), status=502, mimetype='text/plain')
         return Response(self.response.content, status=self.response.status_code,
                         mimetype='text/plain')
 
 
+def binary_transport() -> bool:
+    """Return whether tables are uploaded as feather files (OPENCPU_TRANSPORT=feather)."""
+    if current_app.config.get('OPENCPU_TRANSPORT') != 'feather':
+        return False
+    if feather is None:
+        current_app.logger.warning('pyarrow is not installed, uploading tables as csv')
+        return False
+    return True
+
+
+def table_file(name: str, table: Union[pandas.DataFrame, pandas.Series]) -> Tuple[str, bytes]:
+    """
+    Encode a table uploaded to OpenCPU.
+
+    Feather files store the row names in their first column and are read by
+    ``read_table`` in the R package, csv files are the fallback.
+    """
+    if isinstance(table, pandas.Series):
+        table = table.to_frame()
+    if not binary_transport():
+        return f'{name}.csv', table.to_csv().encode()
+
+    frame = table.reset_index()
+    frame.columns = ['_row'] + [str(c) for c in table.columns]
+    data = BytesIO()
+    feather.write_feather(frame, data, compression='uncompressed')
+    return f'{name}.feather', data.getvalue()
+
+
+def read_table_result(data: bytes) -> pandas.DataFrame:
+    """
+    Decode a feather result of ``table_result`` in the R package.
+
+    The row names are restored from the first column, and factors and
+    integers are converted to the types ``read_csv`` returns for csv results.
+    """
+    df = feather.read_feather(BytesIO(data)).set_index('_row')
+    df.index.name = None
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pandas.CategoricalDtype):
+            df[column] = df[column].astype(object)
+        elif pandas.api.types.is_integer_dtype(dtype):
+            df[column] = df[column].astype('int64')
+    return df
+
+
 def r_json_to_pandas(data: List[Dict[str, Any]]) -> pandas.DataFrame:
     df = pandas.DataFrame(data=data)
     if '_row' in df:
@@ -26,34 +115,248 @@ def r_json_to_pandas(data: List[Dict[str, Any]]) -> pandas.DataFrame:
     return df
 
 
-def opencpu_request(method: str, files: Optional[Dict[str, Any]] = None,
-                    params: Optional[Dict[str, Any]] = None, return_type='csv'):
-    files = files or {}
-    params = params or {}
-    params = {
-        k: json.dumps(v) for k, v in params.items()
-    }
+def get_session(config: Mapping[str, Any]) -> requests.Session:
+    """
+    Return the pooled keep-alive session of this process.
+
+    OpenCPU function calls have no side effects, so failed connections and
+    responses with a RETRY_STATUS_CODES status are retried (POST included)
+    with an exponential backoff.  Read timeouts are not retried.
+    """
+    pool_size = int(config.get('OPENCPU_POOL_SIZE') or DEFAULT_POOL_SIZE)
+    retries = config.get('OPENCPU_RETRIES')
+    retries = DEFAULT_RETRIES if retries is None else int(retries)
+    backoff = float(config.get('OPENCPU_RETRY_BACKOFF') or DEFAULT_RETRY_BACKOFF)
+    # sessions must not be shared with forked worker processes
+    key = (os.getpid(), pool_size, retries, backoff)
+
+    with _session_lock:
+        session = _sessions.get(key)
+        if session is None:
+            retry = Retry(
+                total=retries, connect=retries, read=0, status=retries,
+                backoff_factor=backoff, status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=None, raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+    return session
+
+
+def _timeout(config: Mapping[str, Any]) -> Tuple[float, float]:
+    return (float(config.get('OPENCPU_CONNECT_TIMEOUT') or DEFAULT_CONNECT_TIMEOUT),
+            float(config.get('OPENCPU_READ_TIMEOUT') or DEFAULT_READ_TIMEOUT))
+
+
+def _record(method: str, seconds: float, error: bool):
+    with _metrics_lock:
+        metrics = _metrics[method]
+        metrics['requests'] += 1
+        metrics['errors'] += int(error)
+        metrics['total_seconds'] += seconds
+        metrics['max_seconds'] = max(metrics['max_seconds'], seconds)
+
+
+def opencpu_stats() -> Dict[str, Dict[str, float]]:
+    """Return the request count, error count and latency of every called method."""
+    with _metrics_lock:
+        stats = {method: dict(metrics) for method, metrics in _metrics.items()}
+    for metrics in stats.values():
+        metrics['mean_seconds'] = metrics['total_seconds'] / metrics['requests']
+    return stats
+
+
+def _url(method: str, return_type: Optional[str]) -> str:
     url = current_app.config['OPENCPU_API_ROOT'] + '/viime/R/' + method
     if return_type == 'csv':
         url += '/csv?row.names=true'
+    elif return_type == 'feather':
+        url += '/feather'
     elif return_type == 'png':
         url += '/png'
     elif return_type == 'json':
         url += '/json'
-    else:
+    elif return_type is not None:
         raise Exception('Unknown return type')
+    return url
 
+
+def _post(method: str, url: str, files: Dict[str, Any],
+          data: Dict[str, Any]) -> requests.Response:
+    session = get_session(current_app.config)
+    start = time.perf_counter()
     try:
-        resp = requests.post(url, files=files, data=params)
+        resp = session.post(url, files=files, data=data, timeout=_timeout(current_app.config))
     except requests.exceptions.RequestException as e:
+        _record(method, time.perf_counter() - start, True)
         raise OpenCPUException('Error connecting to OpenCPU server', method, e.response)
+    _record(method, time.perf_counter() - start, not resp.ok)
+    return resp
+
+
+def _session_ttl() -> float:
+    ttl = current_app.config.get('OPENCPU_SESSION_TTL')
+    return DEFAULT_SESSION_TTL if ttl is None else float(ttl)
+
+
+def _session_min_cells() -> int:
+    cells = current_app.config.get('OPENCPU_SESSION_MIN_CELLS')
+    return DEFAULT_SESSION_MIN_CELLS if cells is None else int(cells)
+
+
+def upload_table(table: Union[pandas.DataFrame, pandas.Series]) -> Optional[str]:
+    """Upload a table into an OpenCPU session and return the session key, if any."""
+    resp = _post('read_table', _url('read_table', None),
+                 {'file': table_file('table', table)}, {'check.names': 'FALSE'})
+    if not resp.ok:
+        current_app.logger.error(resp.content)
+        raise OpenCPUException('OpenCPU error uploading a table', 'read_table', resp)
+    return resp.headers.get('X-ocpu-session')
+
+
+def table_session_key(table: Union[pandas.DataFrame, pandas.Series]) -> Optional[str]:
+    """
+    Return the session key to pass a table by, or None to send it with the call.
+
+    An upload costs an extra round trip, which only pays off for tables that
+    are passed again.  Tables with fewer than OPENCPU_SESSION_MIN_CELLS cells
+    are always sent with the call.  Larger tables are sent with their first
+    call and uploaded by the next one within OPENCPU_SESSION_TTL seconds, whose
+    key is then reused for every table with the same content.  Sessions are
+    disabled by a TTL of 0.
+    """
+    ttl = _session_ttl()
+    if ttl <= 0 or table.size < _session_min_cells():
+        return None
+
+    cache_key = (current_app.config['OPENCPU_API_ROOT'], hash_argument(table))
+    now = time.monotonic()
+    with _table_lock:
+        key, expires = _table_keys.get(cache_key, (None, 0.0))
+        if expires <= now:
+            for k, (_, other_expires) in list(_table_keys.items()):
+                if other_expires <= now:
+                    del _table_keys[k]
+            _table_keys[cache_key] = (None, now + ttl)
+            return None
+    if key is not None:
+        return key
+
+    key = upload_table(table)
+    if key is not None:
+        with _table_lock:
+            _table_keys[cache_key] = (key, now + ttl)
+    return key
+
+
+def forget_table_keys(keys: Iterable[str]):
+    """Stop referencing the given session keys, e.g. after their session expired."""
+    keys = set(keys)
+    with _table_lock:
+        for k, (key, _) in list(_table_keys.items()):
+            if key in keys:
+                del _table_keys[k]
+
+
+def _missing_session(resp: requests.Response, keys: Iterable[str]) -> bool:
+    return resp.status_code in (400, 404, 410) and any(key in resp.text for key in keys)
+
+
+def _call(method: str, url: str, files: Dict[str, Any],
+          params: Dict[str, str]) -> requests.Response:
+    for attempt in range(2):
+        data = dict(params)
+        uploads: Dict[str, Any] = {}
+        keys: List[str] = []
+        for name, value in files.items():
+            key = None
+            if isinstance(value, (pandas.DataFrame, pandas.Series)):
+                key = table_session_key(value)
+                if key is None:
+                    value = table_file(name, value)
+            if key is None:
+                uploads[name] = value
+            else:
+                # session keys are passed unquoted as references to R objects
+                data[name] = key
+                keys.append(key)
+
+        resp = _post(method, url, uploads, data)
+        if resp.ok or attempt > 0 or not _missing_session(resp, keys):
+            break
+        current_app.logger.info(f'OpenCPU session expired, uploading tables for {method} again')
+        forget_table_keys(keys)
+    return resp
+
+
+def _missing_feather_output(resp: requests.Response) -> bool:
+    """Return whether a failed feather call shows that the server cannot return feather files.
+
+    That is the case when the OpenCPU version has no feather output, arrow is
+    not installed or the R package has no ``table_result``.
+    """
+    if resp.status_code == 404:
+        return True
+    text = resp.text.lower()
+    return 'output format' in text or "table_result' not found" in text or \
+        ('arrow' in text and ('package' in text or 'namespace' in text))
+
+
+def _feather_results() -> bool:
+    if not binary_transport():
+        return False
+    with _transport_lock:
+        return current_app.config['OPENCPU_API_ROOT'] not in _csv_result_roots
+
+
+def opencpu_request(method: str, files: Optional[Dict[str, Any]] = None,
+                    params: Optional[Dict[str, Any]] = None, return_type='csv'):
+    """
+    Call a function of the viime R package.
+
+    Data frames and series in ``files`` that are passed repeatedly are
+    uploaded once and passed by their session key (see
+    ``table_session_key``).  When a session has expired on the server, the
+    call is repeated with the tables sent along.
+
+    With the feather transport, table results are requested as feather files
+    through ``table_result`` in the R package, which keeps the full precision
+    of the values.  When the server cannot return them (see
+    ``_missing_feather_output``), the call is repeated and later calls return
+    csv.  Other errors are raised right away.
+    """
+    files = files or {}
+    params = params or {}
+    params = {
+        k: json.dumps(v) for k, v in params.items()
+    }
+
+    feather_error: Optional[bytes] = None
+    if return_type == 'csv' and _feather_results():
+        resp = _call(method, _url('table_result', 'feather'), files,
+                     dict(params, **{'.method': json.dumps(method)}))
+        if resp.ok:
+            return read_table_result(resp.content)
+        if not _missing_feather_output(resp):
+            current_app.logger.error(resp.content)
+            raise OpenCPUException(f'OpenCPU error calling {method}', method, resp)
+        feather_error = resp.content
 
+    resp = _call(method, _url(method, return_type), files, params)
     if not resp.ok:
         current_app.logger.error(resp.content)
         raise OpenCPUException(f'OpenCPU error calling {method}', method, resp)
 
     result = resp.content
     if return_type == 'csv':
+        if feather_error is not None:
+            current_app.logger.warning(
+                f'OpenCPU returned no feather result, using csv results: {feather_error!r}')
+            with _transport_lock:
+                _csv_result_roots.add(current_app.config['OPENCPU_API_ROOT'])
         result = pandas.read_csv(BytesIO(resp.content), index_col=0)
     elif return_type == 'json':
         result = json.loads(result)
@@ -62,15 +365,16 @@ def opencpu_request(method: str, files: Optional[Dict[str, Any]] = None,
 
 def process_table(method: str, table: pandas.DataFrame, params: Optional[Dict[str, Any]] = None):
     files = {
-        'table': ('table.csv', table.to_csv().encode())
+        'table': table
     }
     result = opencpu_request(method, files=files, params=params)
     return Response(result.to_csv(), mimetype='text/csv')
 
 
+@cached
 def generate_image(method: str, table: pandas.DataFrame, params: Optional[Dict[str, Any]] = None):
     files = {
-        'table': ('table.csv', table.to_csv().encode())
+        'table': table
     }
     return opencpu_request(method, files=files, params=params, return_type='png')
 
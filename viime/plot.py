@@ -2,7 +2,10 @@ from numpy import sqrt
 import pandas as pd
 from sklearn.decomposition import PCA
 
+from viime.cache import cached
 
+
+@cached
 def pca(measurements: pd.DataFrame, max_components: int):
     pca = PCA(n_components=max_components)
     x = pca.fit_transform(measurements)
@@ -5,7 +5,7 @@ from uuid import uuid4
 from sqlalchemy.orm.session import make_transient
 
 from .models import CSVFile, CSVFileSchema, db, GroupLevel, \
-    SampleGroup, SampleGroupSchema, ValidatedMetaboliteTable, \
+    SampleGroup, SampleGroupSchema, TABLE_BLOBS, ValidatedMetaboliteTable, \
     ValidatedMetaboliteTableSchema
 
 
@@ -69,7 +69,8 @@ def import_files(files: List[CSVFile]):
 
         imported.append(csv)
 
-        v: ValidatedMetaboliteTable = ValidatedMetaboliteTable.query \
+        # all blobs have to be loaded before the row is copied
+        v: ValidatedMetaboliteTable = ValidatedMetaboliteTable.query_tables(*TABLE_BLOBS) \
             .filter_by(csv_file_id=ori_id).first()
         if not v:
             continue
@@ -3,49 +3,76 @@ from typing import Optional
 import numpy as np
 import pandas as pd
 
+from viime.cache import cached
+
 SCALING_METHODS = {'auto', 'range', 'pareto', 'vast', 'level'}
 
 
+@cached
 def scale(method: Optional[str], table: pd.DataFrame) -> pd.DataFrame:
     if method is None:
-        pass
-    elif method == 'auto':
-        table = auto(table)
-    elif method == 'range':
-        table = range(table)
-    elif method == 'pareto':
-        table = pareto(table)
-    elif method == 'vast':
-        table = vast(table)
-    elif method == 'level':
-        table = level(table)
-    else:
-        raise Exception('Unknown scaling method')
-    return table
-
-
-def center(table: pd.DataFrame) -> pd.DataFrame:
-    return table - table.mean()
-
-
-def auto(table: pd.DataFrame) -> pd.DataFrame:
-    return center(table) / table.std()
-
-
-def range(table: pd.DataFrame) -> pd.DataFrame:
-    return center(table) / (table.max() - table.min())
-
-
-def pareto(table: pd.DataFrame) -> pd.DataFrame:
-    return center(table) / np.sqrt(table.std())
-
-
-def vast(table: pd.DataFrame) -> pd.DataFrame:
-    mean = table.mean()
-    sd = table.std()
-    return (mean / sd) * (table - mean) / sd
-
-
-def level(table: pd.DataFrame) -> pd.DataFrame:
-    mean = table.mean()
-    return (table - mean) / mean
+        return table
+
+    # all methods work in place on a single float64 copy of the table
+    values = table.to_numpy(dtype=np.float64, copy=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'auto':
+            auto(values)
+        elif method == 'range':
+            range(values)
+        elif method == 'pareto':
+            pareto(values)
+        elif method == 'vast':
+            vast(values)
+        elif method == 'level':
+            level(values)
+        else:
+            raise Exception('Unknown scaling method')
+    return pd.DataFrame(values, index=table.index, columns=table.columns)
+
+
+def center(values: np.ndarray) -> np.ndarray:
+    """Center the columns in place and return their means (ignoring missing values)."""
+    mean = values.mean(axis=0)
+    if np.isnan(mean).any():
+        mean = np.nanmean(values, axis=0)
+    values -= mean
+    return mean
+
+
+def centered_std(values: np.ndarray) -> np.ndarray:
+    """Return the sample standard deviations of centered columns."""
+    squares = np.einsum('ij,ij->j', values, values)
+    if np.isnan(squares).any():
+        return np.nanstd(values, axis=0, ddof=1)
+    return np.sqrt(squares / (values.shape[0] - 1))
+
+
+def auto(values: np.ndarray) -> np.ndarray:
+    center(values)
+    values /= centered_std(values)
+    return values
+
+
+def range(values: np.ndarray) -> np.ndarray:
+    center(values)
+    values /= np.fmax.reduce(values, axis=0) - np.fmin.reduce(values, axis=0)
+    return values
+
+
+def pareto(values: np.ndarray) -> np.ndarray:
+    center(values)
+    values /= np.sqrt(centered_std(values))
+    return values
+
+
+def vast(values: np.ndarray) -> np.ndarray:
+    mean = center(values)
+    sd = centered_std(values)
+    values *= mean / (sd * sd)
+    return values
+
+
+def level(values: np.ndarray) -> np.ndarray:
+    values /= center(values)
+    return values
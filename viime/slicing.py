@@ -0,0 +1,194 @@
+"""
+This module contains the typed slicing engine used to extract sub tables
+(measurements, metadata, groups, ...) from the raw csv grid.
+
+The raw grid is parsed without a header, so most columns contain strings.
+Extracting a sub table must behave as if the selected block was written to
+csv and parsed again with ``pandas.read_csv(..., index_col=0)``: the first
+row becomes the header, the first column becomes the index and every column
+gets its dtype inferred.  Doing this directly on the in memory block avoids
+the expensive csv round trip.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy
+import pandas
+from pandas.api.types import infer_dtype
+
+_BOOLEAN_VALUES = {
+    'True': True, 'TRUE': True, 'true': True,
+    'False': False, 'FALSE': False, 'false': False
+}
+_INT64_LIMIT = 2 ** 53
+# columns converted to numbers at once
+_CONVERSION_COLUMNS = 64
+# characters of float, nan and inf values
+_FLOAT_CHARACTERS = '.eEnNiI'
+# deletes the characters of integers, see _parse_integers
+_INTEGER_CHARACTERS = str.maketrans('', '', '0123456789+- ')
+
+
+def _format_cell(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if value is None or value != value:
+        return ''
+    return str(value)
+
+
+def _header_names(cells: Sequence[Any]) -> List[str]:
+    """Mimic the column names generated by the csv parser (including mangling)."""
+    names = [_format_cell(v) or f'Unnamed: {i}' for i, v in enumerate(cells)]
+    counts: Dict[str, int] = {}
+    for i, name in enumerate(names):
+        count = counts.get(name, 0)
+        if count > 0:
+            original = name
+            while count > 0:
+                counts[original] = count + 1
+                name = f'{original}.{count}'
+                if name in names:
+                    count += 1
+                else:
+                    count = counts.get(name, 0)
+            names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def _is_integer_column(values: numpy.ndarray) -> bool:
+    """Return whether the csv parser would read a numeric column of integral values as integers.
+
+    Integral values are read as floats when they are written with a decimal
+    point or an exponent (e.g. ``1.0`` or ``1e3``), or when any cell is a float.
+    """
+    kind = infer_dtype(values, skipna=False)
+    if kind == 'integer':
+        return True
+    if kind == 'string':
+        text = ''.join(values)
+        return not any(c in text for c in _FLOAT_CHARACTERS)
+    for value in values:
+        if isinstance(value, str):
+            if any(c in value for c in _FLOAT_CHARACTERS):
+                return False
+        elif isinstance(value, bool) or not isinstance(value, (int, numpy.integer)):
+            return False
+    return True
+
+
+def _parse_integers(cells: numpy.ndarray) -> Optional[numpy.ndarray]:
+    """Parse cells that are all integer strings, or return None.
+
+    ``int`` parses them exactly like the csv parser, and much faster than
+    ``pandas.to_numeric``.
+    """
+    if infer_dtype(cells, skipna=False) != 'string':
+        return None
+    if ''.join(cells).translate(_INTEGER_CHARACTERS):
+        return None
+    try:
+        return cells.astype(numpy.int64)
+    except (ValueError, OverflowError):
+        return None
+
+
+def infer_columns(values: numpy.ndarray) -> List[numpy.ndarray]:
+    """Infer the dtype of every column of a 2D object array.
+
+    Cells are converted to numbers in chunks of _CONVERSION_COLUMNS columns:
+    a conversion failure slows down the conversion of all cells passed along
+    with it, so a text column only slows down its own chunk.  Chunks of
+    integers take a faster path.  Columns without
+    conversion failures become integer or float columns, the remaining ones
+    stay object columns (or boolean columns for ``True``/``False`` data).
+    """
+    rows, columns = values.shape
+    if rows == 0:
+        return [numpy.empty(0, dtype=object) for _ in range(columns)]
+
+    numeric = numpy.empty((rows, columns), dtype=numpy.float64, order='F')
+    is_integer = numpy.zeros(columns, dtype=bool)
+    for start in range(0, columns, _CONVERSION_COLUMNS):
+        chunk = values[:, start:start + _CONVERSION_COLUMNS]
+        cells = chunk.ravel(order='F')
+        converted = _parse_integers(cells)
+        if converted is not None:
+            is_integer[start:start + _CONVERSION_COLUMNS] = True
+        else:
+            converted = pandas.to_numeric(cells, errors='coerce')
+        if converted.dtype == object:
+            converted = pandas.Series(converted).to_numpy(dtype=numpy.float64,
+                                                          na_value=numpy.nan)
+        numeric[:, start:start + _CONVERSION_COLUMNS] = \
+            converted.reshape(chunk.shape, order='F')
+    # only cells that are not numbers can be missing
+    missing = numpy.isnan(numeric)
+    missing[missing] = pandas.isna(values[missing])
+    failed = numpy.isnan(numeric) & ~missing
+
+    is_numeric = ~failed.any(axis=0)
+    has_missing = missing.any(axis=0)
+    with numpy.errstate(invalid='ignore'):
+        is_integral = (numpy.mod(numeric, 1) == 0).all(axis=0)
+        in_int64 = (numpy.abs(numeric) < _INT64_LIMIT).all(axis=0)
+
+    result: List[numpy.ndarray] = []
+    for j in range(columns):
+        column = values[:, j]
+        if is_numeric[j]:
+            if is_integer[j] or (
+                    not has_missing[j] and is_integral[j] and _is_integer_column(column)):
+                if in_int64[j]:
+                    result.append(numeric[:, j].astype(numpy.int64))
+                else:
+                    result.append(numpy.asarray(pandas.to_numeric(column)))
+            else:
+                result.append(numeric[:, j])
+            continue
+
+        present = column[~missing[:, j]]
+        if all(isinstance(v, str) and v in _BOOLEAN_VALUES for v in present):
+            booleans = numpy.array([_BOOLEAN_VALUES[v] for v in present], dtype=bool)
+            if has_missing[j]:
+                column = column.copy()
+                column[~missing[:, j]] = booleans.astype(object)
+                result.append(column)
+            else:
+                result.append(booleans)
+            continue
+
+        strings = column.copy()
+        strings[missing[:, j]] = numpy.nan
+        result.append(strings)
+    return result
+
+
+def typed_slice(table: pandas.DataFrame, rows: List[int], columns: List[int]) -> pandas.DataFrame:
+    """Extract a typed sub table from a raw csv grid.
+
+    The first entry of ``rows`` is used as the header and the first entry of
+    ``columns`` as the index.
+    """
+    block = table.iloc[rows, columns].to_numpy(dtype=object)
+    for j in range(block.shape[1]):
+        # the csv parser reads booleans back from their text representation
+        if infer_dtype(block[:, j], skipna=True) in ('boolean', 'mixed'):
+            block[:, j] = [str(v) if isinstance(v, bool) else v for v in block[:, j]]
+    names = _header_names(block[0])
+    data = infer_columns(block[1:])
+
+    index_name = names[0] if not names[0].startswith('Unnamed: ') else None
+    index_values = data[0]
+    if index_values.dtype == object and infer_dtype(index_values, skipna=True) == 'boolean':
+        # incomplete boolean indices are parsed as numbers
+        index_values = index_values.astype(numpy.float64)
+    if len(index_values) == 0:
+        index = pandas.Index([], dtype=object, name=index_name)
+    else:
+        index = pandas.Index(index_values, name=index_name)
+
+    result = pandas.DataFrame(
+        {i: column for i, column in enumerate(data[1:])}, index=index)
+    result.columns = pandas.Index(names[1:], dtype=object)
+    return result
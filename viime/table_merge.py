@@ -1,8 +1,10 @@
 """
 This module contains methods related to mergind dataset
 """
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
 from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
+from flask import current_app
 import pandas as pd
 
 from .colors import scheme_set3
@@ -11,11 +13,46 @@ from .models import TABLE_COLUMN_TYPES, TABLE_ROW_TYPES, \
 from .opencpu import opencpu_request
 
 MergeResult = Tuple[pd.DataFrame, List[Dict[str, Any]], List[Dict[str, Any]]]
+Transformer = Callable[[pd.DataFrame, int], pd.DataFrame]
+
+
+def _transform_tables(transformer: Transformer, tables: List[pd.DataFrame]) -> List[pd.DataFrame]:
+    """
+    Transform the tables in a pool of MERGE_WORKERS threads.
+
+    The results are returned in the order of the tables.  When a
+    transformation fails, the pending ones are cancelled and the error of
+    the first failed table is raised.
+    """
+    workers = min(len(tables), int(current_app.config.get('MERGE_WORKERS') or 1))
+    if workers <= 1:
+        return [transformer(df, index) for index, df in enumerate(tables)]
+
+    app = current_app._get_current_object()  # type: ignore
+
+    def transform(df: pd.DataFrame, index: int) -> pd.DataFrame:
+        with app.app_context():
+            return transformer(df, index)
+
+    pool = ThreadPoolExecutor(workers, thread_name_prefix='merge')
+    futures: List['Future[pd.DataFrame]'] = []
+    try:
+        futures.extend(pool.submit(transform, df, index) for index, df in enumerate(tables))
+        wait(futures, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            error = future.exception() if future.done() else None
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+    finally:
+        # shutdown(cancel_futures=True) needs python 3.9
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
 
 
 def _merge_impl(validated_tables: List[ValidatedMetaboliteTable],
-                transformer: Optional[Callable[[pd.DataFrame, int],
-                                               pd.DataFrame]] = None) -> MergeResult:
+                transformer: Optional[Transformer] = None) -> MergeResult:
     used_column_names: Set[str] = set()
     tables: List[pd.DataFrame] = []
     column_types: List[Dict[str, Any]] = [
@@ -46,10 +83,11 @@ def _merge_impl(validated_tables: List[ValidatedMetaboliteTable],
         measurement_metadata.extend([f'DS{index + 1}'] * count)
 
     def append_tables(column_type: str, attr: str, do_transform=False):
-        for index, table in enumerate(validated_tables):
-            df = getattr(table, attr)
-            if do_transform and transformer:
-                df = transformer(df, index)
+        # tables are loaded in this thread, only the transformations run concurrently
+        dfs = [getattr(table, attr) for table in validated_tables]
+        if do_transform and transformer:
+            dfs = _transform_tables(transformer, dfs)
+        for index, df in enumerate(dfs):
             append_table(column_type, df, index)
 
     append_tables(TABLE_COLUMN_TYPES.GROUP, 'groups', False)
@@ -88,7 +126,7 @@ def simple_merge(validated_tables: List[ValidatedMetaboliteTable]):
 
 def _clean_pca_transformer(measurements: pd.DataFrame, index: int) -> pd.DataFrame:
     files = {
-        'measurements': measurements.to_csv().encode()
+        'measurements': measurements
     }
     params = {
         'prefix': f'DS{index + 1}'
@@ -102,7 +140,7 @@ def clean_pca_merge(validated_tables: List[ValidatedMetaboliteTable]):
 
 def _multi_block_transformer(measurements: pd.DataFrame, index: int) -> pd.DataFrame:
     files = {
-        'measurements': measurements.to_csv().encode()
+        'measurements': measurements
     }
     return opencpu_request('compute_multi_block', files)
 
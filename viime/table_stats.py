@@ -0,0 +1,83 @@
+"""
+This module computes per row and per column statistics of tables.
+
+Tables are coerced to floats once, non numeric cells count as missing.  The
+reductions skip missing values and follow pandas (e.g. ``Series.var``), so
+the results match the per row and per column pandas computations.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from viime.cache import cached
+
+AxisStats = Dict[str, List[Optional[float]]]
+
+
+def to_numeric(table: pd.DataFrame) -> np.ndarray:
+    """Coerce all cells of a table to floats, non numeric cells become NaN."""
+    if all(is_numeric_dtype(dtype) for dtype in table.dtypes):
+        return table.to_numpy(dtype=np.float64)
+    values = pd.to_numeric(table.to_numpy().ravel(), errors='coerce')
+    return np.asarray(values, dtype=np.float64).reshape(table.shape)
+
+
+def _variance(filled: np.ndarray, missing: np.ndarray, count: np.ndarray) -> np.ndarray:
+    # the two pass algorithm of pandas.core.nanops.nanvar
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=1) / count
+        squares = (mean[:, None] - filled) ** 2
+        squares[missing] = 0
+        variance = squares.sum(axis=1) / (count - 1)
+    variance[count < 2] = np.nan
+    return variance
+
+
+def nanvar(values: np.ndarray) -> np.ndarray:
+    """Compute the sample variance of every row, skipping NaNs."""
+    missing = np.isnan(values)
+    return _variance(np.where(missing, 0.0, values), missing, (~missing).sum(axis=1))
+
+
+def row_stats(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Compute the missing fraction, variance, mean, minimum and maximum of every row."""
+    missing = np.isnan(values)
+    count = (~missing).sum(axis=1)
+    filled = np.where(missing, 0.0, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction_missing = missing.sum(axis=1) / values.shape[1]
+        mean = filled.sum(axis=1) / count
+    minimum = np.where(missing, np.inf, values).min(axis=1, initial=np.inf)
+    maximum = np.where(missing, -np.inf, values).max(axis=1, initial=-np.inf)
+    minimum[count == 0] = np.nan
+    maximum[count == 0] = np.nan
+    return {
+        'missing': fraction_missing,
+        'variance': _variance(filled, missing, count),
+        'mean': mean,
+        'min': minimum,
+        'max': maximum
+    }
+
+
+def _serialize(stats: Dict[str, np.ndarray]) -> AxisStats:
+    return {
+        name: [None if np.isnan(value) else float(value) for value in values]
+        for name, values in stats.items()
+    }
+
+
+@cached
+def table_stats(table: pd.DataFrame) -> Dict[str, AxisStats]:
+    """
+    Compute the statistics of every column and row of a table.
+
+    Missing values (NaN) are returned as None.
+    """
+    values = to_numeric(table)
+    return {
+        'columns': _serialize(row_stats(np.ascontiguousarray(values.T))),
+        'rows': _serialize(row_stats(values))
+    }
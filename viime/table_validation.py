@@ -1,14 +1,21 @@
 """
 This module contains methods related to validation of csv data contained
 in the models.CSVFile model.
+
+The data checks are derived from per row and per column statistics of the
+measurement table (see ``validation_state``).  These are persisted with the
+csv file, so relabeling columns only parses the columns that were added to
+or removed from the measurements.
 """
 from collections import namedtuple
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from marshmallow import fields, post_dump, Schema, validate
-from pandas import DataFrame, Index, Series, to_numeric
+import numpy as np
+from pandas import DataFrame, factorize, Index, Series
 
 from viime import models
+from viime.table_stats import nanvar, to_numeric
 
 SEVERITY_VALUES = ['error', 'warning']
 CONTEXT_VALUES = ['table', 'column', 'row']
@@ -21,6 +28,21 @@ TYPE_VALUES = [
 _ValidationTuple = namedtuple(
     '_ValidationTuple', 'type_ title, severity context row_index column_index data')
 
+# the raw measurement table parsed into floats, masks of its missing (empty)
+# and non-numeric cells, its header cells and the csv row and column indices
+# of its rows and columns
+MeasurementBlock = namedtuple(
+    'MeasurementBlock', 'values missing non_numeric headers row_indices column_indices')
+
+# statistics of the measurement table the data checks are derived from: the
+# number of NaN's (missing or non-numeric values) of every row and column, the
+# header cell, number of non-numeric values, missing values per group and the
+# variance of every column and the size of every group
+ValidationState = namedtuple(
+    'ValidationState',
+    'row_indices row_nans column_indices column_nans headers non_numeric missing variance '
+    'group_sizes')
+
 GROUP_MISSING_THRESHOLD = 0.25
 LOW_VARIANCE_THRESHOLD = 1e-8
 MAX_NAN_THRESHOLD = 0.95
@@ -153,10 +175,15 @@ class ValidationSchema(Schema):
 
 
 def get_validation_list(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
-    errors = get_fatal_index_errors(csv_file)
+    errors = get_missing_index_errors(csv_file)
+    if errors:
+        return errors
+
+    state = validation_state(csv_file)
+    errors = get_fatal_index_errors(csv_file, state)
 
     if not errors:
-        errors = get_warnings(csv_file)
+        errors = get_warnings(csv_file, state)
 
     return errors
 
@@ -172,12 +199,13 @@ def get_missing_index_errors(csv_file: 'models.CSVFile') -> List[ValidationTuple
     return errors
 
 
-def get_fatal_index_errors(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
+def get_fatal_index_errors(csv_file: 'models.CSVFile',
+                           state: Optional[ValidationState] = None) -> List[ValidationTuple]:
     errors = get_missing_index_errors(csv_file)
     if not errors:
-        errors = get_invalid_index_errors(csv_file)
+        errors = get_invalid_index_errors(csv_file, state)
     if not errors:
-        errors = get_non_numeric_errors(csv_file)
+        errors = get_non_numeric_errors(csv_file, state)
     return errors
 
 
@@ -198,7 +226,8 @@ def check_valid_groups(groups: DataFrame) -> Optional[str]:
     return None
 
 
-def get_invalid_index_errors(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
+def get_invalid_index_errors(csv_file: 'models.CSVFile',
+                             state: Optional[ValidationState] = None) -> List[ValidationTuple]:
     from viime.models import TABLE_COLUMN_TYPES, TABLE_ROW_TYPES
 
     errors: List[ValidationTuple] = []
@@ -208,8 +237,11 @@ def get_invalid_index_errors(csv_file: 'models.CSVFile') -> List[ValidationTuple
     if error_data:
         errors.append(InvalidPrimaryKey(column_index=csv_file.key_column_index, data=error_data))
 
-    table = csv_file.filter_table_by_types(
-        TABLE_ROW_TYPES.INDEX, TABLE_COLUMN_TYPES.DATA).iloc[0, :]
+    if state is None:
+        table = csv_file.filter_table_by_types(
+            TABLE_ROW_TYPES.INDEX, TABLE_COLUMN_TYPES.DATA).iloc[0, :]
+    else:
+        table = Series(state.headers, dtype=object)
     error_data = check_valid_index(table)
     if error_data:
         errors.append(InvalidHeader(row_index=csv_file.header_row_index, data=error_data))
@@ -221,50 +253,214 @@ def get_invalid_index_errors(csv_file: 'models.CSVFile') -> List[ValidationTuple
     return errors
 
 
-def get_non_numeric_errors(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
-    errors: List[ValidationTuple] = []
-    raw_table = csv_file.raw_measurement_table
-
-    for index in range(raw_table.shape[0]):
-        row = to_numeric(raw_table.iloc[index, :], errors='coerce')
-        nans = (row != row).sum()
-        if nans / raw_table.shape[1] > MAX_NAN_THRESHOLD:
-            row = csv_file.get_row_by_name(raw_table.index[index])
-            errors.append(
-                NonNumericRow(row_index=row['row_index'],
-                              data=f'Contains {nans} non-numeric values')
-            )
+def _data_rows(csv_file: 'models.CSVFile') -> List[int]:
+    from viime.models import TABLE_ROW_TYPES
 
-    for index in range(raw_table.shape[1]):
-        column = to_numeric(raw_table.iloc[:, index], errors='coerce')
-        nans = (column != column).sum()
-        if nans / raw_table.shape[0] > MAX_NAN_THRESHOLD:
-            column = csv_file.get_column_by_name(raw_table.columns[index])
-            errors.append(
-                NonNumericColumn(column_index=column['column_index'],
-                                 data=f'Contains {nans} non-numeric values')
-            )
-    return errors
+    return [row['row_index'] for row in csv_file.rows if row['row_type'] == TABLE_ROW_TYPES.DATA]
 
 
-def _count_non_numeric(value) -> int:
-    try:
-        float(value)
-        return 0
-    except ValueError:
-        return 1
+def _data_columns(csv_file: 'models.CSVFile') -> List[int]:
+    from viime.models import TABLE_COLUMN_TYPES
 
+    return [
+        column['column_index'] for column in csv_file.columns
+        if column['column_type'] == TABLE_COLUMN_TYPES.DATA
+    ]
 
-def get_warnings(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
-    warnings = get_non_numeric_warnings(csv_file)
-    warnings.extend(get_missing_percent_warnings(csv_file))
-    warnings.extend(get_low_variance_warnings(csv_file))
+
+def parse_measurements(csv_file: 'models.CSVFile',
+                       column_indices: Optional[List[int]] = None) -> MeasurementBlock:
+    """Parse the raw measurement table, or only the given columns of it, once for all checks."""
+    from viime.models import TABLE_COLUMN_TYPES, TABLE_ROW_TYPES
+
+    if column_indices is None:
+        column_indices = _data_columns(csv_file)
+        table = csv_file.raw_measurement_table
+        headers = csv_file.filter_table_by_types(
+            TABLE_ROW_TYPES.INDEX, TABLE_COLUMN_TYPES.DATA).iloc[0, :]
+    else:
+        table = csv_file.raw_measurement_columns(column_indices)
+        headers = csv_file.raw_header_cells(column_indices)
+    values = to_numeric(table)
+    missing = table.isna().to_numpy(dtype=bool)
+    return MeasurementBlock(values, missing, np.isnan(values) & ~missing,
+                            [None if v != v else v for v in headers.tolist()],
+                            _data_rows(csv_file), column_indices)
+
+
+def _group_codes(csv_file: 'models.CSVFile') -> np.ndarray:
+    groups = csv_file.groups
+    if groups is None:
+        return np.zeros(len(_data_rows(csv_file)), dtype=np.int64)
+    return factorize(groups.iloc[:, 0])[0]
+
+
+def summarize(block: MeasurementBlock, group_codes: np.ndarray) -> ValidationState:
+    """Compute the statistics the data checks are derived from."""
+    nans = np.isnan(block.values)
+    members = (group_codes == np.arange(group_codes.max(initial=-1) + 1)[:, None]) \
+        .astype(np.float64)
+    return ValidationState(
+        row_indices=block.row_indices,
+        row_nans=nans.sum(axis=1),
+        column_indices=block.column_indices,
+        column_nans=nans.sum(axis=0),
+        headers=block.headers,
+        non_numeric=block.non_numeric.sum(axis=0),
+        missing=np.rint(members @ block.missing).astype(np.int64),
+        variance=nanvar(np.ascontiguousarray(block.values.T)),
+        group_sizes=members.sum(axis=1).astype(np.int64)
+    )
+
+
+def _state_key(csv_file: 'models.CSVFile') -> Dict[str, Any]:
+    # the column statistics only depend on the data, the header, the data rows and the groups
+    return {
+        'fingerprint': csv_file.fingerprint,
+        'header_row_index': csv_file.header_row_index,
+        'rows': _data_rows(csv_file),
+        'group_column_index': csv_file.group_column_index
+    }
+
+
+def _dump_state(csv_file: 'models.CSVFile', state: ValidationState) -> Dict[str, Any]:
+    data = _state_key(csv_file)
+    data.update({
+        'row_nans': state.row_nans.tolist(),
+        'columns': list(state.column_indices),
+        'column_nans': state.column_nans.tolist(),
+        'headers': list(state.headers),
+        'non_numeric': state.non_numeric.tolist(),
+        'missing': state.missing.tolist(),
+        'variance': [None if v != v else v for v in state.variance.tolist()],
+        'group_sizes': state.group_sizes.tolist()
+    })
+    return data
+
+
+def _load_state(csv_file: 'models.CSVFile') -> Optional[ValidationState]:
+    data = csv_file.validation_json
+    if not data or any(data.get(k) != v for k, v in _state_key(csv_file).items()):
+        return None
+    columns = len(data['columns'])
+    return ValidationState(
+        row_indices=data['rows'],
+        row_nans=np.array(data['row_nans'], dtype=np.int64),
+        column_indices=data['columns'],
+        column_nans=np.array(data['column_nans'], dtype=np.int64),
+        headers=data['headers'],
+        non_numeric=np.array(data['non_numeric'], dtype=np.int64),
+        missing=np.array(data['missing'], dtype=np.int64).reshape(
+            len(data['group_sizes']), columns),
+        variance=np.array(data['variance'], dtype=np.float64),
+        group_sizes=np.array(data['group_sizes'], dtype=np.int64)
+    )
+
+
+def _take_columns(state: ValidationState, indices: np.ndarray) -> ValidationState:
+    return state._replace(
+        column_indices=[state.column_indices[i] for i in indices],
+        column_nans=state.column_nans[indices],
+        headers=[state.headers[i] for i in indices],
+        non_numeric=state.non_numeric[indices],
+        missing=state.missing[:, indices],
+        variance=state.variance[indices]
+    )
+
+
+def _join_columns(state: ValidationState, other: ValidationState) -> ValidationState:
+    """Join the statistics of distinct columns of the same rows."""
+    joined = state._replace(
+        row_nans=state.row_nans + other.row_nans,
+        column_indices=list(state.column_indices) + list(other.column_indices),
+        column_nans=np.concatenate([state.column_nans, other.column_nans]),
+        headers=list(state.headers) + list(other.headers),
+        non_numeric=np.concatenate([state.non_numeric, other.non_numeric]),
+        missing=np.hstack([state.missing, other.missing]),
+        variance=np.concatenate([state.variance, other.variance])
+    )
+    return _take_columns(joined, np.argsort(joined.column_indices, kind='stable'))
+
+
+def validation_state(csv_file: 'models.CSVFile') -> ValidationState:
+    """
+    Return the statistics the data checks are derived from.
+
+    The persisted state of the csv file is brought up to date by parsing only
+    the columns that were added to or removed from the measurements since it
+    was computed.  Changing the data rows or the group column requires parsing
+    the whole measurement table.
+    """
+    state = _load_state(csv_file)
+    codes = _group_codes(csv_file)
+    if state is None:
+        return summarize(parse_measurements(csv_file), codes)
+
+    columns = _data_columns(csv_file)
+    added = sorted(set(columns) - set(state.column_indices))
+    removed = sorted(set(state.column_indices) - set(columns))
+
+    if removed:
+        row_nans = summarize(parse_measurements(csv_file, removed), codes).row_nans
+        state = _take_columns(state, np.nonzero(np.isin(state.column_indices, columns))[0]) \
+            ._replace(row_nans=state.row_nans - row_nans)
+    if added:
+        state = _join_columns(state, summarize(parse_measurements(csv_file, added), codes))
+    return state
+
+
+def update_validation_state(csv_file: 'models.CSVFile') -> Optional[ValidationState]:
+    """Persist the up to date validation state with the csv file (see ``validation_state``)."""
+    if get_missing_index_errors(csv_file):
+        return None
+    state = validation_state(csv_file)
+    data = _dump_state(csv_file, state)
+    if data != csv_file.validation_json:
+        csv_file.validation_json = data
+    return state
+
+
+def _non_numeric_axis_errors(nans: np.ndarray, size: int) -> List[int]:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nonzero(nans / size > MAX_NAN_THRESHOLD)[0].tolist()
+
+
+def get_non_numeric_errors(csv_file: 'models.CSVFile',
+                           state: Optional[ValidationState] = None) -> List[ValidationTuple]:
+    if state is None:
+        state = validation_state(csv_file)
+    errors: List[ValidationTuple] = []
+
+    for index in _non_numeric_axis_errors(state.row_nans, len(state.column_indices)):
+        errors.append(
+            NonNumericRow(row_index=state.row_indices[index],
+                          data=f'Contains {state.row_nans[index]} non-numeric values')
+        )
+
+    for index in _non_numeric_axis_errors(state.column_nans, len(state.row_indices)):
+        errors.append(
+            NonNumericColumn(column_index=state.column_indices[index],
+                             data=f'Contains {state.column_nans[index]} non-numeric values')
+        )
+    return errors
+
+
+def get_warnings(csv_file: 'models.CSVFile',
+                 state: Optional[ValidationState] = None) -> List[ValidationTuple]:
+    if state is None:
+        state = validation_state(csv_file)
+    warnings = get_non_numeric_warnings(csv_file, state)
+    warnings.extend(get_missing_percent_warnings(csv_file, state))
+    warnings.extend(get_low_variance_warnings(csv_file, state))
     return warnings
 
 
-def get_non_numeric_warnings(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
+def get_non_numeric_warnings(csv_file: 'models.CSVFile',
+                             state: Optional[ValidationState] = None) -> List[ValidationTuple]:
+    if state is None:
+        state = validation_state(csv_file)
     warnings: List[ValidationTuple] = []
-    non_numeric_count = int(csv_file.raw_measurement_table.applymap(_count_non_numeric).sum().sum())
+    non_numeric_count = int(state.non_numeric.sum())
     if non_numeric_count > 0:
         # maybe return actual indices if useful to the client
         warnings.append(
@@ -273,44 +469,40 @@ def get_non_numeric_warnings(csv_file: 'models.CSVFile') -> List[ValidationTuple
     return warnings
 
 
-def get_missing_percent_warnings(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
-    table = csv_file.raw_measurement_table
-    groups = csv_file.groups
-
-    q = (table != table).join(groups).groupby(groups.columns[0])
-    total = q.count()
-    missing = q.agg('sum')
-    percent_missing = missing / total
-    over_threshold = (percent_missing > GROUP_MISSING_THRESHOLD).all()
+def get_missing_percent_warnings(csv_file: 'models.CSVFile',
+                                 state: Optional[ValidationState] = None) -> List[ValidationTuple]:
+    if state is None:
+        state = validation_state(csv_file)
+    # the fraction of missing values of every group (row) and column
+    percent_missing = state.missing / state.group_sizes[:, None]
+    over_threshold = (percent_missing > GROUP_MISSING_THRESHOLD).all(axis=0)
 
     warnings: List[ValidationTuple] = []
-    for column_name, warn in over_threshold.items():
-        if not warn:
-            continue
-        column = csv_file.get_column_by_name(column_name)
+    for index in np.nonzero(over_threshold)[0]:
         warnings.append(
             MissingData(
                 context='column',
-                column_index=column['column_index'],
+                column_index=state.column_indices[index],
                 data=f'All groups exceed {int(GROUP_MISSING_THRESHOLD * 100)}% missing data'
             )
         )
     return warnings
 
 
-def get_low_variance_warnings(csv_file: 'models.CSVFile') -> List[ValidationTuple]:
-    table = csv_file.raw_measurement_table
+def get_low_variance_warnings(csv_file: 'models.CSVFile',
+                              state: Optional[ValidationState] = None) -> List[ValidationTuple]:
+    if state is None:
+        state = validation_state(csv_file)
     warnings: List[ValidationTuple] = []
 
-    for column_name, value in table.var().items():
-        if value != value or value > LOW_VARIANCE_THRESHOLD:
-            continue
-
-        column = csv_file.get_column_by_name(column_name)
+    # columns with non-numeric data are not checked
+    variance = np.where(state.non_numeric > 0, np.nan, state.variance)
+    for index in np.nonzero(variance <= LOW_VARIANCE_THRESHOLD)[0]:
+        value = variance[index]
         warnings.append(
             LowVariance(
                 context='column',
-                column_index=column['column_index'],
+                column_index=state.column_indices[index],
                 data=f'Low column data variance ({value:.2e})'
             )
         )
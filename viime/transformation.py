@@ -3,37 +3,46 @@ from typing import Optional
 import numpy as np
 import pandas as pd
 
+from viime.cache import cached
+
 TRANSFORMATION_METHODS = {'log10', 'squareroot', 'cuberoot', 'log2'}
 
 
+@cached
 def transform(method: Optional[str], table: pd.DataFrame) -> pd.DataFrame:
-    table = table.astype(np.float64)
-    if method is None:
-        table = table
-    elif method == 'log10':
-        table = log10(table)
-    elif method == 'log2':
-        table = log2(table)
-    elif method == 'squareroot':
-        table = squareroot(table)
-    elif method == 'cuberoot':
-        table = cuberoot(table)
-    else:
-        raise Exception('Unknown transform method')
-    return table
-
-
-def log10(table: pd.DataFrame, min=1e-8):
-    return np.log10(table.clip(lower=min))
-
-
-def log2(table: pd.DataFrame, min=1e-8):
-    return np.log2(table.clip(lower=min))
-
-
-def squareroot(table: pd.DataFrame):
-    return np.sqrt(table.clip(lower=0))
-
-
-def cuberoot(table: pd.DataFrame):
-    return np.power(table.clip(lower=0), 1.0 / 3.0)
+    # all methods work in place on a single float64 copy of the table
+    values = table.to_numpy(dtype=np.float64, copy=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method is None:
+            pass
+        elif method == 'log10':
+            log10(values)
+        elif method == 'log2':
+            log2(values)
+        elif method == 'squareroot':
+            squareroot(values)
+        elif method == 'cuberoot':
+            cuberoot(values)
+        else:
+            raise Exception('Unknown transform method')
+    return pd.DataFrame(values, index=table.index, columns=table.columns)
+
+
+def log10(values: np.ndarray, min=1e-8) -> np.ndarray:
+    np.maximum(values, min, out=values)
+    return np.log10(values, out=values)
+
+
+def log2(values: np.ndarray, min=1e-8) -> np.ndarray:
+    np.maximum(values, min, out=values)
+    return np.log2(values, out=values)
+
+
+def squareroot(values: np.ndarray) -> np.ndarray:
+    np.maximum(values, 0, out=values)
+    return np.sqrt(values, out=values)
+
+
+def cuberoot(values: np.ndarray) -> np.ndarray:
+    np.maximum(values, 0, out=values)
+    return np.power(values, 1.0 / 3.0, out=values)
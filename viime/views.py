@@ -2,21 +2,23 @@ from functools import wraps
 from io import BytesIO
 import json
 from pathlib import PurePath
-from typing import Any, Callable, cast, Dict, List, Optional
+from typing import Any, Callable, cast, Dict, Iterable, List, Optional
+from urllib.parse import urlencode
 
-from flask import Blueprint, current_app, jsonify, request, Response, send_file
+from flask import Blueprint, current_app, jsonify, request, Response, send_file, url_for
 from marshmallow import fields, validate, ValidationError
 from numpy import sqrt
 import pandas
+from sqlalchemy.orm import undefer
 from webargs.flaskparser import use_kwargs
 from werkzeug.datastructures import FileStorage
 
-from viime import opencpu, samples
+from viime import jobs, opencpu, samples
 from viime.analyses import anova_test, factor_analysis, hierarchical_clustering,\
     oplsda, pairwise_correlation, plsda, roc_analysis, wilcoxon_test
 from viime.imputation import IMPUTE_MCAR_METHODS, IMPUTE_MNAR_METHODS
 from viime.models import AXIS_NAME_TYPES, clean, CSVFile, CSVFileSchema, db, \
-    GroupLevelSchema, ModifyLabelListSchema, \
+    GroupLevelSchema, Job, JOB_STATUSES, JobSchema, ModifyLabelListSchema, \
     TABLE_COLUMN_TYPES, TABLE_ROW_TYPES, \
     TableColumnSchema, TableRowSchema, \
     ValidatedMetaboliteTable, ValidatedMetaboliteTableSchema
@@ -24,10 +26,12 @@ from viime.normalization import validate_normalization_method
 from viime.plot import pca
 from viime.scaling import SCALING_METHODS
 from viime.table_merge import merge_methods
-from viime.table_validation import get_fatal_index_errors, ValidationSchema
+from viime.table_validation import get_fatal_index_errors, update_validation_state, \
+    ValidationSchema
 from viime.transformation import TRANSFORMATION_METHODS
 
 csv_file_schema = CSVFileSchema()
+job_schema = JobSchema()
 modify_label_list_schema = ModifyLabelListSchema()
 table_column_schema = TableColumnSchema()
 table_row_schema = TableRowSchema()
@@ -36,21 +40,81 @@ validated_metabolite_table_schema = ValidatedMetaboliteTableSchema()
 
 csv_bp = Blueprint('csv', __name__)
 
+# properties of the validated table that get_csv_file adds to the csv file
+VALIDATED_TABLE_FIELDS = ['normalization', 'normalization_argument', 'scaling',
+                          'imputation_info', 'transformation']
 
-def load_validated_csv_file(func):
+
+def load_validated_csv_file(func=None, *, tables: Iterable[str] = ()):
+    """Load the validated table, eagerly fetching only the given tables."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapped(csv_id: str, *arg, **kwargs):
+            csv_file = ValidatedMetaboliteTable.query_tables(*tables) \
+                .filter_by(csv_file_id=csv_id) \
+                .first_or_404()
+            return func(csv_file, *arg, **kwargs)
+
+        return wrapped
+
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+def queueable(func):
+    """
+    Compute the route in a worker process when it is called with ``?async=1``.
+
+    Instead of the response, a 202 with the job is returned.  Its result is
+    available from ``get_job_result`` once a worker has run it.
+    """
 
     @wraps(func)
-    def wrapped(csv_id: str, *arg, **kwargs):
-        csv_file = ValidatedMetaboliteTable.query \
-            .filter_by(csv_file_id=csv_id) \
-            .first_or_404()
-        return func(csv_file, *arg, **kwargs)
+    def wrapped(csv_id: str, *args, **kwargs):
+        if request.args.get('async') not in ('1', 'true'):
+            return func(csv_id, *args, **kwargs)
+
+        CSVFile.query.get_or_404(csv_id)
+        query_string = urlencode(
+            [(k, v) for k, v in request.args.items(multi=True) if k != 'async'])
+        job = jobs.enqueue(csv_id, cast(str, request.endpoint), request.path, query_string)
+        resp = jsonify(_serialize_job(job))
+        resp.headers['Location'] = url_for('csv.get_job', job_id=job.id)
+        return resp, 202
 
     return wrapped
 
 
-def _serialize_csv_file(csv_file: CSVFile) -> Dict[str, Any]:
-    csv_file_schema = CSVFileSchema()
+def _field_selection(name: str) -> List[str]:
+    return [field for arg in request.args.getlist(name) for field in arg.split(',') if field]
+
+
+def _selected_fields(names: Iterable[str]) -> List[str]:
+    """Return the given field names that are selected by the request."""
+    only = _field_selection('fields')
+    exclude = _field_selection('exclude')
+    return [name for name in names if (not only or name in only) and name not in exclude]
+
+
+def _serialize_csv_file(csv_file: CSVFile, extra_fields: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Serialize a csv file with the fields selected by the request.
+
+    The ``fields`` and ``exclude`` query parameters take comma separated field
+    names.  Properties that are not selected (e.g. the imputed
+    ``measurement_table``) are never computed.  ``extra_fields`` are added by
+    the route itself, they can be selected but are not serialized here.
+    """
+    extra_fields = set(extra_fields)
+    only = _field_selection('fields')
+    try:
+        csv_file_schema = CSVFileSchema(
+            only=[name for name in only if name not in extra_fields] if only else None,
+            exclude=[name for name in _field_selection('exclude') if name not in extra_fields])
+    except ValueError as e:
+        raise ValidationError(str(e))
     return csv_file_schema.dump(csv_file)
 
 
@@ -79,12 +143,15 @@ def upload_csv_file(file: FileStorage, meta: Dict[str, Any]):
         })
 
         db.session.add(csv_file)
+        db.session.flush()
+        serialized = _serialize_csv_file(csv_file)
+        # also commits the imputation result stored while serializing
         db.session.commit()
 
-        return jsonify(_serialize_csv_file(csv_file)), 201
+        return jsonify(serialized), 201
     except Exception:
-        if csv_file and csv_file.uri.is_file():
-            csv_file.uri.unlink()
+        if csv_file:
+            csv_file.delete_files()
         db.session.rollback()
         raise
 
@@ -134,8 +201,7 @@ def upload_excel_file(file: FileStorage, meta: Dict[str, Any]):
         return jsonify(serialized), 201
     except Exception:
         for f in db_files:
-            if f.uri.is_file():
-                f.uri.unlink()
+            f.delete_files()
         db.session.rollback()
         raise
 
@@ -149,7 +215,8 @@ def upload_excel_file(file: FileStorage, meta: Dict[str, Any]):
         fields.UUID(), validate=validate.Length(min=2))
 })
 def merge_csv_files(name: str, description: str, method: str, datasets: List[str]):
-    tables = [ValidatedMetaboliteTable.query.filter_by(csv_file_id=id).first_or_404()
+    tables = [ValidatedMetaboliteTable.query_tables('table')
+              .filter_by(csv_file_id=id).first_or_404()
               for id in datasets]
 
     merged, column_types, row_types = merge_methods[method](tables)
@@ -165,6 +232,7 @@ def merge_csv_files(name: str, description: str, method: str, datasets: List[str
         ))
 
         # update types afterwards since the default is auto generated
+        csv_file.bump_table_version()
 
         if row_types:
             # update the row types
@@ -182,6 +250,7 @@ def merge_csv_files(name: str, description: str, method: str, datasets: List[str
 
         # need to call it manually since we might have changed the column types
         csv_file.derive_group_levels()
+        update_validation_state(csv_file)
 
         db.session.add(csv_file)
         db.session.flush()
@@ -204,31 +273,35 @@ def create_csv_file():
     try:
         csv_file = csv_file_schema.load(request.json)
         db.session.add(csv_file)
+        db.session.flush()
+        serialized = _serialize_csv_file(csv_file)
+        # also commits the imputation result stored while serializing
         db.session.commit()
 
-        return jsonify(_serialize_csv_file(csv_file)), 201
+        return jsonify(serialized), 201
     except Exception:
-        if csv_file and csv_file.uri.is_file():
-            csv_file.uri.unlink()
+        if csv_file:
+            csv_file.delete_files()
         db.session.rollback()
         raise
 
 
 @csv_bp.route('/csv/<uuid:csv_id>', methods=['GET'])
+@queueable
 def get_csv_file(csv_id: str):
-    csv_file = _serialize_csv_file(CSVFile.query.get_or_404(csv_id))
+    csv_file = _serialize_csv_file(CSVFile.query.get_or_404(csv_id),
+                                   extra_fields=VALIDATED_TABLE_FIELDS)
 
     # inject properties from the validated table model (normalization, transformation, etc.)
-    validated_table = ValidatedMetaboliteTable.query.filter_by(csv_file_id=csv_id).first()
-    if validated_table is not None:
-        transformation_schema = ValidatedMetaboliteTableSchema(
-            only=['normalization', 'normalization_argument', 'scaling',
-                  'imputation_info',
-                  'scaling', 'transformation']
-        )
-        transformation = transformation_schema.dump(validated_table)
-        csv_file.update(transformation)
-
+    injected = _selected_fields(VALIDATED_TABLE_FIELDS)
+    if injected:
+        validated_table = ValidatedMetaboliteTable.query.filter_by(csv_file_id=csv_id).first()
+        if validated_table is not None:
+            transformation_schema = ValidatedMetaboliteTableSchema(only=injected)
+            csv_file.update(transformation_schema.dump(validated_table))
+
+    # keep the imputation result stored while serializing
+    db.session.commit()
     return jsonify(csv_file)
 
 
@@ -238,6 +311,17 @@ def get_csv_file_validation(csv_id: str):
     return jsonify(validation_schema.dump(csv_file.table_validation, many=True))
 
 
+@csv_bp.route('/csv/<uuid:csv_id>/stats', methods=['GET'])
+def get_csv_file_stats(csv_id: str):
+    csv_file = CSVFile.query.get_or_404(csv_id)
+    stats = csv_file.stats
+    if stats is None:
+        return jsonify({
+            'error': 'the table has no header row or key column'
+        }), 400
+    return jsonify(stats)
+
+
 @csv_bp.route('/csv/<uuid:csv_id>/metadata', methods=['PUT'])
 def set_csv_file_metadata(csv_id: str):
     try:
@@ -245,7 +329,7 @@ def set_csv_file_metadata(csv_id: str):
         csv_file.meta = request.json
         db.session.add(csv_file)
         db.session.commit()
-        return jsonify(csv_file_schema.dump(csv_file))
+        return jsonify(_serialize_csv_file(csv_file))
     except Exception:
         db.session.rollback()
         raise
@@ -261,7 +345,7 @@ def set_csv_file_name(csv_id: str, name: str):
         csv_file.name = name
         db.session.add(csv_file)
         db.session.commit()
-        return jsonify(csv_file_schema.dump(csv_file))
+        return jsonify(_serialize_csv_file(csv_file))
     except Exception:
         db.session.rollback()
         raise
@@ -277,7 +361,7 @@ def set_csv_file_description(csv_id: str, description: str):
         csv_file.description = description
         db.session.add(csv_file)
         db.session.commit()
-        return jsonify(csv_file_schema.dump(csv_file))
+        return jsonify(_serialize_csv_file(csv_file))
     except Exception:
         db.session.rollback()
         raise
@@ -294,7 +378,7 @@ def set_csv_file_group_levels(csv_id: str, group_levels: List[Dict]):
         csv_file.group_levels = group_levels
         db.session.add(csv_file)
         db.session.commit()
-        return jsonify(csv_file_schema.dump(csv_file))
+        return jsonify(_serialize_csv_file(csv_file))
     except Exception:
         db.session.rollback()
         raise
@@ -311,7 +395,7 @@ def set_csv_file_selected_columns(csv_id: str, columns: List[str]):
         db.session.add(csv_file)
         db.session.commit()
 
-        return jsonify(csv_file_schema.dump(csv_file))
+        return jsonify(_serialize_csv_file(csv_file))
     except Exception:
         db.session.rollback()
         raise
@@ -337,7 +421,7 @@ def delete_csv_file(csv_id: str):
         raise
 
     try:
-        csv_file.uri.unlink()
+        csv_file.delete_files()
     except Exception as e:
         current_app.logger.exception(e)
 
@@ -415,6 +499,9 @@ def batch_modify_label(csv_id: str):
                 csv_file.group_column_index = index
             column['column_type'] = label
 
+    csv_file.bump_table_version()
+    # only the relabeled rows and columns are parsed again
+    update_validation_state(csv_file)
     db.session.add(csv_file)
 
     try:
@@ -442,6 +529,7 @@ def _update_row_types(csv_file: CSVFile, row_types: Optional[List[Dict[str, Any]
     if row_types is None:
         return
 
+    csv_file.bump_table_version()
     count_target = len(row_types)
     count_current = len(csv_file.rows)
     # update the row types
@@ -469,6 +557,7 @@ def _update_column_types(csv_file: CSVFile, column_types: Optional[List[Dict[str
     if column_types is None:
         return
 
+    csv_file.bump_table_version()
     count_target = len(column_types)
     count_current = len(csv_file.columns)
 
@@ -508,7 +597,8 @@ def remerge_csv_file(csv_id: str, method: Optional[str]):
         if not method:
             method = csv_file.meta['merge_method']
 
-        tables = [ValidatedMetaboliteTable.query.filter_by(csv_file_id=id).first_or_404()
+        tables = [ValidatedMetaboliteTable.query_tables('table')
+                  .filter_by(csv_file_id=id).first_or_404()
                   for id in datasets]
 
         merged, column_types, row_types = merge_methods[cast(str, method)](tables)
@@ -520,6 +610,7 @@ def remerge_csv_file(csv_id: str, method: Optional[str]):
 
         # need to call it manually since we might have changed the column types
         csv_file.derive_group_levels()
+        update_validation_state(csv_file)
 
         meta = csv_file.meta.copy()
         meta.update({
@@ -530,7 +621,7 @@ def remerge_csv_file(csv_id: str, method: Optional[str]):
 
         db.session.add(csv_file)
         db.session.commit()
-        return jsonify(csv_file_schema.dump(csv_file))
+        return jsonify(_serialize_csv_file(csv_file))
     except Exception:
         db.session.rollback()
         raise
@@ -579,7 +670,7 @@ def serialize_validated_table(validated_table: ValidatedMetaboliteTable):
     'method': fields.Str(allow_none=True),
     'argument': fields.Str(allow_none=True)
 }, validate=validate_normalization_method)
-@load_validated_csv_file
+@load_validated_csv_file(tables=['table'])
 def set_normalization_method(validated_table: ValidatedMetaboliteTable, **kwargs):
     method = kwargs['method']
     argument = kwargs.get('argument', None)
@@ -597,7 +688,7 @@ def set_normalization_method(validated_table: ValidatedMetaboliteTable, **kwargs
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/transformation', methods=['PUT'])
-@load_validated_csv_file
+@load_validated_csv_file(tables=['table'])
 def set_transformation_method(validated_table: ValidatedMetaboliteTable):
     args = request.json
     method = args['method']
@@ -615,7 +706,7 @@ def set_transformation_method(validated_table: ValidatedMetaboliteTable):
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/scaling', methods=['PUT'])
-@load_validated_csv_file
+@load_validated_csv_file(tables=['table'])
 def set_scaling_method(validated_table: ValidatedMetaboliteTable):
     args = request.json
     method = args['method']
@@ -639,7 +730,7 @@ def set_scaling_method(validated_table: ValidatedMetaboliteTable):
                                                                   'selected', 'none'])),
     'rows': fields.Str(missing=None)
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['table'])
 def download_validated_csv_file(validated_table: ValidatedMetaboliteTable,
                                 transpose: bool,
                                 columns: str, rows: Optional[str]):
@@ -696,7 +787,7 @@ def _get_pca_data(validated_table: ValidatedMetaboliteTable):
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/plot/pca', methods=['GET'])
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_pca_plot(validated_table: ValidatedMetaboliteTable):
     return jsonify(_get_pca_data(validated_table)), 200
 
@@ -713,13 +804,13 @@ def _get_loadings_data(validated_table):
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/plot/loadings', methods=['GET'])
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_loadings_plot(validated_table: ValidatedMetaboliteTable):
     return jsonify(_get_loadings_data(validated_table)), 200
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/pca-overview', methods=['GET'])
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements'])
 def get_pca_overview(validated_table: ValidatedMetaboliteTable):
     png_content = opencpu.generate_image('/viime/R/pca_overview_plot',
                                          validated_table.measurements)
@@ -727,10 +818,11 @@ def get_pca_overview(validated_table: ValidatedMetaboliteTable):
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/plsda', methods=['GET'])
+@queueable
 @use_kwargs({
     'num_of_components': fields.Integer(required=False)
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_plsda(validated_table: ValidatedMetaboliteTable, num_of_components: Optional[int] = 3):
     measurements = validated_table.measurements
     groups = validated_table.groups
@@ -796,12 +888,13 @@ def get_plsda(validated_table: ValidatedMetaboliteTable, num_of_components: Opti
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/oplsda', methods=['GET'])
+@queueable
 @use_kwargs({
     'num_of_components': fields.Integer(required=True),
     'group1': fields.String(required=False),
     'group2': fields.String(required=False),
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_oplsda(validated_table: ValidatedMetaboliteTable,
                num_of_components: int = 3,
                group1: Optional[str] = None,
@@ -892,32 +985,35 @@ def _group_test(method: Callable, validated_table: ValidatedMetaboliteTable,
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/wilcoxon', methods=['GET'])
+@queueable
 @use_kwargs({
     'group_column': fields.Str(missing=None)
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_wilcoxon_test(validated_table: ValidatedMetaboliteTable,
                       group_column: Optional[str] = None):
     return _group_test(wilcoxon_test, validated_table, group_column)
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/anova', methods=['GET'])
+@queueable
 @use_kwargs({
     'group_column': fields.Str()
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_anova_test(validated_table: ValidatedMetaboliteTable, group_column: Optional[str] = None):
     return _group_test(anova_test, validated_table, group_column)
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/heatmap', methods=['GET'])
+@queueable
 @use_kwargs({
     'column': fields.Str(required=False, missing=None),
     'column_filter': fields.Str(required=False, missing=''),
     'row': fields.Str(required=False, missing=None),
     'row_filter': fields.Str(required=False, missing=''),
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_hierarchical_clustering_heatmap(validated_table: ValidatedMetaboliteTable,
                                         column: Optional[str], column_filter: str,
                                         row: Optional[str], row_filter: str):
@@ -950,12 +1046,13 @@ def get_hierarchical_clustering_heatmap(validated_table: ValidatedMetaboliteTabl
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/correlation', methods=['GET'])
+@queueable
 @use_kwargs({
     'min_correlation': fields.Float(missing=0.05, validate=validate.Range(0, 1)),
     'method': fields.Str(missing='pearson',
                          validate=validate.OneOf(['pearson', 'kendall', 'spearman']))
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements'])
 def get_correlation(validated_table: ValidatedMetaboliteTable,
                     min_correlation: float, method: str):
     table = validated_table.measurements
@@ -966,6 +1063,7 @@ def get_correlation(validated_table: ValidatedMetaboliteTable,
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/roc', methods=['GET'])
+@queueable
 @use_kwargs({
     'group1': fields.Str(required=True),
     'group2': fields.Str(required=True),
@@ -974,7 +1072,7 @@ def get_correlation(validated_table: ValidatedMetaboliteTable,
         'logistic_regression', 'random_forest'
     ]))
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_roc(validated_table: ValidatedMetaboliteTable,
             group1: str, group2: str, columns: str, method: str):
     measurements = validated_table.measurements
@@ -999,10 +1097,11 @@ def get_roc(validated_table: ValidatedMetaboliteTable,
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/factors', methods=['GET'])
+@queueable
 @use_kwargs({
     'threshold': fields.Float(missing=0.4)
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements'])
 def get_factors(validated_table: ValidatedMetaboliteTable,
                 threshold: Optional[float]):
     measurements = validated_table.measurements
@@ -1010,11 +1109,12 @@ def get_factors(validated_table: ValidatedMetaboliteTable,
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/plsda_factors', methods=['GET'])
+@queueable
 @use_kwargs({
     'num_of_components': fields.Integer(missing=3),
     'threshold': fields.Float(missing=0.4)
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_plsda_factors(validated_table: ValidatedMetaboliteTable,
                       num_of_components: Optional[int] = 3,
                       threshold: Optional[float] = 0.4):
@@ -1045,13 +1145,14 @@ def get_plsda_factors(validated_table: ValidatedMetaboliteTable,
 
 
 @csv_bp.route('/csv/<uuid:csv_id>/analyses/oplsda_factors', methods=['GET'])
+@queueable
 @use_kwargs({
     'num_of_components': fields.Integer(missing=3),
     'threshold': fields.Float(missing=0.4),
     'group1': fields.String(required=True),
     'group2': fields.String(required=True),
 })
-@load_validated_csv_file
+@load_validated_csv_file(tables=['measurements', 'groups'])
 def get_oplsda_factors(validated_table: ValidatedMetaboliteTable,
                        group1: str,
                        group2: str,
@@ -1083,6 +1184,34 @@ def get_oplsda_factors(validated_table: ValidatedMetaboliteTable,
     })
 
 
+#
+# job related
+#
+
+def _serialize_job(job: Job) -> Dict[str, Any]:
+    data = job_schema.dump(job)
+    data['result_url'] = url_for('csv.get_job_result', job_id=job.id)
+    return data
+
+
+@csv_bp.route('/jobs/<uuid:job_id>', methods=['GET'])
+def get_job(job_id: str):
+    return jsonify(_serialize_job(Job.query.get_or_404(job_id)))
+
+
+@csv_bp.route('/jobs/<uuid:job_id>/result', methods=['GET'])
+def get_job_result(job_id: str):
+    job = Job.query.options(undefer(Job.result_bytes)).get_or_404(job_id)
+    if job.result_status is not None:
+        return Response(job.result_bytes, status=job.result_status, mimetype=job.result_mimetype)
+    if job.status == JOB_STATUSES.FAILED:
+        return jsonify(_serialize_job(job)), 500
+
+    resp = jsonify(_serialize_job(job))
+    resp.headers['Location'] = url_for('csv.get_job', job_id=job.id)
+    return resp, 202
+
+
 #
 # sample related
 #
@@ -1100,8 +1229,7 @@ def _sample_import(files: List[CSVFile]):
         return jsonify(serialized), 201
     except Exception:
         for f in imported:
-            if f.uri.is_file():
-                f.uri.unlink()
+            f.delete_files()
         db.session.rollback()
         raise
 